@@ -0,0 +1,87 @@
+import os
+import glob
+import json
+import uuid
+from pathlib import Path
+from time import sleep, monotonic
+from datetime import datetime
+from LogWatcher import Inotify, IN_MOVED_TO
+
+IN_CLOSE_WRITE = 0x00000008
+IN_Q_OVERFLOW = 0x00004000
+
+class CommandQueue():
+    """Commands for PBRun as <kind>_<uuid>.cmd json files in data/cmd
+
+    put() writes a temp file and renames it, so a reader never sees half written
+    json. After watch() PBRun is woken by inotify as soon as a command arrives
+    and only scans the directory for kinds that really got a new file. Without
+    inotify every get() scans the directory like before.
+    """
+    KINDS = ("activate", "update_status")
+
+    def __init__(self, cmd_path: str):
+        self.cmd_path = cmd_path
+        self.inotify = None
+        # Commands written while PBRun was not running
+        self.pending = set(self.KINDS)
+
+    def watch(self):
+        try:
+            inotify = Inotify()
+            inotify.add_watch(self.cmd_path, IN_CLOSE_WRITE | IN_MOVED_TO)
+            self.inotify = inotify
+        except (OSError, AttributeError, TypeError) as e:
+            print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Warning: inotify not available, scanning {self.cmd_path} for commands ({e})')
+
+    def put(self, kind: str, cfg: dict):
+        unique = str(uuid.uuid4())
+        tmp = Path(f'{self.cmd_path}/.{kind}_{unique}.tmp')
+        with open(tmp, "w", encoding='utf-8') as f:
+            json.dump(cfg, f)
+        os.replace(tmp, Path(f'{self.cmd_path}/{kind}_{unique}.cmd'))
+
+    def wait(self, timeout: float):
+        """Wait up to timeout seconds, returns True as soon as new commands arrived"""
+        if not self.inotify:
+            if timeout > 0:
+                sleep(timeout)
+            return False
+        deadline = monotonic() + timeout
+        while not self.pending:
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                return False
+            for wd, mask, name in self.inotify.read(timeout):
+                if mask & IN_Q_OVERFLOW:
+                    self.pending.update(self.KINDS)
+                elif name.endswith(".cmd"):
+                    for kind in self.KINDS:
+                        if name.startswith(f'{kind}_'):
+                            self.pending.add(kind)
+        return True
+
+    def get(self, kind: str):
+        """Return the commands of kind in arrival order, duplicates coalesced, and remove their files"""
+        if self.inotify:
+            if kind not in self.pending:
+                return []
+            self.pending.discard(kind)
+        cfiles = []
+        for cfile in glob.glob(str(Path(f'{self.cmd_path}/{kind}_*.cmd'))):
+            try:
+                cfiles.append((os.stat(cfile).st_mtime_ns, cfile))
+            except FileNotFoundError:
+                pass
+        commands = []
+        for mtime, cfile in sorted(cfiles):
+            try:
+                with open(cfile, "r", encoding='utf-8') as f:
+                    cfg = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Error: Can not read {cfile} {e}')
+                cfg = None
+            Path(cfile).unlink(missing_ok=True)
+            if cfg is not None and cfg not in commands:
+                commands.append(cfg)
+        return commands
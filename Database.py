@@ -3,12 +3,75 @@ from datetime import datetime
 from User import Users, User
 from Exchange import Exchange
 from pbgui_func import PBGDIR
+from contextlib import contextmanager
+from queue import Queue, Empty
+import threading
 import sqlite3
 
+class ConnectionPool():
+    """One long-lived writer connection and a small pool of read-only connections"""
+    def __init__(self, db: Path, readers: int = 4, cached_statements: int = 128):
+        self.db = db
+        self.readers = readers
+        self.cached_statements = cached_statements
+        self._writer = None
+        self._write_lock = threading.Lock()
+        self._idle = Queue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def write(self):
+        with self._write_lock:
+            if not self._writer:
+                self._writer = sqlite3.connect(self.db, check_same_thread=False, cached_statements=self.cached_statements)
+            # commit on success, rollback on error
+            with self._writer:
+                yield self._writer
+
+    @contextmanager
+    def read(self):
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            conn = None
+            with self._lock:
+                if self._opened < self.readers:
+                    self._opened += 1
+                    conn = True
+            if conn:
+                try:
+                    conn = sqlite3.connect(f'{self.db.resolve().as_uri()}?mode=ro', uri=True, check_same_thread=False, cached_statements=self.cached_statements)
+                except sqlite3.Error:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
 class Database():
+    DAY = 24 * 60 * 60 * 1000
+    HISTORY_BATCH = 1000
+    _plans_checked = False
+    # Connection pools are shared by all Database objects of a process
+    _pools = {}
+    _pools_lock = threading.Lock()
+
     def __init__(self):
         self.db = Path(f'{PBGDIR}/data/pbgui.db')
+        with Database._pools_lock:
+            if str(self.db) not in Database._pools:
+                Database._pools[str(self.db)] = ConnectionPool(self.db)
+            self.pool = Database._pools[str(self.db)]
+        self._explain = None
         self.create_tables()
+        if not Database._plans_checked:
+            Database._plans_checked = True
+            self.check_query_plans()
 
     def create_tables(self):
         sql_statements = [ 
@@ -51,33 +114,136 @@ class Database():
                     timestamp INTEGER NOT NULL,
                     balance REAL NOT NULL,
                     user TEXT NOT NULL UNIQUE
+            );""",
+            # Dashboard queries filter history by user and timestamp range
+            """CREATE INDEX IF NOT EXISTS history_user_timestamp ON history (user, timestamp);""",
+            """CREATE INDEX IF NOT EXISTS history_user_symbol_timestamp ON history (user, symbol, timestamp);""",
+            # Used when 'ALL' users are selected
+            """CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);""",
+            # Daily PnL rollup of history, maintained by the history_daily_insert trigger
+            """CREATE TABLE IF NOT EXISTS history_daily (
+                    user TEXT NOT NULL,
+                    symbol TEXT NOT NULL,
+                    day INTEGER NOT NULL,
+                    sum REAL NOT NULL,
+                    positive REAL NOT NULL,
+                    negative REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (user, symbol, day)
+            );""",
+            """CREATE INDEX IF NOT EXISTS history_daily_user_day ON history_daily (user, day);""",
+            """CREATE INDEX IF NOT EXISTS history_daily_day ON history_daily (day);""",
+            # Resume point of Exchange.fetch_history per user and exchange
+            """CREATE TABLE IF NOT EXISTS history_cursor (
+                    user TEXT NOT NULL,
+                    exchange TEXT NOT NULL,
+                    timestamp INTEGER NOT NULL,
+                    PRIMARY KEY (user, exchange)
             );"""
             ]
         # create a database connection
         try:
-            with sqlite3.connect(self.db) as conn:
+            with self.pool.write() as conn:
+                # WAL lets the dashboard read while PBData is writing
+                conn.execute("PRAGMA journal_mode=WAL")
                 cursor = conn.cursor()
                 for statement in sql_statements:
                     cursor.execute(statement)
                 conn.commit()
+                self.create_rollup(conn)
         except sqlite3.Error as e:
             print(e)
 
-    def update_history(self, user: User):
-        history = self.fetch_history(user)
+    def create_rollup(self, conn: sqlite3.Connection):
+        # Create the trigger and backfill history_daily in one transaction, so it is done exactly once
+        trigger = f'''CREATE TRIGGER history_daily_insert AFTER INSERT ON history
+                BEGIN
+                    INSERT INTO history_daily(user,symbol,day,sum,positive,negative,count)
+                    VALUES(NEW.user, NEW.symbol, NEW.timestamp - NEW.timestamp % {self.DAY}, NEW.income,
+                        CASE WHEN NEW.income >= 0 THEN NEW.income ELSE 0 END,
+                        CASE WHEN NEW.income < 0 THEN NEW.income ELSE 0 END, 1)
+                    ON CONFLICT(user,symbol,day) DO UPDATE
+                    SET sum = sum + excluded.sum,
+                        positive = positive + excluded.positive,
+                        negative = negative + excluded.negative,
+                        count = count + 1;
+                END '''
+        backfill = f'''INSERT INTO history_daily(user,symbol,day,sum,positive,negative,count)
+                SELECT "user", "symbol", "timestamp" - "timestamp" % {self.DAY} AS day, SUM("income"),
+                    SUM(CASE WHEN "income" >= 0 THEN "income" ELSE 0 END),
+                    SUM(CASE WHEN "income" < 0 THEN "income" ELSE 0 END),
+                    COUNT(*)
+                FROM "history"
+                GROUP BY "user", "symbol", day '''
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
         try:
-            with sqlite3.connect(self.db) as conn:
-                for line in history:
-                    income = [
-                        line['symbol'],
-                        line['timestamp'],
-                        line['income'],
-                        line['uniqueid'],
-                        user.name
-                    ]
-                    self.add_history(conn, income)
-        except sqlite3.Error as e:
-            print(e)
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'history_daily_insert'")
+            if not cur.fetchall():
+                print("Create history_daily rollup")
+                cur.execute("DELETE FROM history_daily")
+                cur.execute(backfill)
+                cur.execute(trigger)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+    def use_rollup(self, start: int, end: int):
+        # history_daily has UTC day buckets, it can only answer ranges aligned to them.
+        # Days are UTC like the dates of select_pnl and select_ppl, the local midnights
+        # of the Dashboard periods are only aligned on UTC hosts, elsewhere the raw
+        # history is read except for ALL_TIME.
+        start = int(start)
+        end = int(end)
+        today = int(datetime.now().timestamp() * 1000)
+        today -= today % self.DAY
+        return start % self.DAY == 0 and (end % self.DAY == 0 or end >= today)
+
+    def range_where(self, rollup: bool, end: int):
+        # Ranges are [start, end) in both tables, a row at midnight belongs to the day it starts
+        if not rollup:
+            return '"timestamp" >= ? AND "timestamp" < ?'
+        # A range up to now includes the bucket of today
+        return f'"day" >= ? AND "day" {"<" if int(end) % self.DAY == 0 else "<="} ?'
+
+    def update_history(self, user: User, workers: int = 1):
+        exchange = Exchange(user.exchange, user)
+        # Rows are written in batches while pages are downloaded, together with the last safe cursor
+        incomes = []
+        fetched = 0
+        added = 0
+        for page, cursor in self.fetch_history(user, exchange, workers):
+            for line in page:
+                income = [
+                    line['symbol'],
+                    line['timestamp'],
+                    line['income'],
+                    line['uniqueid'],
+                    user.name
+                ]
+                # A single invalid row would roll back the whole batch
+                if None in income:
+                    print("Skipping invalid history", income)
+                    continue
+                incomes.append(income)
+            if len(incomes) >= self.HISTORY_BATCH or cursor:
+                fetched += len(incomes)
+                added += self.write_history(user, incomes, cursor)
+                incomes = []
+        if incomes:
+            fetched += len(incomes)
+            added += self.write_history(user, incomes)
+        if fetched:
+            print(f"Added {added} of {fetched} history rows for {user.name}")
+
+    def write_history(self, user: User, incomes: list, cursor: int = None):
+        # Errors are not caught here, the cursor must never move past rows that were not stored
+        with self.pool.write() as conn:
+            added = self.add_history(conn, incomes) if incomes else 0
+            if cursor:
+                self.update_cursor(conn, [user.name, user.exchange, cursor])
+            return added
     
     def update_positions(self, user: User):
         positions_db = self.fetch_positions(user)
@@ -91,34 +257,40 @@ class Database():
         symbols_db = []
         for position in positions_db:
             symbols_db.append(position[1])
+        # Remove positions that are not in the exchange
+        remove = []
+        for position in positions_db:
+            if position[1] not in symbols:
+                print(f"Removing {position[1]}")
+                remove.append(position[0])
+        # Update positions
+        update = []
+        add = []
+        for position in positions:
+            pos = [
+                position['timestamp'],
+                position['contracts'] * position['contractSize'],
+                position['unrealizedPnl'],
+                position['entryPrice'],
+                position['symbol'][0:-5].replace("/", "").replace("-", ""),
+                user.name
+            ]
+            if pos[1] == 0:
+                continue
+            # Use current timestamp if timestamp is None
+            if not pos[0]:
+                pos[0] = int(datetime.now().timestamp() * 1000)
+            if pos[4] in symbols_db:
+                print(f"Updating {pos[4]}")
+                update.append(pos)
+            else:
+                print(f"Adding {pos[4]}")
+                add.append(pos)
         try:
-            with sqlite3.connect(self.db) as conn:
-                # Remove positions that are not in the exchange
-                for position in positions_db:
-                    if position[1] not in symbols:
-                        print(f"Removing {position[1]}")
-                        self.remove_position(conn, position[0])
-                # Update positions
-                for position in positions:
-                    pos = [
-                        position['timestamp'],
-                        position['contracts'] * position['contractSize'],
-                        position['unrealizedPnl'],
-                        position['entryPrice'],
-                        position['symbol'][0:-5].replace("/", "").replace("-", ""),
-                        user.name
-                    ]
-                    if pos[1] == 0:
-                        continue
-                    # Use current timestamp if timestamp is None
-                    if not pos[0]:
-                        pos[0] = int(datetime.now().timestamp() * 1000)
-                    if pos[4] in symbols_db:
-                        print(f"Updating {pos[4]}")
-                        self.update_position(conn, pos)
-                    else:
-                        print(f"Adding {pos[4]}")
-                        self.add_position(conn, pos)
+            with self.pool.write() as conn:
+                self.remove_position(conn, remove)
+                self.update_position(conn, update)
+                self.add_position(conn, add)
         except sqlite3.Error as e:
             print(e)
     
@@ -137,30 +309,33 @@ class Database():
         ids = []
         for order in all_orders:
             ids.append(order['id'])
+        # Remove orders that are not in the exchange
+        remove = []
+        for order in orders_db:
+            if order[6] not in ids:
+                print(f"Removing {order[6]}")
+                remove.append(order[0])
+        # Update orders
+        upsert = []
+        for order in all_orders:
+            ord = [
+                order['timestamp'],
+                order['amount'],
+                order['price'],
+                order['side'],
+                order['id'],
+                order['symbol'][0:-5].replace("/", "").replace("-", ""),
+                user.name
+            ]
+            if ord[4] in ids_db:
+                print(f"Updating {ord[4]}")
+            else:
+                print(f"Adding {ord[4]}")
+            upsert.append(ord)
         try:
-            with sqlite3.connect(self.db) as conn:
-                # Remove orders that are not in the exchange
-                for order in orders_db:
-                    if order[6] not in ids:
-                        print(f"Removing {order[6]}")
-                        self.remove_order(conn, order[0])
-                # Update orders
-                for order in all_orders:
-                    ord = [
-                        order['timestamp'],
-                        order['amount'],
-                        order['price'],
-                        order['side'],
-                        order['id'],
-                        order['symbol'][0:-5].replace("/", "").replace("-", ""),
-                        user.name
-                    ]
-                    if ord[4] in ids_db:
-                        print(f"Updating {ord[4]}")
-                        self.update_order(conn, ord)
-                    else:
-                        print(f"Adding {ord[4]}")
-                        self.add_order(conn, ord)
+            with self.pool.write() as conn:
+                self.remove_order(conn, remove)
+                self.add_order(conn, upsert)
         except sqlite3.Error as e:
             print(e)
 
@@ -187,34 +362,40 @@ class Database():
         for symbol_ccxt in prices:
             symbol = symbol_ccxt[0:-5].replace("/", "").replace("-", "")
             symbols.append(symbol)
+        # Remove symbols that are not in the exchange
+        remove = []
+        for symbol in symbols_db:
+            if symbol not in symbols:
+                print(f"Removing {symbol}")
+                remove.append([symbol, user.name])
+        # Update prices
+        update = []
+        add = []
+        for symbol in symbols:
+            if symbol[-4:] == "USDT":
+                symbol_ccxt = f'{symbol[0:-4]}/USDT:USDT'
+            elif symbol[-4:] == "USDC":
+                symbol_ccxt = f'{symbol[0:-4]}/USDC:USDC'
+            timestamp = prices[symbol_ccxt]['timestamp']
+            if not timestamp:
+                timestamp = exchange.fetch_timestamp()
+            price = [
+                timestamp,
+                prices[symbol_ccxt]['last'],
+                symbol,
+                user.name
+            ]
+            if symbol in symbols_db:
+                print(f"Updating {symbol}")
+                update.append(price)
+            else:
+                print(f"Adding {symbol}")
+                add.append(price)
         try:
-            with sqlite3.connect(self.db) as conn:
-                # Remove symbols that are not in the exchange
-                for symbol in symbols_db:
-                    if symbol not in symbols:
-                        print(f"Removing {symbol}")
-                        self.remove_price(conn, symbol, user.name)
-                # Update prices
-                for symbol in symbols:
-                    if symbol[-4:] == "USDT":
-                        symbol_ccxt = f'{symbol[0:-4]}/USDT:USDT'
-                    elif symbol[-4:] == "USDC":
-                        symbol_ccxt = f'{symbol[0:-4]}/USDC:USDC'
-                    timestamp = prices[symbol_ccxt]['timestamp']
-                    if not timestamp:
-                        timestamp = exchange.fetch_timestamp()
-                    price = [
-                        timestamp,
-                        prices[symbol_ccxt]['last'],
-                        symbol,
-                        user.name
-                    ]
-                    if symbol in symbols_db:
-                        print(f"Updating {symbol}")
-                        self.update_price(conn, price)
-                    else:
-                        print(f"Adding {symbol}")
-                        self.add_price(conn, price)
+            with self.pool.write() as conn:
+                self.remove_price(conn, remove)
+                self.update_price(conn, update)
+                self.add_price(conn, add)
         except sqlite3.Error as e:
             print(e)
 
@@ -223,7 +404,7 @@ class Database():
         market_type = "swap"
         balance = exchange.fetch_balance(market_type)
         try:
-            with sqlite3.connect(self.db) as conn:
+            with self.pool.write() as conn:
                 balance_list = [
                     int(datetime.now().timestamp() * 1000),
                     balance,
@@ -234,238 +415,200 @@ class Database():
         except sqlite3.Error as e:
             print(e)
 
+    # The bulk helpers below only execute, the caller commits once per update_* call
     def add_history(self, conn: sqlite3.Connection, history: list):
         sql = '''INSERT INTO history(symbol,timestamp,income,uniqueid,user)
-                VALUES(?,?,?,?,?) '''
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, history)
-            conn.commit()
-        except sqlite3.Error as e:
-            print(e, history)
+                VALUES(?,?,?,?,?)
+                ON CONFLICT(uniqueid) DO NOTHING '''
+        cur = conn.cursor()
+        cur.executemany(sql, history)
+        return cur.rowcount
     
-    def add_position(self, conn: sqlite3.Connection, position: list):
+    def add_position(self, conn: sqlite3.Connection, positions: list):
         sql = '''INSERT INTO position(timestamp,psize,upnl,entry,symbol,user)
                 VALUES(?,?,?,?,?,?) '''
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, position)
-            conn.commit()
-        except sqlite3.Error as e:
-            print(e, position)
-        return cur.lastrowid
+        conn.executemany(sql, positions)
 
-    def add_order(self, conn: sqlite3.Connection, order: list):
+    def add_order(self, conn: sqlite3.Connection, orders: list):
         sql = '''INSERT INTO orders(timestamp,amount,price,side,uniqueid,symbol,user)
-                VALUES(?,?,?,?,?,?,?) '''
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, order)
-            conn.commit()
-        except sqlite3.Error as e:
-            print(e, order)
+                VALUES(?,?,?,?,?,?,?)
+                ON CONFLICT(uniqueid) DO UPDATE
+                SET timestamp = excluded.timestamp,
+                    amount = excluded.amount,
+                    price = excluded.price,
+                    side = excluded.side '''
+        conn.executemany(sql, orders)
 
-    def add_price(self, conn: sqlite3.Connection, price: list):
+    def add_price(self, conn: sqlite3.Connection, prices: list):
         sql = '''INSERT INTO prices(timestamp,price,symbol,user)
                 VALUES(?,?,?,?) '''
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, price)
-            conn.commit()
-        except sqlite3.Error as e:
-            print(e, price)
+        conn.executemany(sql, prices)
 
-    def remove_position(self, conn: sqlite3.Connection, id: int):
+    def remove_position(self, conn: sqlite3.Connection, ids: list):
         sql = '''DELETE FROM position WHERE id = ? '''
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, [id])
-            conn.commit()
-        except sqlite3.Error as e:
-            print(e)
+        conn.executemany(sql, [[id] for id in ids])
     
-    def remove_order(self, conn: sqlite3.Connection, id: int):
+    def remove_order(self, conn: sqlite3.Connection, ids: list):
         sql = '''DELETE FROM orders WHERE id = ? '''
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, [id])
-            conn.commit()
-        except sqlite3.Error as e:
-            print(e)
+        conn.executemany(sql, [[id] for id in ids])
 
-    def remove_price(self, conn: sqlite3.Connection, symbol: str, user: str):
+    def remove_price(self, conn: sqlite3.Connection, prices: list):
         sql = '''DELETE FROM prices WHERE symbol = ? AND user = ? '''
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, [symbol, user])
-            conn.commit()
-        except sqlite3.Error as e:
-            print(e)
+        conn.executemany(sql, prices)
 
-    def update_position(self, conn: sqlite3.Connection, position: list):
+    def update_position(self, conn: sqlite3.Connection, positions: list):
         sql = '''UPDATE position
                 SET timestamp = ?,
                     psize = ?,
                     upnl = ?,
                     entry = ?
                 WHERE symbol = ? AND user = ? '''
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, position)
-            conn.commit()
-        except sqlite3.Error as e:
-            print(e, position)
+        conn.executemany(sql, positions)
 
-    def update_order(self, conn: sqlite3.Connection, order: list):
-        sql = '''UPDATE orders
-                SET timestamp = ?,
-                    amount = ?,
-                    price = ?,
-                    side = ?
-                WHERE uniqueid = ? AND symbol = ? AND user = ? '''
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, order)
-            conn.commit()
-        except sqlite3.Error as e:
-            print(e, order)
-
-    def update_price(self, conn: sqlite3.Connection, price: list):
+    def update_price(self, conn: sqlite3.Connection, prices: list):
         sql = '''UPDATE prices
                 SET timestamp = ?,
                     price = ?
                 WHERE symbol = ? AND user = ? '''
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, price)
-            conn.commit()
-        except sqlite3.Error as e:
-            print(e, price)
+        conn.executemany(sql, prices)
+
+    def update_cursor(self, conn: sqlite3.Connection, cursor: list):
+        sql = '''INSERT OR REPLACE INTO history_cursor(user,exchange,timestamp)
+                VALUES(?,?,?) '''
+        conn.execute(sql, cursor)
 
     def update_balance(self, conn: sqlite3.Connection, balance: list):
         sql = '''INSERT OR REPLACE INTO balances(timestamp,balance,user)
                 VALUES(?,?,?) '''
-        try:
-            cur = conn.cursor()
-            cur.execute(sql, balance)
-            conn.commit()
-        except sqlite3.Error as e:
-            print(e, balance)
-
-    def fetch_history(self, user: User):
-        exchange = Exchange(user.exchange, user)
-        return exchange.fetch_history(self.find_last_timestamp(user))
+        conn.execute(sql, balance)
 
-    def fetch_positions(self, user: User):
-        sql = '''SELECT * FROM "position"
-                WHERE "position"."user" = ? '''
+    def select(self, sql: str, sql_parameters: tuple):
+        if self._explain is not None:
+            sql = f'EXPLAIN QUERY PLAN {sql}'
         try:
-            with sqlite3.connect(self.db) as conn:
+            with self.pool.read() as conn:
                 cur = conn.cursor()
-                cur.execute(sql, [user.name])
+                cur.execute(sql, sql_parameters)
                 rows = cur.fetchall()
+                if self._explain is not None:
+                    self._explain.extend(rows)
                 return rows
         except sqlite3.Error as e:
             print(e)
 
+    def check_query_plans(self):
+        # Warn if a dashboard query on history does not use an index
+        now = int(datetime.now().timestamp() * 1000)
+        last_user = User()
+        last_user.name = 'user'
+        # start 0 is answered from history_daily, start 1 from the raw history
+        queries = {
+            "select_top": lambda user, start: self.select_top(user, start, now, 10),
+            "select_pnl": lambda user, start: self.select_pnl(user, start, now),
+            "select_ppl": lambda user, start: self.select_ppl(user, start, now, 'DAY'),
+            "select_income": lambda user, start: self.select_income(user, start, now),
+            "select_income_by_symbol": lambda user, start: self.select_income_by_symbol(user, start, now),
+            "find_last_timestamp": lambda user, start: self.find_last_timestamp(last_user),
+        }
+        for name, query in queries.items():
+            for user in [['ALL'], ['user']]:
+                for start in [0, 1]:
+                    self._explain = []
+                    try:
+                        query(user, start)
+                    finally:
+                        plan, self._explain = self._explain, None
+                    for row in plan:
+                        detail = row[-1]
+                        if detail.startswith("SCAN") and "history" in detail and "USING" not in detail:
+                            print(f'Warning: {name} users={user} start={start} does a full scan: {detail}')
+
+    def fetch_history(self, user: User, exchange: Exchange = None, workers: int = 1):
+        if not exchange:
+            exchange = Exchange(user.exchange, user)
+        # Resume from the saved cursor, databases from before the cursor start at the last history row
+        since = self.find_cursor(user)
+        if since is None:
+            since = self.find_last_timestamp(user)
+        return exchange.iter_history(since, workers)
+
+    def fetch_positions(self, user: User):
+        sql = '''SELECT * FROM "position"
+                WHERE "position"."user" = ? '''
+        return self.select(sql, [user.name])
+
     def fetch_orders(self, user: User):
         sql = '''SELECT * FROM "orders"
                 WHERE "orders"."user" = ? '''
-        try:
-            with sqlite3.connect(self.db) as conn:
-                cur = conn.cursor()
-                cur.execute(sql, [user.name])
-                rows = cur.fetchall()
-                return rows
-        except sqlite3.Error as e:
-            print(e)
+        return self.select(sql, [user.name])
     
     def fetch_orders_by_symbol(self, user: str, symbol: str):
         sql = '''SELECT * FROM "orders"
                 WHERE "orders"."user" = ?
                     AND "orders"."symbol" = ? '''
-        try:
-            with sqlite3.connect(self.db) as conn:
-                cur = conn.cursor()
-                cur.execute(sql, [user, symbol])
-                rows = cur.fetchall()
-                return rows
-        except sqlite3.Error as e:
-            print(e)
+        return self.select(sql, [user, symbol])
 
     def fetch_prices(self, user: User):
         sql = '''SELECT * FROM "prices"
                 WHERE "prices"."user" = ? '''
-        try:
-            with sqlite3.connect(self.db) as conn:
-                cur = conn.cursor()
-                cur.execute(sql, [user.name])
-                rows = cur.fetchall()
-                return rows
-        except sqlite3.Error as e:
-            print(e)
+        return self.select(sql, [user.name])
 
     def fetch_balances(self, user: list):
         sql = '''SELECT * FROM "balances"
                 WHERE "balances"."user" IN ({}) '''.format(','.join('?'*len(user)))
-        try:
-            with sqlite3.connect(self.db) as conn:
-                cur = conn.cursor()
-                cur.execute(sql, user)
-                rows = cur.fetchall()
-                return rows
-        except sqlite3.Error as e:
-            print(e)
+        return self.select(sql, user)
 
     def select_top(self, user: list, start: str, end: str, top: int):
+        if self.use_rollup(start, end):
+            table = "history_daily"
+            date = "strftime('%Y-%m-%d',MIN(\"day\") / 1000, 'unixepoch') as date"
+            income = '"sum"'
+            where = self.range_where(True, end)
+        else:
+            table = "history"
+            date = "strftime('%Y-%m-%d',\"timestamp\" / 1000, 'unixepoch') as date"
+            income = '"income"'
+            where = self.range_where(False, end)
         if 'ALL' in user:
-            sql = '''SELECT strftime('%Y-%m-%d',"timestamp" / 1000, 'unixepoch') as date, "history"."symbol" AS symbol, SUM("history"."income") AS sum FROM "history"
-                    WHERE "history"."timestamp" >= ?
-                        AND "history"."timestamp" <= ?
-                    GROUP BY "history"."symbol"
-                    ORDER BY "sum" DESC, "history"."symbol"
+            sql = f'''SELECT {date}, "symbol" AS symbol, SUM({income}) AS sum FROM "{table}"
+                    WHERE {where}
+                    GROUP BY "symbol"
+                    ORDER BY "sum" DESC, "symbol"
                     LIMIT ? '''
             sql_parameters = (start, end, top)
         else:
-            sql = '''SELECT strftime('%Y-%m-%d',"timestamp" / 1000, 'unixepoch') as date, "history"."symbol" AS symbol, SUM("history"."income") AS sum FROM "history"
-                    WHERE "history"."user" IN ({})
-                        AND "history"."timestamp" >= ?
-                        AND "history"."timestamp" <= ?
-                    GROUP BY "history"."symbol"
-                    ORDER BY "sum" DESC, "history"."symbol"
-                    LIMIT ? '''.format(','.join('?'*len(user)))
+            sql = f'''SELECT {date}, "symbol" AS symbol, SUM({income}) AS sum FROM "{table}"
+                    WHERE "user" IN ({','.join('?'*len(user))})
+                        AND {where}
+                    GROUP BY "symbol"
+                    ORDER BY "sum" DESC, "symbol"
+                    LIMIT ? '''
             sql_parameters = tuple(user) + (start, end, top)
-        try:
-            with sqlite3.connect(self.db) as conn:
-                cur = conn.cursor()
-                cur.execute(sql, sql_parameters)
-                rows = cur.fetchall()
-                return rows
-        except sqlite3.Error as e:
-            print(e)
+        return self.select(sql, sql_parameters)
         
     def select_pnl(self, user: list, start: str, end: str):
+        if self.use_rollup(start, end):
+            table = "history_daily"
+            date = "strftime('%Y-%m-%d',\"day\" / 1000, 'unixepoch') as date"
+            income = '"sum"'
+            where = self.range_where(True, end)
+        else:
+            table = "history"
+            date = "strftime('%Y-%m-%d',\"timestamp\" / 1000, 'unixepoch') as date"
+            income = '"income"'
+            where = self.range_where(False, end)
         if 'ALL' in user:
-            sql = '''SELECT strftime('%Y-%m-%d',"timestamp" / 1000, 'unixepoch') as date, SUM("income") AS "sum" FROM "history"
-                    WHERE "history"."timestamp" >= ?
-                        AND "history"."timestamp" <= ?
+            sql = f'''SELECT {date}, SUM({income}) AS "sum" FROM "{table}"
+                    WHERE {where}
                     GROUP BY date '''
             sql_parameters = (start, end)
         else:
-            sql = '''SELECT strftime('%Y-%m-%d',"timestamp" / 1000, 'unixepoch') as date, SUM("income") AS "sum" FROM "history"
-                    WHERE "history"."user" IN ({})
-                        AND "history"."timestamp" >= ?
-                        AND "history"."timestamp" <= ?
-                    GROUP BY date'''.format(','.join('?'*len(user)))
+            sql = f'''SELECT {date}, SUM({income}) AS "sum" FROM "{table}"
+                    WHERE "user" IN ({','.join('?'*len(user))})
+                        AND {where}
+                    GROUP BY date'''
             sql_parameters = tuple(user) + (start, end)
-        try:
-            with sqlite3.connect(self.db) as conn:
-                cur = conn.cursor()
-                cur.execute(sql, sql_parameters)
-                rows = cur.fetchall()
-                return rows
-        except sqlite3.Error as e:
-            print(e)
+        return self.select(sql, sql_parameters)
     
     def select_ppl(self, user: list, start: str, end: str, sum_period: str):
     # Define date formats for different sum_period values
@@ -476,23 +619,35 @@ class Database():
             'YEAR': "'%Y'",
         }
 
+        if self.use_rollup(start, end):
+            table = "history_daily"
+            column = "day"
+            sum_positive = 'SUM("positive")'
+            sum_negative = 'SUM("negative")'
+            where = self.range_where(True, end)
+        else:
+            table = "history"
+            column = "timestamp"
+            sum_positive = 'SUM(CASE WHEN "income" >= 0 THEN "income" ELSE 0 END)'
+            sum_negative = 'SUM(CASE WHEN "income" < 0 THEN "income" ELSE 0 END)'
+            where = self.range_where(False, end)
+
         if sum_period == 'ALL_TIME':
             select_period = "'ALL_TIME' AS period"
             group_by_clause = ''
         else:
             date_format = date_formats.get(sum_period, "'%Y-%m-%d'")
-            select_period = f"strftime({date_format}, \"timestamp\" / 1000, 'unixepoch') AS period"
+            select_period = f"strftime({date_format}, \"{column}\" / 1000, 'unixepoch') AS period"
             group_by_clause = 'GROUP BY period'
 
         if 'ALL' in user:
             sql = f'''
             SELECT
                 {select_period},
-                SUM(CASE WHEN "income" >= 0 THEN "income" ELSE 0 END) AS "sum_positive",
-                SUM(CASE WHEN "income" < 0 THEN "income" ELSE 0 END) AS "sum_negative"
-            FROM "history"
-            WHERE "history"."timestamp" >= ?
-                AND "history"."timestamp" <= ?
+                {sum_positive} AS "sum_positive",
+                {sum_negative} AS "sum_negative"
+            FROM "{table}"
+            WHERE {where}
             {group_by_clause}
             '''
             sql_parameters = (start, end)
@@ -501,23 +656,15 @@ class Database():
             sql = f'''
             SELECT
                 {select_period},
-                SUM(CASE WHEN "income" >= 0 THEN "income" ELSE 0 END) AS "sum_positive",
-                SUM(CASE WHEN "income" < 0 THEN "income" ELSE 0 END) AS "sum_negative"
-            FROM "history"
-            WHERE "history"."user" IN ({placeholders})
-                AND "history"."timestamp" >= ?
-                AND "history"."timestamp" <= ?
+                {sum_positive} AS "sum_positive",
+                {sum_negative} AS "sum_negative"
+            FROM "{table}"
+            WHERE "user" IN ({placeholders})
+                AND {where}
             {group_by_clause}
             '''
             sql_parameters = tuple(user) + (start, end)
-        try:
-            with sqlite3.connect(self.db) as conn:
-                cur = conn.cursor()
-                cur.execute(sql, sql_parameters)
-                rows = cur.fetchall()
-                return rows
-        except sqlite3.Error as e:
-            print(e)
+        return self.select(sql, sql_parameters)
 
     def select_income(self, user: list, start: str, end: str):
         if 'ALL' in user:
@@ -533,14 +680,7 @@ class Database():
                         AND "history"."timestamp" <= ?
                     ORDER BY "timestamp" ASC'''.format(','.join('?'*len(user)))
             sql_parameters = tuple(user) + (start, end)
-        try:
-            with sqlite3.connect(self.db) as conn:
-                cur = conn.cursor()
-                cur.execute(sql, sql_parameters)
-                rows = cur.fetchall()
-                return rows
-        except sqlite3.Error as e:
-            print(e)
+        return self.select(sql, sql_parameters)
     
     # select income grouped by symbol not sum
     def select_income_by_symbol(self, user: list, start: str, end: str):
@@ -557,28 +697,23 @@ class Database():
                         AND "history"."timestamp" <= ?
                     ORDER BY "timestamp" ASC'''.format(','.join('?'*len(user)))
             sql_parameters = tuple(user) + (start, end)
-        try:
-            with sqlite3.connect(self.db) as conn:
-                cur = conn.cursor()
-                cur.execute(sql, sql_parameters)
-                rows = cur.fetchall()
-                return rows
-        except sqlite3.Error as e:
-            print(e)
+        return self.select(sql, sql_parameters)
+
+    def find_cursor(self, user: User):
+        sql = '''SELECT "timestamp" FROM "history_cursor"
+                WHERE "user" = ? AND "exchange" = ? '''
+        rows = self.select(sql, [user.name, user.exchange])
+        if not rows:
+            return None
+        return rows[0][0]
 
     def find_last_timestamp(self, user: User):
         sql = '''SELECT MAX("history"."timestamp") FROM "history"
                 WHERE "history"."user" = ? '''
-        try:
-            with sqlite3.connect(self.db) as conn:
-                cur = conn.cursor()
-                cur.execute(sql, [user.name])
-                rows = cur.fetchall()
-                if rows[0][0] is None:
-                    return 0
-                return rows[0][0]
-        except sqlite3.Error as e:
-            print(e)
+        rows = self.select(sql, [user.name])
+        if not rows or rows[0][0] is None:
+            return 0
+        return rows[0][0]
 
     def fetch_history2(self, user: User):
         exchange = Exchange(user.exchange, user)
@@ -6,7 +6,10 @@ import json
 from pathlib import Path
 from time import sleep
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from pbgui_purefunc import PBGDIR
+from RateLimit import limiter
 
 class Exchanges(Enum):
     BINANCE = 'binance'
@@ -74,6 +77,8 @@ class Exchange:
         self.swap = []
         self._user = user
         self.error = None
+        self.history_cursor = None
+        self._limiter = None
 
     @property
     def user(self): return self._user
@@ -291,54 +296,130 @@ class Exchange:
         with open(file, 'a') as f:
             json.dump(history, f, indent=4)
 
-    def fetch_history(self, since: int = None):
+    def history_range(self, since: int = None):
+        # Returns (since, now, window) in the time unit of the exchange history endpoint
+        hour = 60 * 60 * 1000
+        day = 24 * hour
+        week = 7 * day
+        now = self.instance.milliseconds()
+        if self.id == "bybit":
+            window = week
+            max = 2 * 365 * day - day
+        elif self.id == "hyperliquid":
+            window = week
+            max = 365 * day
+            if since:
+                # For make sure not to miss any funding or trading history
+                since -= hour
+        elif self.id == "kucoinfutures":
+            window = day
+            max = 1 * 365 * day - day
+        elif self.id in ["okx", "bitget"]:
+            window = week
+            max = 120 * day
+        elif self.id == "gateio":
+            # gateio works in seconds
+            now = self.instance.seconds()
+            window = int(week / 1000)
+            max = int(365 * day / 1000)
+            if since:
+                since = int(since / 1000)
+        elif self.id == "binance":
+            window = week
+            max = 124 * day
+        else:
+            return None
+        if not since:
+            since = now - max
+        return since, now, window
+
+    def history_windows(self, since: int, now: int, window: int):
+        windows = []
+        while True:
+            windows.append((since, since + window))
+            since += window
+            if since > now:
+                return windows
+
+    # Requests per second of the history endpoints that are slower than the ccxt rateLimit
+    HISTORY_RATES = {"hyperliquid": 1.0, "okx": 2.0}
+
+    def request(self, func, *args, **kwargs):
+        """Call func through the rate limiter of the exchange, retries rate limit and 5xx errors"""
+        if not self._limiter:
+            self._limiter = limiter(self.id, self.HISTORY_RATES.get(self.id, 1000 / self.instance.rateLimit))
+        return self._limiter.call(func, *args, **kwargs)
+
+    def iter_history(self, since: int = None, workers: int = 1):
+        """Yield (incomes, cursor) page by page
+
+        cursor is None or the timestamp in ms a later fetch can safely resume
+        from once the incomes yielded so far are stored. The windows are a
+        fixed grid and rows are deduplicated by uniqueid, so the timestamp is
+        enough, page tokens like the nextPageCursor of bybit are only valid
+        within the request of one window.
+        """
+        self.history_cursor = None
         if self.user.key == 'key':
-            return []
-        all_histories = []
-        all = []
+            return
         if not self.instance: self.connect()
+        fetch_window = getattr(self, f'_fetch_history_{self.id}', None)
+        history_range = self.history_range(since)
+        if not fetch_window or not history_range:
+            return
+        since, now, window = history_range
+        # cursor timestamps are always in ms
+        unit = 1000 if self.id == "gateio" else 1
         if self.id == "bybit":
-            day = 24 * 60 * 60 * 1000
-            week = 7 * day
-            max = 2 * 365 * day - day
-            now = self.instance.milliseconds()
-            if not since:
-                since = now - max
-            limit = 50
-            end = since + week
-            if self.instance.is_unified_enabled()[1]:
-                UTA = True
+            self._uta = bool(self.instance.is_unified_enabled()[1])
+        windows = self.history_windows(since, now, window)
+        if workers > 1 and len(windows) > 1:
+            # Backfill: fetch windows concurrently, but yield them in order and keep at most 2 * workers pending
+            print(f'User:{self.user.name} Backfill', len(windows), 'windows with', workers, 'workers')
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for start, end in windows:
+                    pending.append((executor.submit(lambda w: list(fetch_window(*w)), (start, end)), end))
+                    if len(pending) >= 2 * workers:
+                        future, end = pending.popleft()
+                        yield from self._window_pages(future.result(), min(end, now) * unit)
+                while pending:
+                    future, end = pending.popleft()
+                    yield from self._window_pages(future.result(), min(end, now) * unit)
+        else:
+            for start, end in windows:
+                for incomes in fetch_window(start, end):
+                    yield incomes, None
+                # The last window ends after now, records up to its end can still arrive
+                yield [], min(end, now) * unit
+        print(f'User:{self.user.name} Done', self._limiter.stats() if self._limiter else "")
+        # Resume the next fetch one hour before now, late records are deduplicated by uniqueid
+        self.history_cursor = now * unit - 60 * 60 * 1000
+        yield [], self.history_cursor
+
+    def _window_pages(self, pages: list, end: int):
+        for incomes in pages[:-1]:
+            yield incomes, None
+        yield (pages[-1] if pages else []), end
+
+    def fetch_history(self, since: int = None, workers: int = 1):
+        all = []
+        for incomes, cursor in self.iter_history(since, workers):
+            all.extend(incomes)
+        return all
+
+    def _fetch_history_bybit(self, since: int, end: int):
+        limit = 50
+        cursor = None
+        while True:
+            all = []
+            if self._uta:
+                transactions = self.request(self.instance.privateGetV5AccountTransactionLog, params = {"limit": limit, "startTime": since, "endTime": end, "cursor": cursor})
             else:
-                UTA = False
-            cursor = None
-            while True:
-                for i in range(5):
-                    try:
-                        if UTA:
-                            transactions = self.instance.privateGetV5AccountTransactionLog(params = {"limit": limit, "startTime": since, "endTime": end, "cursor": cursor})
-                        else:
-                            transactions = self.instance.privateGetV5AccountContractTransactionLog(params = {"limit": limit, "startTime": since, "endTime": end, "cursor": cursor})
-                    except Exception as e:
-                        print(e)
-                        print(f'User:{self.user.name} Fetching transactions failed. Retry in 5 seconds')
-                        sleep(5)
-                        continue
-                cursor = transactions["result"]["nextPageCursor"]
-                positions = transactions["result"]["list"]
-                if positions:
-                    first_position = positions[0]
-                    last_position = positions[-1]
-                    all_histories = positions + all_histories
-                if cursor:
-                    print(f'User:{self.user.name} Fetched', len(positions), 'transactions from', self.instance.iso8601(int(first_position['transactionTime'])), 'till', self.instance.iso8601(int(last_position['transactionTime'])))
-                else:
-                    print(f'User:{self.user.name} Fetched', len(positions), 'transactions from', self.instance.iso8601(since), 'till', self.instance.iso8601(end))
-                    since = since + week
-                    end = since + week
-                if since > now:
-                    print(f'User:{self.user.name} Done')
-                    break
-            for history in all_histories:
+                transactions = self.request(self.instance.privateGetV5AccountContractTransactionLog, params = {"limit": limit, "startTime": since, "endTime": end, "cursor": cursor})
+            cursor = transactions["result"]["nextPageCursor"]
+            positions = transactions["result"]["list"]
+            for history in positions:
                 if history["type"] in ["TRADE","SETTLEMENT"]:
                     income = {}
                     income["symbol"] = history["symbol"]
@@ -348,71 +429,44 @@ class Exchange:
                     all.append(income)
                 else: 
                     self.save_income_other(history, self.user.name)
-        elif self.id == "hyperliquid":
-            hour = 60 * 60 * 1000
-            day = 24 * 60 * 60 * 1000
-            week = 7 * day
-            max = 365 * day
-            now = self.instance.milliseconds()
-            if not since:
-                since = now - max
+            yield all
+            if cursor:
+                print(f'User:{self.user.name} Fetched', len(positions), 'transactions from', self.instance.iso8601(int(positions[0]['transactionTime'])), 'till', self.instance.iso8601(int(positions[-1]['transactionTime'])))
             else:
-                # For make sure not to miss any funding or trading history
-                since -= hour
-            limit = 500
-            end = since + week
-            since_trades = since
-            end_trades = end
-            while True:
-                fundings = self.instance.fetch(
-                    "https://api.hyperliquid.xyz/info",
-                    method="POST",
-                    headers={"Content-Type": "application/json"},
-                    body=json.dumps({"type": "userFunding", "user": self.user.wallet_address, "startTime": since, "endTime": end}),
+                print(f'User:{self.user.name} Fetched', len(positions), 'transactions from', self.instance.iso8601(since), 'till', self.instance.iso8601(end))
+                return
+
+    def _fetch_history_hyperliquid(self, since: int, end: int):
+        limit = 500
+        start = since
+        while True:
+            all = []
+            fundings = self.request(
+                self.instance.fetch,
+                "https://api.hyperliquid.xyz/info",
+                method="POST",
+                headers={"Content-Type": "application/json"},
+                body=json.dumps({"type": "userFunding", "user": self.user.wallet_address, "startTime": start, "endTime": end}),
             )
-                if fundings:
-                    first_funding = fundings[0]
-                    last_funding = fundings[-1]
-                    all_histories = fundings + all_histories
-                if len(fundings) == limit:
-                    print(f'User:{self.user.name} Fetched', len(fundings), 'fundings from', self.instance.iso8601(int(first_funding['time'])), 'till', self.instance.iso8601(int(last_funding['time'])))
-                    since = int(fundings[-1]['time'])
-                else:
-                    print(f'User:{self.user.name} Fetched', len(fundings), 'fundings from', self.instance.iso8601(since), 'till', self.instance.iso8601(end))
-                    since = end
-                    end = since + week
-                if since > now:
-                    print(f'User:{self.user.name} Done')
-                    break
-                sleep(1)
-            for history in all_histories:
+            for history in fundings:
                 income = {}
                 income["symbol"] = history["delta"]["coin"] + "USDC"
                 income["timestamp"] = history["time"]
                 income["income"] = history["delta"]["usdc"]
                 income["uniqueid"] = history["hash"]
                 all.append(income)
-            since = since_trades
-            end = end_trades
-            all_histories = []
-            while True:
-                trades = self.instance.fetch_my_trades(since=since, limit=limit, params = {"endTime": end})
-                if trades:
-                    first_trade = trades[0]
-                    last_trade = trades[-1]
-                    all_histories = trades + all_histories
-                if len(trades) == limit:
-                    print(f'User:{self.user.name} Fetched', len(trades), 'trades from', self.instance.iso8601(first_trade['timestamp']), 'till', self.instance.iso8601(last_trade['timestamp']))
-                    since = trades[-1]['timestamp']
-                else:
-                    print(f'User:{self.user.name} Fetched', len(trades), 'trades from', self.instance.iso8601(since), 'till', self.instance.iso8601(end))
-                    since = end
-                    end = since + week
-                if since > now:
-                    print(f'User:{self.user.name} Done')
-                    break
-                sleep(1)
-            for history in all_histories:
+            yield all
+            if len(fundings) == limit:
+                print(f'User:{self.user.name} Fetched', len(fundings), 'fundings from', self.instance.iso8601(int(fundings[0]['time'])), 'till', self.instance.iso8601(int(fundings[-1]['time'])))
+                start = int(fundings[-1]['time'])
+            else:
+                print(f'User:{self.user.name} Fetched', len(fundings), 'fundings from', self.instance.iso8601(start), 'till', self.instance.iso8601(end))
+                break
+        start = since
+        while True:
+            all = []
+            trades = self.request(self.instance.fetch_my_trades, since=start, limit=limit, params = {"endTime": end})
+            for history in trades:
                 if history["side"] == "sell":
                     income = {}
                     income["symbol"] = history["info"]["coin"] + "USDC"
@@ -420,33 +474,21 @@ class Exchange:
                     income["income"] = history["info"]["closedPnl"]
                     income["uniqueid"] = history["info"]["tid"]
                     all.append(income)
-        elif self.id == "kucoinfutures":
-            day = 24 * 60 * 60 * 1000
-            week = 7 * day
-            max = 1 * 365 * day - day
-            now = self.instance.milliseconds()
-            if not since:
-                since = now - max
-            limit = 50
-            end = since + day
-            while True:
-                positions = self.instance.futuresPrivateGetTransactionHistory(params = {"maxCount": limit, "startAt": since, "endAt": end})
-                positions = positions["data"]["dataList"]
-                if positions:
-                    first_position = positions[0]
-                    last_position = positions[-1]
-                    all_histories = positions + all_histories
-                if len(positions) == limit:
-                    print(f'User:{self.user.name} Fetched', len(positions), 'income from', self.instance.iso8601(first_position['time']), 'till', self.instance.iso8601(last_position['time']))
-                    end = positions[-1]['time']
-                else:
-                    print(f'User:{self.user.name} Fetched', len(positions), 'income from', self.instance.iso8601(since), 'till', self.instance.iso8601(end))
-                    since = since + day
-                    end = since + day
-                if since > now:
-                    print(f'User:{self.user.name} Done')
-                    break
-            for history in all_histories:
+            yield all
+            if len(trades) == limit:
+                print(f'User:{self.user.name} Fetched', len(trades), 'trades from', self.instance.iso8601(trades[0]['timestamp']), 'till', self.instance.iso8601(trades[-1]['timestamp']))
+                start = trades[-1]['timestamp']
+            else:
+                print(f'User:{self.user.name} Fetched', len(trades), 'trades from', self.instance.iso8601(start), 'till', self.instance.iso8601(end))
+                break
+
+    def _fetch_history_kucoinfutures(self, since: int, end: int):
+        limit = 50
+        while True:
+            all = []
+            positions = self.request(self.instance.futuresPrivateGetTransactionHistory, params = {"maxCount": limit, "startAt": since, "endAt": end})
+            positions = positions["data"]["dataList"]
+            for history in positions:
                 if history["type"] == "RealisedPNL":
                     income = {}
                     income["symbol"] = history["remark"][0:-2]
@@ -456,33 +498,20 @@ class Exchange:
                     all.append(income)
                 else: 
                     self.save_income_other(history, self.user.name)
-        elif self.id == "okx":
-            day = 24 * 60 * 60 * 1000
-            week = 7 * day
-            max = 120 * day
-            now = self.instance.milliseconds()
-            if not since:
-                since = now - max
-            limit = 100
-            end = since + week
-            while True:
-                ledgers = self.instance.fetch_ledger(since=since, limit=limit, params = {"method": "privateGetAccountBillsArchive", "instType": "SWAP", "end": end})
-                if ledgers:
-                    first_ledger = ledgers[0]
-                    last_ledger = ledgers[-1]
-                    all_histories = ledgers + all_histories
-                if len(ledgers) == limit:
-                    print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(first_ledger['timestamp']), 'till', self.instance.iso8601(last_ledger['timestamp']))
-                    end = ledgers[0]['timestamp']
-                else:
-                    print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(since), 'till', self.instance.iso8601(end))
-                    since = since + week
-                    end = since + week
-                if since > now:
-                    print(f'User:{self.user.name} Done')
-                    break
-                sleep(0.5)
-            for history in all_histories:
+            yield all
+            if len(positions) == limit:
+                print(f'User:{self.user.name} Fetched', len(positions), 'income from', self.instance.iso8601(positions[0]['time']), 'till', self.instance.iso8601(positions[-1]['time']))
+                end = positions[-1]['time']
+            else:
+                print(f'User:{self.user.name} Fetched', len(positions), 'income from', self.instance.iso8601(since), 'till', self.instance.iso8601(end))
+                return
+
+    def _fetch_history_okx(self, since: int, end: int):
+        limit = 100
+        while True:
+            all = []
+            ledgers = self.request(self.instance.fetch_ledger, since=since, limit=limit, params = {"method": "privateGetAccountBillsArchive", "instType": "SWAP", "end": end})
+            for history in ledgers:
                 if history["type"] in ["trade","fee"]:
                     income = {}
                     income["symbol"] = history["symbol"][0:-5].replace("/", "").replace("-", "")
@@ -492,32 +521,20 @@ class Exchange:
                     all.append(income)
                 else: 
                     self.save_income_other(history, self.user.name)
-        elif self.id == "bitget":
-            day = 24 * 60 * 60 * 1000
-            week = 7 * day
-            max = 120 * day
-            now = self.instance.milliseconds()
-            if not since:
-                since = now - max
-            limit = 100
-            end = since + week
-            while True:
-                ledgers = self.instance.fetch_ledger(since=since, limit=limit, params = {"type": "swap", "endTime": end})
-                if ledgers:
-                    first_ledger = ledgers[0]
-                    last_ledger = ledgers[-1]
-                    all_histories = ledgers + all_histories
-                if len(ledgers) == limit:
-                    print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(first_ledger['timestamp']), 'till', self.instance.iso8601(last_ledger['timestamp']))
-                    end = ledgers[0]['timestamp']
-                else:
-                    print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(since), 'till', self.instance.iso8601(end))
-                    since = since + week
-                    end = since + week
-                if since > now:
-                    print(f'User:{self.user.name} Done')
-                    break
-            for history in all_histories:
+            yield all
+            if len(ledgers) == limit:
+                print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(ledgers[0]['timestamp']), 'till', self.instance.iso8601(ledgers[-1]['timestamp']))
+                end = ledgers[0]['timestamp']
+            else:
+                print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(since), 'till', self.instance.iso8601(end))
+                return
+
+    def _fetch_history_bitget(self, since: int, end: int):
+        limit = 100
+        while True:
+            all = []
+            ledgers = self.request(self.instance.fetch_ledger, since=since, limit=limit, params = {"type": "swap", "endTime": end})
+            for history in ledgers:
                 if history["info"]["symbol"] and history["info"]["amount"] != "0":
                     if history["type"] in ["trade","fee"]:
                         income = {}
@@ -528,34 +545,21 @@ class Exchange:
                         all.append(income)
                     else: 
                         self.save_income_other(history, self.user.name)
-        elif self.id == "gateio":
-            day = 24 * 60 * 60
-            week = 7 * day
-            max = 365 * day
-            now = self.instance.seconds()
-            if not since:
-                since = now - max
+            yield all
+            if len(ledgers) == limit:
+                print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(ledgers[0]['timestamp']), 'till', self.instance.iso8601(ledgers[-1]['timestamp']))
+                end = ledgers[0]['timestamp']
             else:
-                since = int(since / 1000)
-            limit = 100
-            end = since + week
-            while True:
-                ledgers = self.instance.fetch_ledger(since=since, limit=limit, params = {"type": "swap", "to": end})
-                if ledgers:
-                    first_ledger = ledgers[0]
-                    last_ledger = ledgers[-1]
-                    all_histories = ledgers + all_histories
-                if len(ledgers) == limit:
-                    print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(first_ledger['timestamp']), 'till', self.instance.iso8601(last_ledger['timestamp']))
-                    end = int(ledgers[0]['timestamp']/1000)
-                else:
-                    print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(since*1000), 'till', self.instance.iso8601(end*1000))
-                    since = since + week
-                    end = since + week
-                if since > now:
-                    print(f'User:{self.user.name} Done')
-                    break
-            for history in all_histories:
+                print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(since), 'till', self.instance.iso8601(end))
+                return
+
+    def _fetch_history_gateio(self, since: int, end: int):
+        # since and end are in seconds
+        limit = 100
+        while True:
+            all = []
+            ledgers = self.request(self.instance.fetch_ledger, since=since, limit=limit, params = {"type": "swap", "to": end})
+            for history in ledgers:
                 if history["info"]["contract"] and history["amount"] != "0":
                     if history["type"] in ["trade","fee"]:
                         income = {}
@@ -566,38 +570,27 @@ class Exchange:
                         all.append(income)
                     else: 
                         self.save_income_other(history, self.user.name)
-        elif self.id == "binance":
-            day = 24 * 60 * 60 * 1000
-            week = 7 * day
-            max = 124 * day
-            now = self.instance.milliseconds()
-            if not since:
-                since = now - max
-            limit = 1000
-            end = since + week
-            while True:
-                imcomes = self.instance.fapiPrivateGetIncome({                        
-                                                        "pageSize": "100",
-                                                        "startTime": since,
-                                                        "limit": limit,
-                                                        "endTime": end,
-                                                        "timestamp": self.instance.milliseconds()
-                                                        })
-                if imcomes:
-                    first_imcome = imcomes[0]
-                    last_imcome = imcomes[-1]
-                    all_histories = imcomes + all_histories
-                if len(imcomes) == limit:
-                    print(f'User:{self.user.name} Fetched', len(imcomes), 'incomes from', self.instance.iso8601(int(first_imcome['time'])), 'till', self.instance.iso8601(int(last_imcome['time'])))
-                    since = int(imcomes[-1]['time'])
-                else:
-                    print(f'User:{self.user.name} Fetched', len(imcomes), 'incomes from', self.instance.iso8601(since), 'till', self.instance.iso8601(end))
-                    since = end
-                    end = since + week
-                if since > now:
-                    print(f'User:{self.user.name} Done')
-                    break
-            for history in all_histories:
+            yield all
+            if len(ledgers) == limit:
+                print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(ledgers[0]['timestamp']), 'till', self.instance.iso8601(ledgers[-1]['timestamp']))
+                end = int(ledgers[0]['timestamp']/1000)
+            else:
+                print(f'User:{self.user.name} Fetched', len(ledgers), 'ledgers from', self.instance.iso8601(since*1000), 'till', self.instance.iso8601(end*1000))
+                return
+
+    def _fetch_history_binance(self, since: int, end: int):
+        limit = 1000
+        start = since
+        while True:
+            all = []
+            imcomes = self.request(self.instance.fapiPrivateGetIncome, {                        
+                                                    "pageSize": "100",
+                                                    "startTime": start,
+                                                    "limit": limit,
+                                                    "endTime": end,
+                                                    "timestamp": self.instance.milliseconds()
+                                                    })
+            for history in imcomes:
                 if history["incomeType"] == "REALIZED_PNL":
                     income = {}
                     income["symbol"] = history["symbol"]
@@ -607,11 +600,22 @@ class Exchange:
                     all.append(income)
                 else: 
                     self.save_income_other(history, self.user.name)
-        return all
+            yield all
+            if len(imcomes) == limit:
+                print(f'User:{self.user.name} Fetched', len(imcomes), 'incomes from', self.instance.iso8601(int(imcomes[0]['time'])), 'till', self.instance.iso8601(int(imcomes[-1]['time'])))
+                start = int(imcomes[-1]['time'])
+            else:
+                print(f'User:{self.user.name} Fetched', len(imcomes), 'incomes from', self.instance.iso8601(start), 'till', self.instance.iso8601(end))
+                return
     
     def fetch_trades(self, symbol: str, market_type: str, since: int):
-        all_trades = []
-        last_trade_id = ""
+        all_trades = [trade for trades in self.iter_trades(symbol, market_type, since) for trade in trades]
+        if all_trades:
+            sort_trades = sorted(all_trades, key=lambda d: d['timestamp'])
+            return sort_trades
+
+    def iter_trades(self, symbol: str, market_type: str, since: int):
+        """Yield the trades of symbol since page by page, pages are not in time order on every exchange"""
         if not self.instance: self.connect()
         if self.instance.has['fetchMyTrades'] or self.instance.has['fetchTrades']:
             end_time = self.instance.milliseconds()
@@ -623,7 +627,6 @@ class Exchange:
                 else:
                     week = 24 * 60 * 60 * 1000
                 now = self.instance.milliseconds()
-                all_trades = []
                 if since == 1577840461000:
                     first_trade = self.instance.fetch_my_trades(symbol, None, None, {'fromId': 0})
                     if first_trade:
@@ -639,7 +642,7 @@ class Exchange:
                     if len(trades):
                         last_trade = trades[len(trades) - 1]
                         since = last_trade['timestamp'] + 1
-                        all_trades = all_trades + trades
+                        yield trades
                     else:
                         since = end_time
             elif self.id == "bybit":
@@ -647,7 +650,6 @@ class Exchange:
                 week = 7 * day
                 year = 365 * day
                 now = self.instance.milliseconds()
-                all_trades = []
                 if since == 1577840461000:
                     since = now - 2 * year + day
                     end_time = since + week
@@ -666,7 +668,7 @@ class Exchange:
                             cursor = last_trade["info"]["nextPageCursor"]
                             while True:
                                 print(f'User:{self.user.name} Symbol:{symbol} Fetching trades from', cursor)
-                                all_trades = all_trades + trades
+                                yield trades
                                 trades = self.instance.fetch_my_trades(symbol, since, 100, params = {'type': market_type, 'cursor': cursor, 'endTime': end_time })
                                 if len(trades):
                                     lpage = trades[len(trades) - 1]
@@ -677,7 +679,7 @@ class Exchange:
                                 else:
                                     break
                         since = last_trade['timestamp'] + 1
-                        all_trades = all_trades + trades
+                        yield trades
                     else:
                         since = end_time
             elif self.id == "kucoinfutures":
@@ -690,7 +692,7 @@ class Exchange:
                     if trades:
                         first_trade = trades[0]
                         last_trade = trades[-1]
-                        all_trades = trades + all_trades
+                        yield trades
                         print(f'User:{self.user.name} Symbol:{symbol} Fetched', len(trades), 'trades from', first_trade['timestamp'], 'till', last_trade['timestamp'])
                     if len(trades) == limit:
                         end = trades[0]['timestamp']
@@ -714,7 +716,7 @@ class Exchange:
                     if trades:
                         first_trade = trades[0]
                         last_trade = trades[-1]
-                        all_trades = trades + all_trades
+                        yield trades
                         print(f'User:{self.user.name} Symbol:{symbol} Fetched', len(trades), 'trades from', first_trade['timestamp'], 'till', last_trade['timestamp'])
                     if len(trades) == limit:
                         end = trades[0]['timestamp']
@@ -741,7 +743,16 @@ class Exchange:
                     if trades:
                         first_trade = trades[0]
                         last_trade = trades[-1]
-                        all_trades = trades + all_trades
+                        bingx_trades = []
+                        for trade in trades:
+                            if trade["status"] == "FILLED":
+                                trade["id"] = trade["orderId"]
+                                trade["timestamp"] = int(trade["time"])
+                                trade["amount"] = float(trade["executedQty"])
+                                trade["fee"] = float(trade["commission"])
+                                trade["price"] = float(trade["price"])
+                                bingx_trades.append(trade)
+                        yield bingx_trades
                         print(f'User:{self.user.name} Symbol:{symbol} Fetched', len(trades), 'trades from', first_trade['time'], 'till', last_trade['time'])
                     if len(trades) == limit:
                         since = int(trades[-1]['time'])
@@ -752,16 +763,6 @@ class Exchange:
                     if since > now:
                         print(f'User:{self.user.name} Symbol:{symbol} Done')
                         break
-                bingx_trades = []
-                for trade in all_trades:
-                    if trade["status"] == "FILLED":
-                        trade["id"] = trade["orderId"]
-                        trade["timestamp"] = int(trade["time"])
-                        trade["amount"] = float(trade["executedQty"])
-                        trade["fee"] = float(trade["commission"])
-                        trade["price"] = float(trade["price"])
-                        bingx_trades.append(trade)
-                all_trades = bingx_trades
             elif self.id == "bitget":
                 # week = 7 * 24 * 60 * 60 * 1000
                 max = 90 * 24 * 60 * 60 * 1000
@@ -773,7 +774,7 @@ class Exchange:
                     if trades:
                         first_trade = trades[0]
                         last_trade = trades[-1]
-                        all_trades = trades + all_trades
+                        yield trades
                         print(f'User:{self.user.name} Symbol:{symbol} Fetched', len(trades), 'trades from', first_trade['timestamp'], 'till', last_trade['timestamp'])
                     if len(trades) == limit:
                         end = trades[0]['timestamp']
@@ -784,9 +785,6 @@ class Exchange:
                     if since > now:
                         print(f'User:{self.user.name} Symbol:{symbol} Done')
                         break
-        if all_trades:
-            sort_trades = sorted(all_trades, key=lambda d: d['timestamp'])
-            return sort_trades
 
     def symbol_to_exchange_symbol(self, symbol: str, market_type: str):
         if self.id == 'binance':
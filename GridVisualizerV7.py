@@ -1,9 +1,13 @@
 import streamlit as st
 from enum import Enum
 from math import floor, ceil
-from dataclasses import dataclass, field, replace
-from enum import Enum
+from dataclasses import dataclass, field, fields, replace, astuple
 import math
+import multiprocessing
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
 
 # ----------------------------
 # Enums and Data Classes
@@ -1782,3 +1786,840 @@ def calc_closes_short(
         closes.append(close)
     return closes
 
+
+# ----------------------------
+# Batch Ladder Functions (NumPy)
+# ----------------------------
+# Same ladders as calc_entries_long & co, but for many BotParams at once.
+# Every step of a ladder is computed with NumPy arrays for all parameter sets
+# that did not finish yet, the branches of the scalar functions become masks.
+
+@dataclass
+class Ladder:
+    # One row per parameter set, count[i] orders in row i
+    qty: np.ndarray
+    price: np.ndarray
+    order_type: np.ndarray
+    count: np.ndarray
+
+    def orders(self, index: int) -> list:
+        return [
+            Order(qty=float(self.qty[index, i]), price=float(self.price[index, i]), order_type=OrderType(int(self.order_type[index, i])))
+            for i in range(self.count[index])
+        ]
+
+class BatchOrders:
+    """Next order of every parameter set, the first set() that matches a row wins like a return in the scalar code"""
+    def __init__(self, n: int):
+        self.qty = np.zeros(n)
+        self.price = np.zeros(n)
+        self.order_type = np.zeros(n, dtype=int)
+        self.done = np.zeros(n, dtype=bool)
+
+    def set(self, mask, qty, price, order_type: OrderType):
+        mask = mask & ~self.done
+        self.qty = np.where(mask, qty, self.qty)
+        self.price = np.where(mask, price, self.price)
+        self.order_type = np.where(mask, order_type.value, self.order_type)
+        self.done |= mask
+
+    def stop(self, mask):
+        # Order.default()
+        self.done |= mask
+
+    def select(self, mask, other):
+        """Rows of self where mask, rows of other elsewhere"""
+        orders = BatchOrders(len(mask))
+        orders.qty = np.where(mask, self.qty, other.qty)
+        orders.price = np.where(mask, self.price, other.price)
+        orders.order_type = np.where(mask, self.order_type, other.order_type)
+        return orders
+
+def stack_bot_params(bot_params_list) -> BotParams:
+    """BotParams with an array of all parameter sets in every field"""
+    return BotParams(**{f.name: np.array([getattr(bp, f.name) for bp in bot_params_list], dtype=float) for f in fields(BotParams)})
+
+def take_bot_params(bot_params: BotParams, index) -> BotParams:
+    return BotParams(**{f.name: getattr(bot_params, f.name)[index] for f in fields(BotParams)})
+
+def np_round_up(n, step: float):
+    if step == 0.0:
+        return np.round(n, 10)
+    return np.round(np.ceil(n / step) * step, 10)
+
+def np_round_dn(n, step: float):
+    if step == 0.0:
+        return np.round(n, 10)
+    return np.round(np.floor(n / step) * step, 10)
+
+def np_round_(n, step: float):
+    if step == 0.0:
+        return np.round(n, 10)
+    return np.round(np.round(n / step) * step, 10)
+
+def np_cost_to_qty(cost, price, c_mult: float):
+    return np.where(price <= 0.0, 0.0, np.round(cost / (price * c_mult), 10))
+
+def np_qty_to_cost(qty, price, c_mult: float):
+    return np.round(np.abs(qty) * price * c_mult, 10)
+
+def np_calc_wallet_exposure(c_mult: float, balance: float, position_size, position_price):
+    if balance <= 0.0:
+        return np.zeros_like(position_size)
+    return np.where(position_size == 0.0, 0.0, np.round(np_qty_to_cost(position_size, position_price, c_mult) / balance, 10))
+
+def np_calc_new_psize_pprice(psize, pprice, qty, price, qty_step: float):
+    new_psize = np_round_(psize + qty, qty_step)
+    pprice_ = np.where(np.isnan(pprice), 0.0, pprice)
+    new_pprice = np.round((pprice_ * (psize / new_psize)) + (price * (qty / new_psize)), 10)
+    merged = new_psize != 0.0
+    new_psize = np.where(qty == 0.0, psize, np.where(psize == 0.0, np_round_(qty, qty_step), np.where(merged, np.round(new_psize, 10), 0.0)))
+    new_pprice = np.where(qty == 0.0, pprice, np.where(psize == 0.0, price, np.where(merged, new_pprice, 0.0)))
+    return new_psize, new_pprice
+
+def np_calc_wallet_exposure_if_filled(balance: float, psize, pprice, qty, price, exchange_params):
+    psize_abs = np_round_(np.abs(psize), exchange_params.qty_step)
+    qty_abs = np_round_(np.abs(qty), exchange_params.qty_step)
+    (new_psize, new_pprice) = np_calc_new_psize_pprice(psize_abs, pprice, qty_abs, price, exchange_params.qty_step)
+    return np_calc_wallet_exposure(exchange_params.c_mult, balance, new_psize, new_pprice)
+
+def np_interpolate(x, x0, x1, y0, y1):
+    # interpolate() with two points, same order of operations
+    return y0 * ((x - x1) / (x0 - x1)) + y1 * ((x - x0) / (x1 - x0))
+
+def np_calc_min_entry_qty(entry_price, exchange_params):
+    return np.maximum(
+        exchange_params.min_qty,
+        np_round_up(np_cost_to_qty(exchange_params.min_cost, entry_price, exchange_params.c_mult), exchange_params.qty_step),
+    )
+
+def np_calc_initial_entry_qty(exchange_params, bot_params, wallet_exposure_limit, balance: float, entry_price):
+    return np.maximum(
+        np_calc_min_entry_qty(entry_price, exchange_params),
+        np_round_(
+            np_cost_to_qty(balance * wallet_exposure_limit * bot_params.entry_initial_qty_pct, entry_price, exchange_params.c_mult),
+            exchange_params.qty_step,
+        ),
+    )
+
+def np_calc_cropped_reentry_qty(exchange_params, wallet_exposure_limit, psize, pprice, wallet_exposure, balance: float, entry_qty, entry_price):
+    position_size_abs = np.abs(psize)
+    entry_qty_abs = np.abs(entry_qty)
+    wallet_exposure_if_filled = np_calc_wallet_exposure_if_filled(balance, position_size_abs, pprice, entry_qty_abs, entry_price, exchange_params)
+    min_entry_qty = np_calc_min_entry_qty(entry_price, exchange_params)
+    entry_qty_abs_new = np_interpolate(
+        wallet_exposure_limit, wallet_exposure, wallet_exposure_if_filled, position_size_abs, position_size_abs + entry_qty_abs
+    ) - position_size_abs
+    cropped_qty = np.where(
+        wallet_exposure_if_filled > wallet_exposure_limit * 1.01,
+        np.maximum(np_round_(entry_qty_abs_new, exchange_params.qty_step), min_entry_qty),
+        np.maximum(entry_qty_abs, min_entry_qty),
+    )
+    return wallet_exposure_if_filled, cropped_qty
+
+def np_calc_reentry_qty(entry_price, balance: float, psize, exchange_params, bot_params, wallet_exposure_limit):
+    return np.maximum(
+        np_calc_min_entry_qty(entry_price, exchange_params),
+        np_round_(
+            np.maximum(
+                np.abs(psize) * bot_params.entry_grid_double_down_factor,
+                np_cost_to_qty(balance, entry_price, exchange_params.c_mult) * wallet_exposure_limit * bot_params.entry_initial_qty_pct,
+            ),
+            exchange_params.qty_step,
+        ),
+    )
+
+def np_calc_reentry_price_bid(pprice, wallet_exposure, bid, exchange_params, bot_params, wallet_exposure_limit):
+    multiplier = (wallet_exposure / wallet_exposure_limit) * bot_params.entry_grid_spacing_weight
+    reentry_price = np.minimum(
+        np_round_dn(pprice * (1.0 - bot_params.entry_grid_spacing_pct * (1.0 + multiplier)), exchange_params.price_step),
+        bid,
+    )
+    return np.where(reentry_price <= exchange_params.price_step, 0.0, reentry_price)
+
+def np_calc_reentry_price_ask(pprice, wallet_exposure, ask, exchange_params, bot_params, wallet_exposure_limit):
+    multiplier = (wallet_exposure / wallet_exposure_limit) * bot_params.entry_grid_spacing_weight
+    reentry_price = np.maximum(
+        np_round_up(pprice * (1.0 + bot_params.entry_grid_spacing_pct * (1.0 + multiplier)), exchange_params.price_step),
+        ask,
+    )
+    return np.where(reentry_price <= exchange_params.price_step, 0.0, reentry_price)
+
+def np_calc_close_qty(exchange_params, wallet_exposure_limit, psize, pprice, close_qty_pct, balance: float, close_price):
+    full_psize = np_cost_to_qty(balance * wallet_exposure_limit, pprice, exchange_params.c_mult)
+    position_size_abs = np.abs(psize)
+    leftover = np.maximum(0.0, position_size_abs - full_psize)
+    min_entry_qty = np_calc_min_entry_qty(close_price, exchange_params)
+    close_qty = np.minimum(
+        np_round_(position_size_abs, exchange_params.qty_step),
+        np.maximum(min_entry_qty, np_round_up(full_psize * close_qty_pct + leftover, exchange_params.qty_step)),
+    )
+    return np.where(
+        (close_qty > 0.0) & (close_qty < position_size_abs) & (position_size_abs - close_qty < min_entry_qty),
+        position_size_abs,
+        close_qty,
+    )
+
+def trailing_entry_ratio_mode(bot_params, wallet_exposure):
+    """Returns (use trailing, modified wallet_exposure_limit) per row like calc_next_entry_long/short"""
+    wel = bot_params.wallet_exposure_limit
+    ratio = bot_params.entry_trailing_grid_ratio
+    wallet_exposure_ratio = wallet_exposure / wel
+    only = (ratio >= 1.0) | (ratio <= -1.0)
+    trailing_first = ~only & (ratio > 0.0)
+    grid_first = ~only & (ratio < 0.0)
+    trailing = only | (trailing_first & (wallet_exposure_ratio < ratio)) | (grid_first & ~(wallet_exposure_ratio < 1.0 + ratio))
+    modified = (wallet_exposure != 0.0) & ((trailing_first & trailing) | (grid_first & ~trailing))
+    wel = np.where(modified, np.where(ratio > 0.0, wel * ratio * 1.01, wel * (1.0 + ratio) * 1.01), wel)
+    return trailing, wel
+
+def trailing_close_ratio_mode(exchange_params, bot_params, balance: float, psize, pprice, wallet_exposure):
+    """Returns (use trailing, position size for the close) per row like calc_next_close_long/short"""
+    position_size_abs = np.abs(psize)
+    wel = bot_params.wallet_exposure_limit
+    ratio = bot_params.close_trailing_grid_ratio
+    wallet_exposure_ratio = wallet_exposure / wel
+    only = (ratio >= 1.0) | (ratio <= -1.0)
+    trailing_first = ~only & (ratio > 0.0)
+    grid_first = ~only & (ratio < 0.0)
+    min_entry_qty = np_calc_min_entry_qty(pprice, exchange_params)
+    # trailing first, grid part of the position
+    trailing_allocation = np_cost_to_qty(balance * wel * ratio, pprice, exchange_params.c_mult)
+    trailing_allocation = np.where(trailing_allocation < min_entry_qty, 0.0, trailing_allocation)
+    grid_allocation = np_round_(position_size_abs - trailing_allocation, exchange_params.qty_step)
+    grid_size = np.minimum(position_size_abs, np.maximum(grid_allocation, min_entry_qty))
+    # grid first, trailing part of the position
+    grid_allocation = np_cost_to_qty(balance * wel * (1.0 + ratio), pprice, exchange_params.c_mult)
+    grid_allocation = np.where(grid_allocation < min_entry_qty, 0.0, grid_allocation)
+    trailing_allocation = np_round_(position_size_abs - grid_allocation, exchange_params.qty_step)
+    trailing_size = np.minimum(position_size_abs, np.maximum(trailing_allocation, min_entry_qty))
+    grid_first_trailing = grid_first & ~(wallet_exposure_ratio < 1.0 + ratio)
+    trailing = only | (trailing_first & (wallet_exposure_ratio < ratio)) | grid_first_trailing
+    size = np.where(trailing_first & ~trailing, grid_size, np.where(grid_first_trailing, trailing_size, position_size_abs))
+    return trailing, np.sign(psize) * size
+
+# Long entries
+
+def calc_grid_entry_long_batch(exchange_params, state_params, bot_params, wallet_exposure_limit, psize, pprice, bid):
+    ex = exchange_params
+    balance = state_params.balance
+    orders = BatchOrders(len(psize))
+    orders.stop((wallet_exposure_limit == 0.0) | (balance <= 0.0))
+    initial_entry_price = np.minimum(
+        bid, np_round_dn(state_params.ema_bands.lower * (1.0 - bot_params.entry_initial_ema_dist), ex.price_step)
+    )
+    orders.stop(initial_entry_price <= ex.price_step)
+    initial_entry_qty = np_calc_initial_entry_qty(ex, bot_params, wallet_exposure_limit, balance, initial_entry_price)
+    orders.set(psize == 0.0, initial_entry_qty, initial_entry_price, OrderType.EntryInitialNormalLong)
+    orders.set(
+        psize < initial_entry_qty * 0.8,
+        np.maximum(np_calc_min_entry_qty(initial_entry_price, ex), np_round_dn(initial_entry_qty - psize, ex.qty_step)),
+        initial_entry_price,
+        OrderType.EntryInitialPartialLong,
+    )
+    wallet_exposure = np_calc_wallet_exposure(ex.c_mult, balance, psize, pprice)
+    orders.stop(wallet_exposure >= wallet_exposure_limit * 0.999)
+    reentry_price = np_calc_reentry_price_bid(pprice, wallet_exposure, bid, ex, bot_params, wallet_exposure_limit)
+    orders.stop(reentry_price <= 0.0)
+    reentry_qty = np.maximum(np_calc_reentry_qty(reentry_price, balance, psize, ex, bot_params, wallet_exposure_limit), initial_entry_qty)
+    (wallet_exposure_if_filled, reentry_qty_cropped) = np_calc_cropped_reentry_qty(
+        ex, wallet_exposure_limit, psize, pprice, wallet_exposure, balance, reentry_qty, reentry_price
+    )
+    orders.set(reentry_qty_cropped < reentry_qty, reentry_qty_cropped, reentry_price, OrderType.EntryGridCroppedLong)
+    # preview next order
+    (psize_if_filled, pprice_if_filled) = np_calc_new_psize_pprice(psize, pprice, reentry_qty, reentry_price, ex.qty_step)
+    next_reentry_price = np_calc_reentry_price_bid(pprice_if_filled, wallet_exposure_if_filled, bid, ex, bot_params, wallet_exposure_limit)
+    next_reentry_qty = np.maximum(
+        np_calc_reentry_qty(next_reentry_price, balance, psize_if_filled, ex, bot_params, wallet_exposure_limit), initial_entry_qty
+    )
+    (_, next_reentry_qty_cropped) = np_calc_cropped_reentry_qty(
+        ex, wallet_exposure_limit, psize_if_filled, pprice_if_filled, wallet_exposure_if_filled, balance, next_reentry_qty, next_reentry_price
+    )
+    effective_double_down_factor = np.where(psize_if_filled != 0, next_reentry_qty_cropped / psize_if_filled, 0.0)
+    new_entry_qty = np_interpolate(wallet_exposure_limit, wallet_exposure, wallet_exposure_if_filled, psize, psize + reentry_qty) - psize
+    orders.set(
+        effective_double_down_factor < bot_params.entry_grid_double_down_factor * 0.25,
+        np_round_(new_entry_qty, ex.qty_step),
+        reentry_price,
+        OrderType.EntryGridInflatedLong,
+    )
+    orders.set(True, reentry_qty, reentry_price, OrderType.EntryGridNormalLong)
+    return orders
+
+def calc_trailing_entry_long_batch(exchange_params, state_params, bot_params, wallet_exposure_limit, psize, pprice, bid, trailing_price_bundle):
+    ex = exchange_params
+    tpb = trailing_price_bundle
+    balance = state_params.balance
+    orders = BatchOrders(len(psize))
+    initial_entry_price = np.minimum(
+        bid, np_round_dn(state_params.ema_bands.lower * (1.0 - bot_params.entry_initial_ema_dist), ex.price_step)
+    )
+    orders.stop(initial_entry_price <= ex.price_step)
+    initial_entry_qty = np_calc_initial_entry_qty(ex, bot_params, wallet_exposure_limit, balance, initial_entry_price)
+    orders.set(psize == 0.0, initial_entry_qty, initial_entry_price, OrderType.EntryInitialNormalLong)
+    orders.set(
+        psize < initial_entry_qty * 0.8,
+        np.maximum(np_calc_min_entry_qty(initial_entry_price, ex), np_round_dn(initial_entry_qty - psize, ex.qty_step)),
+        initial_entry_price,
+        OrderType.EntryInitialPartialLong,
+    )
+    wallet_exposure = np_calc_wallet_exposure(ex.c_mult, balance, psize, pprice)
+    orders.stop(wallet_exposure > wallet_exposure_limit * 0.999)
+    threshold = bot_params.entry_trailing_threshold_pct
+    retracement = bot_params.entry_trailing_retracement_pct
+    bounced = tpb.max_since_min > tpb.min_since_open * (1.0 + retracement)
+    entry_triggered = np.where(
+        threshold <= 0.0,
+        (retracement > 0.0) & bounced,
+        (retracement <= 0.0) | ((tpb.min_since_open < pprice * (1.0 - threshold)) & bounced),
+    )
+    reentry_price = np.where(
+        threshold <= 0.0,
+        bid,
+        np.where(
+            retracement <= 0.0,
+            np.minimum(bid, np_round_dn(pprice * (1.0 - threshold), ex.price_step)),
+            np.minimum(bid, np_round_dn(pprice * (1.0 - threshold + retracement), ex.price_step)),
+        ),
+    )
+    orders.set(~entry_triggered, 0.0, 0.0, OrderType.EntryTrailingNormalLong)
+    reentry_qty = np.maximum(np_calc_reentry_qty(reentry_price, balance, psize, ex, bot_params, wallet_exposure_limit), initial_entry_qty)
+    (_, reentry_qty_cropped) = np_calc_cropped_reentry_qty(
+        ex, wallet_exposure_limit, psize, pprice, wallet_exposure, balance, reentry_qty, reentry_price
+    )
+    orders.set(reentry_qty_cropped < reentry_qty, reentry_qty_cropped, reentry_price, OrderType.EntryTrailingCroppedLong)
+    orders.set(True, reentry_qty, reentry_price, OrderType.EntryTrailingNormalLong)
+    return orders
+
+def calc_next_entry_long_batch(exchange_params, state_params, bot_params, psize, pprice, bid, trailing_price_bundle):
+    wallet_exposure = np_calc_wallet_exposure(exchange_params.c_mult, state_params.balance, psize, pprice)
+    (trailing, wallet_exposure_limit) = trailing_entry_ratio_mode(bot_params, wallet_exposure)
+    grid = calc_grid_entry_long_batch(exchange_params, state_params, bot_params, wallet_exposure_limit, psize, pprice, bid)
+    trailing_orders = calc_trailing_entry_long_batch(
+        exchange_params, state_params, bot_params, wallet_exposure_limit, psize, pprice, bid, trailing_price_bundle
+    )
+    orders = trailing_orders.select(trailing, grid)
+    orders.set((bot_params.wallet_exposure_limit == 0.0) | (state_params.balance <= 0.0), 0.0, 0.0, OrderType.Default)
+    return orders
+
+def calc_entries_long_batch(exchange_params, state_params, bot_params_list, position, trailing_price_bundle, max_orders: int = 500) -> Ladder:
+    """calc_entries_long() for every BotParams of bot_params_list"""
+    n = len(bot_params_list)
+    bot_params = stack_bot_params(bot_params_list)
+    qty = np.zeros((n, max_orders))
+    price = np.zeros((n, max_orders))
+    order_type = np.zeros((n, max_orders), dtype=int)
+    count = np.zeros(n, dtype=int)
+    psize = np.full(n, position.size, dtype=float)
+    pprice = np.full(n, position.price, dtype=float)
+    bid = np.full(n, state_params.order_book.bid, dtype=float)
+    trailing_types = [OrderType.EntryTrailingNormalLong.value, OrderType.EntryTrailingCroppedLong.value]
+    active = np.arange(n)
+    with np.errstate(all='ignore'):
+        for step in range(max_orders):
+            if len(active) == 0:
+                break
+            entry = calc_next_entry_long_batch(
+                exchange_params, state_params, take_bot_params(bot_params, active), psize[active], pprice[active], bid[active], trailing_price_bundle
+            )
+            stop = entry.qty == 0.0
+            if step > 0:
+                stop |= np.isin(entry.order_type, trailing_types) | (price[active, step - 1] == entry.price)
+            keep = ~stop
+            active = active[keep]
+            qty[active, step] = entry.qty[keep]
+            price[active, step] = entry.price[keep]
+            order_type[active, step] = entry.order_type[keep]
+            count[active] += 1
+            (psize[active], pprice[active]) = np_calc_new_psize_pprice(
+                psize[active], pprice[active], entry.qty[keep], entry.price[keep], exchange_params.qty_step
+            )
+            bid[active] = np.minimum(bid[active], entry.price[keep])
+    width = count.max() if n else 0
+    return Ladder(qty[:, :width], price[:, :width], order_type[:, :width], count)
+
+# Short entries
+
+def calc_grid_entry_short_batch(exchange_params, state_params, bot_params, wallet_exposure_limit, psize, pprice, ask):
+    ex = exchange_params
+    balance = state_params.balance
+    orders = BatchOrders(len(psize))
+    orders.stop((wallet_exposure_limit == 0.0) | (balance <= 0.0))
+    initial_entry_price = np.maximum(
+        ask, np_round_up(state_params.ema_bands.upper * (1.0 + bot_params.entry_initial_ema_dist), ex.price_step)
+    )
+    orders.stop(initial_entry_price <= ex.price_step)
+    initial_entry_qty = np_calc_initial_entry_qty(ex, bot_params, wallet_exposure_limit, balance, initial_entry_price)
+    position_size_abs = np.abs(psize)
+    orders.set(position_size_abs == 0.0, -initial_entry_qty, initial_entry_price, OrderType.EntryInitialNormalShort)
+    orders.set(
+        position_size_abs < initial_entry_qty * 0.8,
+        -np.maximum(np_calc_min_entry_qty(initial_entry_price, ex), np_round_dn(initial_entry_qty - position_size_abs, ex.qty_step)),
+        initial_entry_price,
+        OrderType.EntryInitialPartialShort,
+    )
+    wallet_exposure = np_calc_wallet_exposure(ex.c_mult, balance, position_size_abs, pprice)
+    orders.stop(wallet_exposure >= wallet_exposure_limit * 0.999)
+    reentry_price = np_calc_reentry_price_ask(pprice, wallet_exposure, ask, ex, bot_params, wallet_exposure_limit)
+    orders.stop(reentry_price <= 0.0)
+    reentry_qty = np.maximum(
+        np_calc_reentry_qty(reentry_price, balance, position_size_abs, ex, bot_params, wallet_exposure_limit), initial_entry_qty
+    )
+    (wallet_exposure_if_filled, reentry_qty_cropped) = np_calc_cropped_reentry_qty(
+        ex, wallet_exposure_limit, psize, pprice, wallet_exposure, balance, reentry_qty, reentry_price
+    )
+    orders.set(reentry_qty_cropped < reentry_qty, -reentry_qty_cropped, reentry_price, OrderType.EntryGridCroppedShort)
+    (psize_if_filled, pprice_if_filled) = np_calc_new_psize_pprice(position_size_abs, pprice, reentry_qty, reentry_price, ex.qty_step)
+    next_reentry_price = np_calc_reentry_price_ask(pprice_if_filled, wallet_exposure_if_filled, ask, ex, bot_params, wallet_exposure_limit)
+    next_reentry_qty = np.maximum(
+        np_calc_reentry_qty(next_reentry_price, balance, psize_if_filled, ex, bot_params, wallet_exposure_limit), initial_entry_qty
+    )
+    (_, next_reentry_qty_cropped) = np_calc_cropped_reentry_qty(
+        ex, wallet_exposure_limit, psize_if_filled, pprice_if_filled, wallet_exposure_if_filled, balance, next_reentry_qty, next_reentry_price
+    )
+    effective_double_down_factor = np.where(psize_if_filled != 0, next_reentry_qty_cropped / psize_if_filled, 0.0)
+    new_entry_qty = np_interpolate(
+        wallet_exposure_limit, wallet_exposure, wallet_exposure_if_filled, position_size_abs, position_size_abs + reentry_qty
+    ) - position_size_abs
+    orders.set(
+        effective_double_down_factor < bot_params.entry_grid_double_down_factor * 0.25,
+        -np_round_(new_entry_qty, ex.qty_step),
+        reentry_price,
+        OrderType.EntryGridInflatedShort,
+    )
+    orders.set(True, -reentry_qty, reentry_price, OrderType.EntryGridNormalShort)
+    return orders
+
+def calc_trailing_entry_short_batch(exchange_params, state_params, bot_params, wallet_exposure_limit, psize, pprice, ask, trailing_price_bundle):
+    ex = exchange_params
+    tpb = trailing_price_bundle
+    balance = state_params.balance
+    orders = BatchOrders(len(psize))
+    initial_entry_price = np.maximum(
+        ask, np_round_up(state_params.ema_bands.upper * (1.0 + bot_params.entry_initial_ema_dist), ex.price_step)
+    )
+    orders.stop(initial_entry_price <= ex.price_step)
+    initial_entry_qty = np_calc_initial_entry_qty(ex, bot_params, wallet_exposure_limit, balance, initial_entry_price)
+    position_size_abs = np.abs(psize)
+    orders.set(position_size_abs == 0.0, -initial_entry_qty, initial_entry_price, OrderType.EntryInitialNormalShort)
+    orders.set(
+        position_size_abs < initial_entry_qty * 0.8,
+        -np.maximum(np_calc_min_entry_qty(initial_entry_price, ex), np_round_dn(initial_entry_qty - position_size_abs, ex.qty_step)),
+        initial_entry_price,
+        OrderType.EntryInitialPartialShort,
+    )
+    wallet_exposure = np_calc_wallet_exposure(ex.c_mult, balance, position_size_abs, pprice)
+    orders.stop(wallet_exposure > wallet_exposure_limit * 0.999)
+    threshold = bot_params.entry_trailing_threshold_pct
+    retracement = bot_params.entry_trailing_retracement_pct
+    pulled_back = tpb.min_since_max < tpb.max_since_open * (1.0 - retracement)
+    entry_triggered = np.where(
+        threshold <= 0.0,
+        (retracement > 0.0) & pulled_back,
+        (retracement <= 0.0) | ((tpb.max_since_open > pprice * (1.0 + threshold)) & pulled_back),
+    )
+    reentry_price = np.where(
+        threshold <= 0.0,
+        ask,
+        np.where(
+            retracement <= 0.0,
+            np.maximum(ask, np_round_up(pprice * (1.0 + threshold), ex.price_step)),
+            np.maximum(ask, np_round_up(pprice * (1.0 + threshold - retracement), ex.price_step)),
+        ),
+    )
+    orders.set(~entry_triggered, 0.0, 0.0, OrderType.EntryTrailingNormalShort)
+    reentry_qty = np.maximum(
+        np_calc_reentry_qty(reentry_price, balance, position_size_abs, ex, bot_params, wallet_exposure_limit), initial_entry_qty
+    )
+    (_, reentry_qty_cropped) = np_calc_cropped_reentry_qty(
+        ex, wallet_exposure_limit, psize, pprice, wallet_exposure, balance, reentry_qty, reentry_price
+    )
+    orders.set(reentry_qty_cropped < reentry_qty, -reentry_qty_cropped, reentry_price, OrderType.EntryTrailingCroppedShort)
+    orders.set(True, -reentry_qty, reentry_price, OrderType.EntryTrailingNormalShort)
+    return orders
+
+def calc_next_entry_short_batch(exchange_params, state_params, bot_params, psize, pprice, ask, trailing_price_bundle):
+    wallet_exposure = np_calc_wallet_exposure(exchange_params.c_mult, state_params.balance, np.abs(psize), pprice)
+    (trailing, wallet_exposure_limit) = trailing_entry_ratio_mode(bot_params, wallet_exposure)
+    grid = calc_grid_entry_short_batch(exchange_params, state_params, bot_params, wallet_exposure_limit, psize, pprice, ask)
+    trailing_orders = calc_trailing_entry_short_batch(
+        exchange_params, state_params, bot_params, wallet_exposure_limit, psize, pprice, ask, trailing_price_bundle
+    )
+    orders = trailing_orders.select(trailing, grid)
+    orders.set((bot_params.wallet_exposure_limit == 0.0) | (state_params.balance <= 0.0), 0.0, 0.0, OrderType.Default)
+    return orders
+
+def calc_entries_short_batch(exchange_params, state_params, bot_params_list, position, trailing_price_bundle, max_orders: int = 500) -> Ladder:
+    """calc_entries_short() for every BotParams of bot_params_list"""
+    n = len(bot_params_list)
+    bot_params = stack_bot_params(bot_params_list)
+    qty = np.zeros((n, max_orders))
+    price = np.zeros((n, max_orders))
+    order_type = np.zeros((n, max_orders), dtype=int)
+    count = np.zeros(n, dtype=int)
+    psize = np.full(n, position.size, dtype=float)
+    pprice = np.full(n, position.price, dtype=float)
+    ask = np.full(n, state_params.order_book.ask, dtype=float)
+    trailing_types = [OrderType.EntryTrailingNormalShort.value, OrderType.EntryTrailingCroppedShort.value]
+    active = np.arange(n)
+    with np.errstate(all='ignore'):
+        for step in range(max_orders):
+            if len(active) == 0:
+                break
+            entry = calc_next_entry_short_batch(
+                exchange_params, state_params, take_bot_params(bot_params, active), psize[active], pprice[active], ask[active], trailing_price_bundle
+            )
+            stop = entry.qty == 0.0
+            if step > 0:
+                stop |= np.isin(entry.order_type, trailing_types) | (price[active, step - 1] == entry.price)
+            keep = ~stop
+            active = active[keep]
+            qty[active, step] = entry.qty[keep]
+            price[active, step] = entry.price[keep]
+            order_type[active, step] = entry.order_type[keep]
+            count[active] += 1
+            (psize[active], pprice[active]) = np_calc_new_psize_pprice(
+                psize[active], pprice[active], entry.qty[keep], entry.price[keep], exchange_params.qty_step
+            )
+            ask[active] = np.maximum(ask[active], entry.price[keep])
+    width = count.max() if n else 0
+    return Ladder(qty[:, :width], price[:, :width], order_type[:, :width], count)
+
+# Long closes
+
+def calc_grid_close_long_batch(exchange_params, state_params, bot_params, psize, pprice, ask):
+    ex = exchange_params
+    balance = state_params.balance
+    min_markup = bot_params.close_grid_min_markup
+    markup_range = bot_params.close_grid_markup_range
+    qty_pct = bot_params.close_grid_qty_pct
+    orders = BatchOrders(len(psize))
+    orders.stop(psize <= 0.0)
+    full_close_qty = -np_round_(psize, ex.qty_step)
+    close_prices_start = np_round_up(pprice * (1.0 + min_markup), ex.price_step)
+    orders.set(
+        (markup_range <= 0.0) | (qty_pct < 0.0) | (qty_pct >= 1.0),
+        full_close_qty,
+        np.maximum(ask, close_prices_start),
+        OrderType.CloseGridLong,
+    )
+    close_prices_end = np_round_up(pprice * (1.0 + min_markup + markup_range), ex.price_step)
+    orders.set(close_prices_start == close_prices_end, full_close_qty, np.maximum(ask, close_prices_start), OrderType.CloseGridLong)
+    n_steps = np.ceil((close_prices_end - close_prices_start) / ex.price_step)
+    close_grid_qty_pct_modified = np.maximum(qty_pct, 1.0 / n_steps)
+    wallet_exposure = np_calc_wallet_exposure(ex.c_mult, balance, psize, pprice)
+    wallet_exposure_ratio = np.minimum(1.0, wallet_exposure / bot_params.wallet_exposure_limit)
+    close_price = np.maximum(
+        np_round_up(pprice * (1.0 + min_markup + markup_range * (1.0 - wallet_exposure_ratio)), ex.price_step),
+        ask,
+    )
+    close_qty = -np_calc_close_qty(ex, bot_params.wallet_exposure_limit, psize, pprice, close_grid_qty_pct_modified, balance, close_price)
+    orders.set(True, close_qty, close_price, OrderType.CloseGridLong)
+    return orders
+
+def calc_trailing_close_long_batch(exchange_params, state_params, bot_params, psize, pprice, ask, trailing_price_bundle):
+    ex = exchange_params
+    tpb = trailing_price_bundle
+    balance = state_params.balance
+    orders = BatchOrders(len(psize))
+    orders.stop(psize == 0.0)
+    threshold = bot_params.close_trailing_threshold_pct
+    retracement = bot_params.close_trailing_retracement_pct
+    pulled_back = tpb.min_since_max < tpb.max_since_open * (1.0 - retracement)
+    triggered = np.where(
+        threshold <= 0.0,
+        (retracement > 0.0) & pulled_back,
+        (retracement <= 0.0) | ((tpb.max_since_open > pprice * (1.0 + threshold)) & pulled_back),
+    )
+    close_price = np.where(
+        threshold <= 0.0,
+        ask,
+        np.where(
+            retracement <= 0.0,
+            np.maximum(ask, np_round_up(pprice * (1.0 + threshold), ex.price_step)),
+            np.maximum(ask, np_round_up(pprice * (1.0 + threshold - retracement), ex.price_step)),
+        ),
+    )
+    orders.set(~triggered, 0.0, 0.0, OrderType.CloseTrailingLong)
+    close_qty = -np_calc_close_qty(ex, bot_params.wallet_exposure_limit, psize, pprice, bot_params.close_trailing_qty_pct, balance, close_price)
+    orders.set(True, close_qty, close_price, OrderType.CloseTrailingLong)
+    return orders
+
+def calc_next_close_long_batch(exchange_params, state_params, bot_params, psize, pprice, ask, trailing_price_bundle):
+    wallet_exposure = np_calc_wallet_exposure(exchange_params.c_mult, state_params.balance, psize, pprice)
+    (trailing, size) = trailing_close_ratio_mode(exchange_params, bot_params, state_params.balance, psize, pprice, wallet_exposure)
+    grid = calc_grid_close_long_batch(exchange_params, state_params, bot_params, size, pprice, ask)
+    trailing_orders = calc_trailing_close_long_batch(exchange_params, state_params, bot_params, size, pprice, ask, trailing_price_bundle)
+    orders = trailing_orders.select(trailing, grid)
+    orders.set(psize == 0.0, 0.0, 0.0, OrderType.Default)
+    return orders
+
+def calc_closes_long_batch(exchange_params, state_params, bot_params_list, position, trailing_price_bundle, max_orders: int = 500) -> Ladder:
+    """calc_closes_long() for every BotParams of bot_params_list"""
+    return calc_closes_batch(
+        exchange_params, state_params, bot_params_list, position, trailing_price_bundle, max_orders,
+        calc_next_close_long_batch, state_params.order_book.ask, np.maximum, OrderType.CloseTrailingLong,
+    )
+
+# Short closes
+
+def calc_grid_close_short_batch(exchange_params, state_params, bot_params, psize, pprice, bid):
+    ex = exchange_params
+    balance = state_params.balance
+    min_markup = bot_params.close_grid_min_markup
+    markup_range = bot_params.close_grid_markup_range
+    qty_pct = bot_params.close_grid_qty_pct
+    position_size_abs = np.abs(psize)
+    orders = BatchOrders(len(psize))
+    orders.stop(position_size_abs == 0.0)
+    full_close_qty = np_round_(position_size_abs, ex.qty_step)
+    close_prices_start = np_round_dn(pprice * (1.0 - min_markup), ex.price_step)
+    orders.set(
+        (markup_range <= 0.0) | (qty_pct < 0.0) | (qty_pct >= 1.0),
+        full_close_qty,
+        np.minimum(bid, close_prices_start),
+        OrderType.CloseGridShort,
+    )
+    close_prices_end = np_round_dn(pprice * (1.0 - min_markup - markup_range), ex.price_step)
+    orders.set(close_prices_start == close_prices_end, full_close_qty, np.minimum(bid, close_prices_start), OrderType.CloseGridShort)
+    n_steps = np.ceil((close_prices_start - close_prices_end) / ex.price_step)
+    close_grid_qty_pct_modified = np.maximum(qty_pct, 1.0 / n_steps)
+    wallet_exposure = np_calc_wallet_exposure(ex.c_mult, balance, position_size_abs, pprice)
+    wallet_exposure_ratio = np.minimum(1.0, wallet_exposure / bot_params.wallet_exposure_limit)
+    close_price = np.minimum(
+        np_round_dn(pprice * (1.0 - min_markup - markup_range * (1.0 - wallet_exposure_ratio)), ex.price_step),
+        bid,
+    )
+    close_qty = np_calc_close_qty(ex, bot_params.wallet_exposure_limit, psize, pprice, close_grid_qty_pct_modified, balance, close_price)
+    orders.set(True, close_qty, close_price, OrderType.CloseGridShort)
+    return orders
+
+def calc_trailing_close_short_batch(exchange_params, state_params, bot_params, psize, pprice, bid, trailing_price_bundle):
+    ex = exchange_params
+    tpb = trailing_price_bundle
+    balance = state_params.balance
+    orders = BatchOrders(len(psize))
+    orders.stop(psize == 0.0)
+    threshold = bot_params.close_trailing_threshold_pct
+    retracement = bot_params.close_trailing_retracement_pct
+    bounced = tpb.max_since_min > tpb.min_since_open * (1.0 + retracement)
+    triggered = np.where(
+        threshold <= 0.0,
+        (retracement > 0.0) & bounced,
+        (retracement <= 0.0) | ((tpb.min_since_open < pprice * (1.0 - threshold)) & bounced),
+    )
+    close_price = np.where(
+        threshold <= 0.0,
+        bid,
+        np.where(
+            retracement <= 0.0,
+            np.minimum(bid, np_round_dn(pprice * (1.0 - threshold), ex.price_step)),
+            np.minimum(bid, np_round_dn(pprice * (1.0 - threshold + retracement), ex.price_step)),
+        ),
+    )
+    orders.set(~triggered, 0.0, 0.0, OrderType.CloseTrailingShort)
+    close_qty = np_calc_close_qty(ex, bot_params.wallet_exposure_limit, psize, pprice, bot_params.close_trailing_qty_pct, balance, close_price)
+    orders.set(True, close_qty, close_price, OrderType.CloseTrailingShort)
+    return orders
+
+def calc_next_close_short_batch(exchange_params, state_params, bot_params, psize, pprice, bid, trailing_price_bundle):
+    wallet_exposure = np_calc_wallet_exposure(exchange_params.c_mult, state_params.balance, np.abs(psize), pprice)
+    (trailing, size) = trailing_close_ratio_mode(exchange_params, bot_params, state_params.balance, psize, pprice, wallet_exposure)
+    grid = calc_grid_close_short_batch(exchange_params, state_params, bot_params, size, pprice, bid)
+    trailing_orders = calc_trailing_close_short_batch(exchange_params, state_params, bot_params, size, pprice, bid, trailing_price_bundle)
+    orders = trailing_orders.select(trailing, grid)
+    orders.set(psize == 0.0, 0.0, 0.0, OrderType.Default)
+    return orders
+
+def calc_closes_short_batch(exchange_params, state_params, bot_params_list, position, trailing_price_bundle, max_orders: int = 500) -> Ladder:
+    """calc_closes_short() for every BotParams of bot_params_list"""
+    return calc_closes_batch(
+        exchange_params, state_params, bot_params_list, position, trailing_price_bundle, max_orders,
+        calc_next_close_short_batch, state_params.order_book.bid, np.minimum, OrderType.CloseTrailingShort,
+    )
+
+def calc_closes_batch(exchange_params, state_params, bot_params_list, position, trailing_price_bundle, max_orders, next_close, book_price, towards, trailing_type):
+    # Closes at the same price are merged into the previous close, so rows fill at different speeds
+    n = len(bot_params_list)
+    bot_params = stack_bot_params(bot_params_list)
+    qty = np.zeros((n, max_orders))
+    price = np.zeros((n, max_orders))
+    order_type = np.zeros((n, max_orders), dtype=int)
+    count = np.zeros(n, dtype=int)
+    psize = np.full(n, position.size, dtype=float)
+    pprice = np.full(n, position.price, dtype=float)
+    book = np.full(n, book_price, dtype=float)
+    active = np.arange(n)
+    with np.errstate(all='ignore'):
+        for _ in range(max_orders):
+            if len(active) == 0:
+                break
+            close = next_close(
+                exchange_params, state_params, take_bot_params(bot_params, active), psize[active], pprice[active], book[active], trailing_price_bundle
+            )
+            keep = close.qty != 0.0
+            active = active[keep]
+            close_qty = close.qty[keep]
+            close_price = close.price[keep]
+            close_type = close.order_type[keep]
+            psize[active] = np_round_(psize[active] + close_qty, exchange_params.qty_step)
+            book[active] = towards(book[active], close_price)
+            last = np.maximum(count[active] - 1, 0)
+            has_closes = count[active] > 0
+            trailing = has_closes & (close_type == trailing_type.value)
+            merge = has_closes & ~trailing & (price[active, last] == close_price)
+            rows = active[merge]
+            qty[rows, last[merge]] = np_round_(qty[rows, last[merge]] + close_qty[merge], exchange_params.qty_step)
+            price[rows, last[merge]] = close_price[merge]
+            order_type[rows, last[merge]] = close_type[merge]
+            rows = active[~merge]
+            columns = count[rows]
+            qty[rows, columns] = close_qty[~merge]
+            price[rows, columns] = close_price[~merge]
+            order_type[rows, columns] = close_type[~merge]
+            count[rows] += 1
+            active = active[~trailing]
+    width = count.max() if n else 0
+    return Ladder(qty[:, :width], price[:, :width], order_type[:, :width], count)
+
+# ----------------------------
+# Parameter Sweep
+# ----------------------------
+
+SWEEP_FIELDS = [f.name for f in fields(BotParams) if f.name != "n_positions"]
+SWEEP_METRICS = ("Total Wallet Exposure", "Grid Depth %", "Average Entry")
+
+def calc_sweep_metrics(exchange_params, state_params, bot_params_list, position, trailing_price_bundle, side: Side):
+    """Total wallet exposure, grid depth in % and average entry price of the full entry ladder of every BotParams"""
+    if side == Side.Long:
+        ladder = calc_entries_long_batch(exchange_params, state_params, bot_params_list, position, trailing_price_bundle)
+    else:
+        ladder = calc_entries_short_batch(exchange_params, state_params, bot_params_list, position, trailing_price_bundle)
+    qty = np.abs(ladder.qty)
+    size = abs(position.size) + qty.sum(axis=1)
+    cost = abs(position.size) * position.price + (qty * ladder.price).sum(axis=1)
+    with np.errstate(all='ignore'):
+        average_entry = np.where(size > 0.0, cost / size, 0.0)
+        wallet_exposure = cost * exchange_params.c_mult / state_params.balance if state_params.balance > 0.0 else np.zeros(len(size))
+        rows = np.arange(len(size))
+        first = ladder.price[:, 0] if ladder.price.shape[1] else np.zeros(len(size))
+        last = ladder.price[rows, np.maximum(ladder.count - 1, 0)] if ladder.price.shape[1] else np.zeros(len(size))
+        depth = np.where((ladder.count > 0) & (first > 0.0), np.abs(first - last) / first * 100, 0.0)
+    return np.stack([wallet_exposure, depth, average_entry], axis=1)
+
+@dataclass
+class SweepJob:
+    x_field: str
+    x_values: list
+    y_field: str
+    y_values: list
+    keys: list
+    missing: list
+    future: object = None
+
+class GridSweep:
+    """Parameter sweeps for the grid visualizer, computed in a worker process
+
+    Results are memoized per parameter set, so a sweep only computes the
+    cells that are not known from an earlier sweep with the same market
+    state. The worker is a spawned process, streamlit keeps running while
+    it computes.
+    """
+    def __init__(self, max_cells: int = 500000):
+        self.max_cells = max_cells
+        self.cache = {}
+        self.executor = None
+        self.lock = Lock()
+
+    def submit(self, exchange_params, state_params, bot_params, position, trailing_price_bundle, side: Side, x_field: str, x_values: list, y_field: str, y_values: list) -> SweepJob:
+        context = (astuple(exchange_params), astuple(state_params), astuple(position), astuple(trailing_price_bundle), side.value)
+        bot_params_list = [replace(bot_params, **{x_field: x, y_field: y}) for y in y_values for x in x_values]
+        keys = [(context, astuple(bp)) for bp in bot_params_list]
+        with self.lock:
+            missing = {key: bp for key, bp in zip(keys, bot_params_list) if key not in self.cache}
+        job = SweepJob(x_field, list(x_values), y_field, list(y_values), keys, list(missing))
+        if missing:
+            if not self.executor:
+                self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+            job.future = self.executor.submit(
+                calc_sweep_metrics, exchange_params, state_params, list(missing.values()), position, trailing_price_bundle, side
+            )
+        return job
+
+    def result(self, job: SweepJob):
+        """Metrics of the job as an array of shape (len(y_values), len(x_values), len(SWEEP_METRICS)), waits for the worker"""
+        if job.future:
+            metrics = job.future.result()
+            with self.lock:
+                for key, values in zip(job.missing, metrics):
+                    self.cache[key] = values
+                while len(self.cache) > self.max_cells:
+                    self.cache.pop(next(iter(self.cache)))
+            job.future = None
+            # Still there if the cache just dropped some of them
+            computed = dict(zip(job.missing, metrics))
+        else:
+            computed = {}
+        with self.lock:
+            values = [computed[key] if key in computed else self.cache[key] for key in job.keys]
+        return np.array(values).reshape(len(job.y_values), len(job.x_values), len(SWEEP_METRICS))
+
+grid_sweep = GridSweep()
+
+# ----------------------------
+# Ladder Cache
+# ----------------------------
+
+class LadderCache:
+    """LRU cache of calculated ladders, shared by all sessions of the streamlit server
+
+    Keys are the dataclass tuples of the inputs, ladders of several BotParams
+    that are not cached yet are calculated together with the batch functions.
+    """
+    LADDERS = {
+        "entries_long": calc_entries_long_batch,
+        "entries_short": calc_entries_short_batch,
+        "closes_long": calc_closes_long_batch,
+        "closes_short": calc_closes_short_batch,
+    }
+
+    def __init__(self, max_size: int = 2000):
+        self.max_size = max_size
+        self.ladders = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, kind: str, exchange_params, state_params, bot_params_list, position, trailing_price_bundle) -> list:
+        """Returns a new list of Order for every BotParams of bot_params_list"""
+        context = (kind, astuple(exchange_params), astuple(state_params), astuple(position), astuple(trailing_price_bundle))
+        keys = [(context, astuple(bp)) for bp in bot_params_list]
+        with self.lock:
+            found = {}
+            for key in keys:
+                if key in self.ladders:
+                    self.ladders.move_to_end(key)
+                    found[key] = self.ladders[key]
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        missing = {key: bp for key, bp in zip(keys, bot_params_list) if key not in found}
+        if missing:
+            ladder = self.LADDERS[kind](exchange_params, state_params, list(missing.values()), position, trailing_price_bundle)
+            with self.lock:
+                for index, key in enumerate(missing):
+                    orders = tuple(zip(ladder.qty[index, :ladder.count[index]].tolist(), ladder.price[index, :ladder.count[index]].tolist(), ladder.order_type[index, :ladder.count[index]].tolist()))
+                    found[key] = orders
+                    self.ladders[key] = orders
+                while len(self.ladders) > self.max_size:
+                    self.ladders.popitem(last=False)
+        # Callers modify the orders, so every call gets its own
+        return [[Order(qty, price, OrderType(order_type)) for qty, price, order_type in found[key]] for key in keys]
+
+    def clear(self):
+        with self.lock:
+            self.ladders.clear()
+            self.hits = 0
+            self.misses = 0
+
+ladder_cache = LadderCache()
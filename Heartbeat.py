@@ -0,0 +1,201 @@
+"""
+Heartbeat of a PBRemote server, replaces the series of alive_<ts>.cmd.gz files.
+
+alive.hb is one rolling object, rewritten every minute. It starts with a
+struct packed header, so the timestamp can be read without parsing the body,
+followed by a zlib compressed json body with the system info and the monitor
+section. The monitor section is a delta against alive_base.hb, a full monitor
+snapshot that is only rewritten every rebase_interval seconds: instances whose
+counters changed are sent in full, the others only with memory and cpu.
+"""
+import os
+import glob
+import gzip
+import json
+import zlib
+import struct
+from pathlib import Path
+from threading import Lock
+
+MAGIC = b'PBHB'
+VERSION = 1
+FULL = 1
+# magic, version, flags, seq, timestamp, base timestamp
+HEADER = struct.Struct('<4sBBIqq')
+ALIVE = "alive.hb"
+ALIVE_BASE = "alive_base.hb"
+# values that change all the time and are not counted as a change
+VITALS = ("m", "c")
+
+def monitor_key(monitor: dict):
+    return f'{monitor.get("p")}:{monitor.get("u")}'
+
+def counters(monitor: dict):
+    return {key: value for key, value in monitor.items() if key not in VITALS}
+
+def encode(flags: int, seq: int, timestamp: int, base_ts: int, body: dict):
+    return HEADER.pack(MAGIC, VERSION, flags, seq, timestamp, base_ts) + zlib.compress(json.dumps(body, separators=(',', ':')).encode(), 9)
+
+def decode_header(data: bytes):
+    """Returns (flags, seq, timestamp, base_ts)"""
+    if len(data) < HEADER.size:
+        raise ValueError("heartbeat too short")
+    magic, version, flags, seq, timestamp, base_ts = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("no heartbeat")
+    if version != VERSION:
+        raise ValueError(f'unsupported heartbeat version {version}')
+    return flags, seq, timestamp, base_ts
+
+def decode(data: bytes):
+    """Returns (flags, seq, timestamp, base_ts, body)"""
+    header = decode_header(data)
+    return header + (json.loads(zlib.decompress(data[HEADER.size:])),)
+
+def write_file(file: Path, data: bytes):
+    tmp = Path(f'{file.parent}/.{file.name}.tmp')
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, file)
+
+class HeartbeatWriter():
+    def __init__(self, path: str, rebase_interval: int = 3600):
+        self.path = path
+        self.rebase_interval = rebase_interval
+        self.seq = 0
+        self.base = None
+        self.base_ts = 0
+
+    def write(self, timestamp: int, system: dict, monitor: list):
+        records = {monitor_key(record): record for record in monitor}
+        self.seq += 1
+        if self.base is None or timestamp - self.base_ts >= self.rebase_interval:
+            self.base = {key: counters(record) for key, record in records.items()}
+            self.base_ts = timestamp
+            write_file(Path(f'{self.path}/{ALIVE_BASE}'), encode(FULL, self.seq, timestamp, timestamp, {"monitor": records}))
+        changed = {}
+        vitals = {}
+        for key, record in records.items():
+            if self.base.get(key) == counters(record):
+                vitals[key] = [record.get(vital) for vital in VITALS]
+            else:
+                changed[key] = record
+        removed = [key for key in self.base if key not in records]
+        body = ({
+            "system": system,
+            "monitor": {"set": changed, "vitals": vitals, "del": removed}})
+        write_file(Path(f'{self.path}/{ALIVE}'), encode(0, self.seq, timestamp, self.base_ts, body))
+
+class HeartbeatReader():
+    def __init__(self, path: str):
+        self.path = path
+        self.base = {}
+        self.base_ts = None
+
+    def exists(self):
+        return Path(f'{self.path}/{ALIVE}').exists()
+
+    def load_base(self, base_ts: int):
+        file = Path(f'{self.path}/{ALIVE_BASE}')
+        if not file.exists():
+            return
+        flags, seq, timestamp, ts, body = decode(file.read_bytes())
+        # The base may not be synced yet, keep the old one until it is
+        if timestamp == base_ts:
+            self.base = body["monitor"]
+            self.base_ts = base_ts
+
+    def read(self):
+        """Returns the heartbeat in the layout of the old alive files, None while its base is not synced"""
+        flags, seq, timestamp, base_ts, body = decode(Path(f'{self.path}/{ALIVE}').read_bytes())
+        if base_ts != self.base_ts:
+            self.load_base(base_ts)
+            if base_ts != self.base_ts:
+                # The delta only applies to its own base
+                return None
+        monitor = body["monitor"]
+        records = {}
+        for key, record in self.base.items():
+            if key in monitor["del"]:
+                continue
+            record = dict(record)
+            if key in monitor["vitals"]:
+                record.update(zip(VITALS, monitor["vitals"][key]))
+            records[key] = record
+        records.update(monitor["set"])
+        cfg = dict(body["system"])
+        cfg["timestamp"] = timestamp
+        cfg["monitor"] = list(records.values())
+        return cfg
+
+def stamp(file: str):
+    try:
+        st = os.stat(file)
+        return st.st_mtime_ns, st.st_size
+    except FileNotFoundError:
+        return None
+
+def read_legacy(path: str):
+    """Newest readable alive_<ts>.cmd(.gz) of servers that do not write a heartbeat yet"""
+    alive_remote = glob.glob(str(Path(f'{path}/alive_*.cmd*')))
+    alive_remote.sort()
+    while len(alive_remote) > 0:
+        remote = Path(alive_remote.pop())
+        try:
+            if str(remote).endswith('.gz'):
+                with gzip.open(remote, "rt", encoding='utf-8') as f:
+                    return json.load(f)
+            else:
+                with open(remote, "r", encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f'{str(remote)} is corrupted {e}')
+    return None
+
+class HeartbeatCache():
+    """Parsed heartbeats of all servers, shared by every RemoteServer of the process
+
+    A heartbeat is only read again when the (mtime, size) of its files changed,
+    so loading unchanged servers costs a stat per file.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.lock = Lock()
+
+    def key(self, path: str):
+        alive = stamp(f'{path}/{ALIVE}')
+        if alive:
+            return alive, stamp(f'{path}/{ALIVE_BASE}')
+        legacy = glob.glob(str(Path(f'{path}/alive_*.cmd*')))
+        if legacy:
+            newest = max(legacy)
+            return newest, stamp(newest)
+        return None
+
+    def load(self, path: str):
+        """Returns the heartbeat of the server in path in the layout of the old alive files or None"""
+        key = self.key(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and entry[0] == key:
+                return entry[1]
+            reader = entry[2] if entry else HeartbeatReader(path)
+        cfg = None
+        if reader.exists():
+            try:
+                cfg = reader.read()
+            except Exception as e:
+                print(f'{path}/{ALIVE} is corrupted {e}')
+        if cfg is None and entry:
+            cfg = entry[1]
+        if cfg is None:
+            cfg = read_legacy(path)
+        with self.lock:
+            self.entries[path] = (key, cfg, reader)
+        return cfg
+
+    def forget(self, path: str):
+        with self.lock:
+            self.entries.pop(path, None)
+
+heartbeats = HeartbeatCache()
@@ -596,8 +596,6 @@ class Instance(Base):
         file = Path(f'{self._instance_path}/trades.json')
         file_lft = Path(f'{self._instance_path}/last_fetch_trades.json')
         trades = []
-        save = False
-        ltrades = 0
         since = 1577840461000
         if file_lft.exists():
             try:
@@ -610,25 +608,52 @@ class Instance(Base):
             try:
                 with open(file, "r", encoding='utf-8') as f:
                     trades = json.load(f)
-                    ltrades = len(trades)
                 if type(trades[-1]["timestamp"]) == int:
                     since = trades[-1]["timestamp"]
             except Exception as e:
                 print(f'{str(file)} is corrupted {e}')
         now = self.fetch_timestamp()
-        new_trades = self._exchange.fetch_trades(self.symbol_ccxt, self._market_type, since)
-        if new_trades:
-            for trade in new_trades:
-                if not any(trade["id"] in sub["id"] for sub in trades):
-                    trades.append(trade)
-                    save = True
+        ids = {trade["id"] for trade in trades}
+        new_trades = []
+        for page in self._exchange.iter_trades(self.symbol_ccxt, self._market_type, since):
+            for trade in page:
+                if trade["id"] not in ids:
+                    ids.add(trade["id"])
+                    new_trades.append(trade)
+        new_trades.sort(key=lambda d: d['timestamp'])
         since = now
         with open(file_lft, "w", encoding='utf-8') as f:
             json.dump(since, f, indent=4)
-        if save:
-            with open(file, "w", encoding='utf-8') as f:
-                json.dump(trades, f, indent=4)
-                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} {self.user} {self.symbol} Fetched {len(trades) - ltrades} trades')
+        if new_trades:
+            self.write_trades(file, trades, new_trades)
+            print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} {self.user} {self.symbol} Fetched {len(new_trades)} trades')
+
+    @staticmethod
+    def write_trades(file: Path, trades: list, new_trades: list, chunk: int = 1000):
+        """Append new_trades to the trades in file, written like json.dump(indent=4) but only the new trades in chunks"""
+        tail = b""
+        if trades:
+            with open(file, "rb") as f:
+                f.seek(-2, 2)
+                tail = f.read()
+        if tail == b"\n]":
+            f = open(file, "r+b")
+            f.seek(-2, 2)
+            sep = b",\n"
+        else:
+            # New or foreign formatted file, write all trades
+            new_trades = trades + new_trades
+            f = open(file, "wb")
+            f.write(b"[")
+            sep = b"\n"
+        with f:
+            for start in range(0, len(new_trades), chunk):
+                data = []
+                for trade in new_trades[start:start + chunk]:
+                    data.append(sep + ("    " + json.dumps(trade, indent=4).replace("\n", "\n    ")).encode())
+                    sep = b",\n"
+                f.write(b"".join(data))
+            f.write(b"\n]" if new_trades else b"]")
 
     def save_trades(self, trades : json):
         if trades:
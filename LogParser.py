@@ -0,0 +1,88 @@
+"""
+Line classifier for passivbot.log, used by the PBRun Monitor.
+
+Run it directly to benchmark classify and the Monitor parser on real logs:
+    python LogParser.py path/to/passivbot.log [...]
+"""
+import re
+import sys
+from time import time, mktime, perf_counter
+from datetime import date, timedelta
+
+# Line classes
+OTHER = 0
+ERROR = 1
+INFO = 2
+TRACEBACK = 3
+
+# 2024-01-31T12:00:00 INFO ... , group 1 is the date
+HEADER = re.compile(r'\s*(\d{4}-\d\d-\d\d)T\d\d:\d\d:\d\d\s+(?:ERROR|INFO)(?:\s|$)')
+
+def classify(line: str):
+    """Return (class, date) of a line, date is the ISO date of a header or None"""
+    # fast path, lines without a keyword are only traceback continuations
+    if "ERROR" in line:
+        kind = ERROR
+    elif "INFO" in line:
+        kind = INFO
+    elif "Traceback" in line:
+        kind = TRACEBACK
+    else:
+        return OTHER, None
+    header = HEADER.match(line)
+    return kind, header.group(1) if header else None
+
+def new_pnl(line: str):
+    """Return (pnl, count) of a 'new pnl' line or None"""
+    elements = line.split()
+    if len(elements) == 7:
+        return float(elements[5]), int(elements[2])
+    return None
+
+def balance_change(line: str):
+    """Return the difference of a 'balance old -> new' line or None"""
+    elements = line.split()
+    if len(elements) == 6 and elements[4] == "->":
+        return float(elements[5]) - float(elements[3])
+    return None
+
+class DayBoundary():
+    """Local dates of today and yesterday, only recalculated after midnight
+
+    ISO dates compare like the timestamps they stand for, so log lines can be
+    sorted into today/yesterday without parsing their timestamp.
+    """
+    def __init__(self):
+        self.today = None
+        self.yesterday = None
+        self.today_ts = 0
+        self.next_ts = 0
+        self.refresh()
+
+    def refresh(self):
+        if time() >= self.next_ts:
+            today = date.today()
+            self.today = today.isoformat()
+            self.yesterday = (today - timedelta(days=1)).isoformat()
+            self.today_ts = int(mktime(today.timetuple()))
+            self.next_ts = int(mktime((today + timedelta(days=1)).timetuple()))
+        return self
+
+def main():
+    from PBRun import Monitor
+    for logfile in sys.argv[1:]:
+        with open(logfile, "rb") as f:
+            lines = f.read().decode(errors="replace").splitlines()
+        start = perf_counter()
+        for line in lines:
+            classify(line)
+        elapsed = perf_counter() - start
+        print(f'{logfile}: classify {len(lines)} lines in {elapsed:.3f}s ({len(lines) / max(elapsed, 1e-9):.0f} lines/s)')
+        monitor = Monitor()
+        start = perf_counter()
+        monitor.parse_log(lines)
+        elapsed = perf_counter() - start
+        print(f'{logfile}: parse_log {len(lines)} lines in {elapsed:.3f}s ({len(lines) / max(elapsed, 1e-9):.0f} lines/s) errors: {monitor.errors_today}/{monitor.errors_yesterday} infos: {monitor.infos_today}/{monitor.infos_yesterday} tracebacks: {monitor.tracebacks_today}/{monitor.tracebacks_yesterday} pnl: {monitor.pnl_today}/{monitor.pnl_yesterday}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Rotation of the passivbot.log of the bots PBRun manages.
+
+Bots write passivbot.log through the stdout they inherited, so the log can
+not be renamed and reopened. The parsed head of the log is copied with
+copy_file_range, a reflink on filesystems that support it (xfs, btrfs) and a
+copy inside the kernel elsewhere, and then cut from the log with
+fallocate(FALLOC_FL_COLLAPSE_RANGE) on ext4 and xfs. Lines the bot appends
+meanwhile stay in the log and the monitor offset only moves by the cut size,
+so no line is lost or parsed twice. Elsewhere the whole log is copied and
+truncated like before, the monitor parses the copy up to its end first and
+restarts at offset 0.
+
+The copy becomes passivbot.log.old, the older ones are kept as
+passivbot.log.1.gz ... passivbot.log.<generations>.gz. Compressing is done by
+one background thread, one log after the other, so bots that rotate at the
+same time do not all write to the disk at once.
+"""
+import os
+import gzip
+import errno
+import ctypes
+import ctypes.util
+import shutil
+import platform
+import threading
+import traceback
+from queue import Queue
+from pathlib import Path
+from datetime import datetime
+from contextlib import nullcontext
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl from <linux/fs.h> and fallocate mode from <linux/falloc.h>
+FICLONE = 0x40049409
+FALLOC_FL_COLLAPSE_RANGE = 0x08
+
+def clone(src: Path, dst: Path, length: int = None):
+    """Copy the first length bytes of src to dst, all if None, without reading it into userspace where possible"""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if length is None and fcntl:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return
+            except OSError:
+                pass
+        remaining = length if length is not None else 1 << 62
+        if hasattr(os, "copy_file_range"):
+            try:
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, 1 << 30))
+                    if not copied:
+                        break
+                    remaining -= copied
+                return
+            except OSError:
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+                remaining = length if length is not None else 1 << 62
+        while remaining > 0:
+            data = fsrc.read(min(remaining, 1 << 20))
+            if not data:
+                break
+            fdst.write(data)
+            remaining -= len(data)
+
+def collapse(file: Path, length: int):
+    """Cut the first length bytes from file in place, returns 0 or the errno why it failed"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fallocate = libc.fallocate
+    except (OSError, AttributeError, TypeError):
+        return errno.EOPNOTSUPP
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+    with open(file, "r+b") as f:
+        if fallocate(f.fileno(), FALLOC_FL_COLLAPSE_RANGE, 0, length) == 0:
+            return 0
+        return ctypes.get_errno()
+
+class LogRotator():
+    def __init__(self, max_size: int = 10485760, generations: int = 5):
+        self.max_size = max_size
+        self.generations = generations
+        self.collapse = platform.system() == "Linux"
+        self.jobs = Queue()
+        self.pending = set()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def rotate(self, logfile: Path, monitor = None):
+        """Rotate logfile if it is too big, returns True if it was rotated"""
+        logfile = Path(logfile)
+        try:
+            if logfile.stat().st_size < self.max_size:
+                return False
+        except FileNotFoundError:
+            return False
+        rotated = Path(f'{logfile}.rotated')
+        if rotated.exists():
+            # The last rotation is not compressed yet or was interrupted by a restart
+            self.queue(logfile)
+            return False
+        if monitor is not None and (not monitor.path or monitor.log_lp is None):
+            monitor = None
+        with monitor.lock if monitor else nullcontext():
+            if monitor:
+                monitor.read_log()
+                parsed = monitor.log_lp
+            else:
+                parsed = logfile.stat().st_size
+            # Only whole blocks can be collapsed and the range must end before EOF, the rest stays in the log
+            stat = os.stat(logfile)
+            block = stat.st_blksize or 4096
+            length = min(parsed, stat.st_size - 1) // block * block
+            if length > 0 and self.collapse:
+                clone(logfile, rotated, length)
+                error = collapse(logfile, length)
+                if not error:
+                    if monitor:
+                        monitor.log_lp -= length
+                    self.queue(logfile)
+                    return True
+                if error in (errno.EOPNOTSUPP, errno.ENOTSUP):
+                    # Not supported by this filesystem, do not try again
+                    self.collapse = False
+                else:
+                    print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Warning: Can not collapse {logfile} {os.strerror(error)}')
+            # clone starts the copy from scratch, a partial copy of the collapse path is replaced
+            clone(logfile, rotated)
+            if monitor:
+                monitor.read_log(rotated)
+            with open(logfile, "r+b") as f:
+                f.truncate()
+            if monitor:
+                monitor.log_lp = 0
+        self.queue(logfile)
+        return True
+
+    def queue(self, logfile: Path):
+        with self.lock:
+            if logfile in self.pending:
+                return
+            self.pending.add(logfile)
+            if not self.thread:
+                self.thread = threading.Thread(target=self.run, name="LogRotate", daemon=True)
+                self.thread.start()
+        self.jobs.put(logfile)
+
+    def compress(self, logfile: Path):
+        old = Path(f'{logfile}.old')
+        Path(f'{logfile}.{self.generations}.gz').unlink(missing_ok=True)
+        for generation in range(self.generations - 1, 0, -1):
+            gz = Path(f'{logfile}.{generation}.gz')
+            if gz.exists():
+                os.replace(gz, Path(f'{logfile}.{generation + 1}.gz'))
+        if old.exists() and self.generations > 0:
+            tmp = Path(f'{logfile}.1.gz.tmp')
+            with open(old, "rb") as fsrc, gzip.open(tmp, "wb", compresslevel=6) as fdst:
+                shutil.copyfileobj(fsrc, fdst, 1 << 20)
+            os.replace(tmp, Path(f'{logfile}.1.gz'))
+        os.replace(Path(f'{logfile}.rotated'), old)
+
+    def run(self):
+        while True:
+            logfile = self.jobs.get()
+            try:
+                self.compress(logfile)
+            except Exception as e:
+                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Error: Can not rotate {logfile} {e}')
+                traceback.print_exc()
+                # Keep the copy uncompressed, the next rotation must not wait for it
+                try:
+                    os.replace(Path(f'{logfile}.rotated'), Path(f'{logfile}.old'))
+                except OSError:
+                    pass
+            with self.lock:
+                self.pending.discard(logfile)
+
+rotator = LogRotator()
@@ -0,0 +1,180 @@
+import os
+import ctypes
+import ctypes.util
+import select
+import struct
+import threading
+import traceback
+from datetime import datetime
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+
+class Inotify():
+    """Minimal inotify binding through libc, no extra dependency needed"""
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: str, mask: int):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        return wd
+
+    def rm_watch(self, wd: int):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: float, wakeup_fd: int = None):
+        """Wait up to timeout seconds or until wakeup_fd is readable and return a list of (wd, mask, name)"""
+        events = []
+        fds = [self.fd] if wakeup_fd is None else [self.fd, wakeup_fd]
+        readable, _, _ = select.select(fds, [], [], timeout)
+        if wakeup_fd in readable:
+            os.read(wakeup_fd, 4096)
+        if self.fd not in readable:
+            return events
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return events
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b'\0').decode(errors="replace")
+            pos += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class LogWatcher():
+    """Shared reader thread for the passivbot.log of all running instances
+
+    Monitors are registered with add() and are only read when their log
+    changed. On Linux changes are reported by inotify on the instance
+    directory, elsewhere the logs are polled with stat() every interval.
+    """
+    def __init__(self, interval: float = 5, logname: str = "passivbot.log"):
+        self.interval = interval
+        self.logname = logname
+        self.monitors = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.inotify = None
+        self.wds = {}
+        self.stats = {}
+        try:
+            self.inotify = Inotify()
+            self.wakeup_r, self.wakeup_w = os.pipe()
+            os.set_blocking(self.wakeup_r, False)
+        except (OSError, AttributeError, TypeError) as e:
+            print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Warning: inotify not available, polling logs every {interval}s ({e})')
+
+    def start(self):
+        if not self.thread:
+            self.thread = threading.Thread(target=self.run, name="LogWatcher", daemon=True)
+            self.thread.start()
+
+    def add(self, monitor):
+        path = str(monitor.path)
+        with self.lock:
+            old = self.monitors.get(path)
+            if old is monitor:
+                return
+            if self.inotify and path not in self.wds:
+                try:
+                    self.wds[path] = self.inotify.add_watch(path, IN_MODIFY | IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF)
+                except OSError as e:
+                    # Not watched, the PBRun loop keeps reading this log itself
+                    print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Warning: Can not watch {path} {e}')
+                    return
+            if old:
+                with old.lock:
+                    old.watched = False
+            self.monitors[path] = monitor
+            monitor.watched = True
+            self.dirty.add(path)
+        self.wakeup.set()
+        if self.inotify:
+            os.write(self.wakeup_w, b'\0')
+
+    def remove(self, monitor):
+        path = str(monitor.path)
+        with self.lock:
+            if self.monitors.get(path) is not monitor:
+                return
+            del self.monitors[path]
+            monitor.watched = False
+            self.dirty.discard(path)
+            self.stats.pop(path, None)
+            wd = self.wds.pop(path, None)
+            if wd is not None:
+                self.inotify.rm_watch(wd)
+
+    def poll(self):
+        # Fallback without inotify, compare size and mtime of every log
+        with self.lock:
+            paths = list(self.monitors)
+        for path in paths:
+            try:
+                st = os.stat(f'{path}/{self.logname}')
+                stat = (st.st_size, st.st_mtime_ns)
+            except FileNotFoundError:
+                stat = None
+            if self.stats.get(path) != stat:
+                self.stats[path] = stat
+                with self.lock:
+                    self.dirty.add(path)
+
+    def wait(self):
+        if not self.inotify:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.poll()
+            return
+        events = self.inotify.read(self.interval, self.wakeup_r)
+        with self.lock:
+            paths = {wd: path for path, wd in self.wds.items()}
+            for wd, mask, name in events:
+                path = paths.get(wd)
+                if path is None:
+                    continue
+                if mask & (IN_DELETE_SELF | IN_IGNORED):
+                    # Instance directory was removed, hand the monitor back to the PBRun loop
+                    self.wds.pop(path, None)
+                    monitor = self.monitors.pop(path, None)
+                    if monitor:
+                        monitor.watched = False
+                elif name == self.logname:
+                    self.dirty.add(path)
+
+    def run(self):
+        while True:
+            try:
+                with self.lock:
+                    dirty = [self.monitors[path] for path in self.dirty if path in self.monitors]
+                    self.dirty.clear()
+                for monitor in dirty:
+                    with monitor.lock:
+                        if monitor.watched:
+                            monitor.read_log()
+                if not dirty or self.inotify:
+                    self.wait()
+            except Exception as e:
+                print(f'Something went wrong, but continue {e}')
+                traceback.print_exc()
+                self.wakeup.wait(self.interval)
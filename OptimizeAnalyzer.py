@@ -0,0 +1,234 @@
+"""
+Streaming analysis of pb7 optimize result files, replaces extract_best_config.py.
+
+The result file is read once, line by line, without a copy. Every line is a
+json object; with compress_results_file only the changed values are written,
+so every line is merged into the previous record. Only complete lines are
+read and the offset is kept, so a file the optimizer still appends to can be
+analyzed and analyzed again later from where the last run stopped.
+
+For every objective (w_0, w_1, ... lower is better) and every scoring metric
+of the optimize config (higher is better) a bounded heap keeps the best K
+records. The best config is chosen like extract_best_config.py: the pareto
+front of the objectives, of the records with all objectives <= 0 if there
+are any, and from the front the record closest to the ideal point.
+"""
+import os
+import json
+import heapq
+import itertools
+from pathlib import Path, PurePath
+from threading import Thread, Lock
+from datetime import datetime
+
+def deep_update(base: dict, update: dict):
+    """New dict of base with the values of update, unchanged sub dicts are shared"""
+    merged = dict(base)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_update(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def record_analysis(record: dict):
+    analysis = record.get("analyses_combined") or record.get("analysis")
+    return analysis if isinstance(analysis, dict) else None
+
+def record_config(record: dict):
+    return record["config"] if isinstance(record.get("config"), dict) else record
+
+def dominates(a: tuple, b: tuple):
+    return all(x <= y for x, y in zip(a, b)) and a != b
+
+class TopK():
+    """The K records with the highest score"""
+    def __init__(self, k: int):
+        self.k = k
+        self.heap = []
+
+    def add(self, score: float, seq: int, record: dict):
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, (score, seq, record))
+        elif score > self.heap[0][0]:
+            heapq.heapreplace(self.heap, (score, seq, record))
+
+    def best(self):
+        return [(score, record) for score, seq, record in sorted(self.heap, key=lambda item: (-item[0], item[1]))]
+
+class ParetoFront():
+    def __init__(self):
+        self.front = []
+
+    def add(self, w: tuple, seq: int, record: dict):
+        if any(dominates(other, w) or other == w for other, _, _ in self.front):
+            return
+        self.front = [item for item in self.front if not dominates(w, item[0])]
+        self.front.append((w, seq, record))
+
+    def closest_to_ideal(self):
+        if not self.front:
+            return None
+        ws = [w for w, _, _ in self.front]
+        lows = [min(values) for values in zip(*ws)]
+        highs = [max(values) for values in zip(*ws)]
+        def distance(w):
+            return sum(((x - low) / (high - low) if high > low else 0.0) ** 2 for x, low, high in zip(w, lows, highs))
+        return min(self.front, key=lambda item: (distance(item[0]), item[1]))[2]
+
+class ResultAnalyzer():
+    def __init__(self, result_file: str, analysis_path: str, k: int = 10):
+        self.result_file = Path(result_file)
+        self.analysis_path = Path(analysis_path)
+        self.k = k
+        self.state = "idle"
+        self.error = None
+        self.analysis = None
+        self.thread = None
+        self.lock = Lock()
+        # best_table of every key, replaced as a whole when a run is done
+        self.tables = {}
+        self.reset()
+
+    def reset(self):
+        self.inode = None
+        self.offset = 0
+        self.size = 0
+        self.records = 0
+        self.prev = None
+        self.seq = itertools.count()
+        self.scoring = []
+        self.top = {}
+        self.front = ParetoFront()
+        self.passing = ParetoFront()
+
+    @property
+    def progress(self):
+        return min(self.offset / self.size, 1.0) if self.size else 0.0
+
+    def running(self):
+        return self.state == "running"
+
+    def start(self):
+        """Analyze the new part of the result file in a background thread"""
+        with self.lock:
+            if self.running():
+                return
+            self.state = "running"
+            self.error = None
+            self.thread = Thread(target=self.run, name=f'analyze {self.result_file.name}', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        try:
+            self.analyze()
+            self.analysis = self.save()
+            self.tables = {key: self.best_table(key) for key in sorted(self.top)}
+            self.state = "done"
+        except Exception as e:
+            print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Error: Can not analyze {self.result_file} {e}')
+            self.error = str(e)
+            self.state = "error"
+
+    def analyze(self):
+        with open(self.result_file, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size < self.offset or (self.inode is not None and st.st_ino != self.inode):
+                # Result file was replaced
+                self.reset()
+            self.inode = st.st_ino
+            self.size = st.st_size
+            f.seek(self.offset)
+            for line in f:
+                # The optimizer may be writing the last line right now
+                if not line.endswith(b"\n"):
+                    break
+                self.offset += len(line)
+                self.size = max(self.size, self.offset)
+                if line.strip():
+                    self.add(json.loads(line))
+
+    def add(self, line: dict):
+        record = deep_update(self.prev, line) if self.prev else line
+        self.prev = record
+        self.records += 1
+        analysis = record_analysis(record)
+        if not analysis:
+            return
+        if not self.scoring:
+            self.scoring = list(record_config(record).get("optimize", {}).get("scoring", []))
+        seq = next(self.seq)
+        objectives = sorted(key for key in analysis if key.startswith("w_"))
+        w = tuple(analysis[key] for key in objectives)
+        for key, value in zip(objectives, w):
+            self.top.setdefault(key, TopK(self.k)).add(-value, seq, record)
+        for metric in self.scoring:
+            value = analysis.get(metric, analysis.get(f'{metric}_mean'))
+            if isinstance(value, (int, float)):
+                self.top.setdefault(metric, TopK(self.k)).add(value, seq, record)
+        if w:
+            self.front.add(w, seq, record)
+            if all(x <= 0.0 for x in w):
+                self.passing.add(w, seq, record)
+
+    def best(self):
+        return self.passing.closest_to_ideal() or self.front.closest_to_ideal()
+
+    def best_table(self, key: str):
+        """Rows of the top K of an objective or scoring metric"""
+        rows = []
+        lower = key.startswith("w_")
+        for score, record in self.top[key].best() if key in self.top else []:
+            analysis = record_analysis(record)
+            row = {key: -score if lower else score}
+            row.update({name: value for name, value in analysis.items() if name.startswith("w_") or name in self.scoring or name.removesuffix("_mean") in self.scoring})
+            rows.append(row)
+        return rows
+
+    def save(self):
+        """Write the best config to the analysis path like extract_best_config.py, returns the analysis name"""
+        best = self.best()
+        if not best:
+            return None
+        # A loadable config with its analysis, also for records of the {"config": ...} layout
+        config = dict(record_config(best))
+        for key in ("analyses_combined", "analysis"):
+            if isinstance(best.get(key), dict):
+                config[key] = best[key]
+                break
+        name = PurePath(self.result_file).stem.replace("_all_results", "")
+        self.analysis_path.mkdir(parents=True, exist_ok=True)
+        file = Path(f'{self.analysis_path}/{name}.json')
+        tmp = Path(f'{self.analysis_path}/.{name}.json.tmp')
+        with open(tmp, "w", encoding='utf-8') as f:
+            json.dump(config, f, indent=4)
+        os.replace(tmp, file)
+        return name
+
+class Analyzers():
+    """ResultAnalyzer per result file, shared by all sessions of the streamlit server"""
+    def __init__(self):
+        self.analyzers = {}
+        self.lock = Lock()
+
+    def get(self, result_file: str, analysis_path: str):
+        with self.lock:
+            key = str(result_file)
+            if key not in self.analyzers:
+                self.analyzers[key] = ResultAnalyzer(result_file, analysis_path)
+            return self.analyzers[key]
+
+    def start(self, result_file: str, analysis_path: str):
+        analyzer = self.get(result_file, analysis_path)
+        analyzer.start()
+        return analyzer
+
+    def active(self):
+        with self.lock:
+            return [analyzer for analyzer in self.analyzers.values() if analyzer.state != "idle"]
+
+    def forget(self, result_file: str):
+        with self.lock:
+            self.analyzers.pop(str(result_file), None)
+
+analyzers = Analyzers()
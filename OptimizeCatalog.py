@@ -0,0 +1,183 @@
+"""
+Catalog of the pb7 optimize results for the v7 optimize results page.
+
+The name, size and mtime of every optimize_results/*.txt, its newest analysis
+and the number of backtests made from it are kept in data/optimize_v7_results.db.
+refresh() only stats the result files: a result is only opened again when its
+size or mtime changed, the analysis directory is only listed again when its
+mtime changed and the backtests of a name are only counted again when one of
+their directories changed.
+"""
+import os
+import json
+import sqlite3
+from pathlib import Path
+from threading import Lock
+from pbgui_func import PBGDIR
+
+def result_name(result_file):
+    """Name of the optimize from the first line of a result file"""
+    with open(result_file, "r", encoding='utf-8') as f:
+        first_line = f.readline()
+    if not first_line:
+        return "Empty Result"
+    try:
+        config = json.loads(first_line)
+    except Exception:
+        return "Corrupt Result"
+    if "config" in config:
+        config = config["config"]
+    if "backtest" not in config:
+        return "Corrupt Result"
+    return config["backtest"]["base_dir"].split("/")[-1]
+
+def stamp(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+class OptimizeV7Catalog():
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS results (file TEXT PRIMARY KEY, name TEXT, size INTEGER, mtime INTEGER, analysis TEXT, analysis_mtime INTEGER)",
+        "CREATE TABLE IF NOT EXISTS backtests (name TEXT PRIMARY KEY, stamps TEXT, count INTEGER, pending TEXT)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    )
+    # all sessions of the streamlit server refresh the same db
+    lock = Lock()
+
+    def __init__(self, results_path: Path, analysis_path: Path, backtests_path: Path, db: Path = None):
+        self.results_path = Path(results_path)
+        self.analysis_path = Path(analysis_path)
+        self.backtests_path = Path(backtests_path)
+        self.db = Path(db) if db else Path(f'{PBGDIR}/data/optimize_v7_results.db')
+
+    def connect(self):
+        self.db.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db, timeout=30)
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    def scan_results(self):
+        """{file: (size, mtime_ns)} of the result files"""
+        files = {}
+        try:
+            with os.scandir(self.results_path) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".txt") and entry.is_file():
+                        try:
+                            st = entry.stat()
+                            files[entry.path] = (st.st_size, st.st_mtime_ns)
+                        except FileNotFoundError:
+                            pass
+        except FileNotFoundError:
+            pass
+        return files
+
+    def scan_analysis(self):
+        """{first 19 characters of the stem: (newest analysis stem, mtime_ns)}"""
+        newest = {}
+        try:
+            with os.scandir(self.analysis_path) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        mtime = entry.stat().st_mtime_ns
+                    except FileNotFoundError:
+                        continue
+                    stem = entry.name[:-5]
+                    prefix = stem[0:19]
+                    if prefix not in newest or mtime > newest[prefix][1]:
+                        newest[prefix] = (stem, mtime)
+        except FileNotFoundError:
+            pass
+        return newest
+
+    def backtest_stamps(self, name: str):
+        """mtimes of the backtest directory of name and its direct subdirectories"""
+        base_path = Path(f'{self.backtests_path}/{name}')
+        stamps = {".": stamp(base_path)}
+        if stamps["."] is None:
+            return stamps
+        with os.scandir(base_path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    stamps[entry.name] = stamp(entry.path)
+        return stamps
+
+    def count_backtests(self, name: str):
+        """Number of analysis.json below the backtest directory of name and the directories without one yet"""
+        count = 0
+        pending = []
+        for root, dirs, names in os.walk(Path(f'{self.backtests_path}/{name}')):
+            if "analysis.json" in names:
+                count += 1
+            elif not dirs:
+                pending.append(root)
+        return count, pending
+
+    def backtest_count(self, conn, name: str):
+        stamps = self.backtest_stamps(name)
+        row = conn.execute("SELECT stamps, count, pending FROM backtests WHERE name = ?", (name,)).fetchone()
+        if row and json.loads(row[0]) == stamps:
+            # Running backtests write their analysis.json after the directory is created
+            count = row[1]
+            pending = json.loads(row[2])
+            finished = [path for path in pending if Path(f'{path}/analysis.json').exists()]
+            if not finished:
+                return count
+            count += len(finished)
+            pending = [path for path in pending if path not in finished]
+        else:
+            count, pending = self.count_backtests(name)
+        conn.execute("INSERT OR REPLACE INTO backtests (name, stamps, count, pending) VALUES (?, ?, ?, ?)", (name, json.dumps(stamps), count, json.dumps(pending)))
+        return count
+
+    def refresh(self):
+        """Update the catalog, returns a list of dict with file, name, mtime, count, analysis and analysis_mtime per result"""
+        with self.lock:
+            conn = self.connect()
+            try:
+                with conn:
+                    return self.update(conn)
+            finally:
+                conn.close()
+
+    def update(self, conn):
+        files = self.scan_results()
+        known = {file: (size, mtime) for file, size, mtime in conn.execute("SELECT file, size, mtime FROM results")}
+        for file in known.keys() - files.keys():
+            conn.execute("DELETE FROM results WHERE file = ?", (file,))
+        changed = [file for file, stat in files.items() if known.get(file) != stat]
+        for file in changed:
+            try:
+                name = result_name(file)
+            except OSError:
+                continue
+            size, mtime = files[file]
+            conn.execute("INSERT OR REPLACE INTO results (file, name, size, mtime) VALUES (?, ?, ?, ?)", (file, name, size, mtime))
+        analysis_stamp = str(stamp(self.analysis_path))
+        row = conn.execute("SELECT value FROM meta WHERE key = 'analysis_stamp'").fetchone()
+        if changed or not row or row[0] != analysis_stamp:
+            newest = self.scan_analysis()
+            for (file,) in conn.execute("SELECT file FROM results").fetchall():
+                analysis, analysis_mtime = newest.get(Path(file).stem[0:19], (None, None))
+                conn.execute("UPDATE results SET analysis = ?, analysis_mtime = ? WHERE file = ?", (analysis, analysis_mtime, file))
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('analysis_stamp', ?)", (analysis_stamp,))
+        results = []
+        counts = {}
+        for file, name, mtime, analysis, analysis_mtime in conn.execute("SELECT file, name, mtime, analysis, analysis_mtime FROM results ORDER BY file").fetchall():
+            if name not in counts:
+                counts[name] = self.backtest_count(conn, name)
+            results.append({
+                "file": file,
+                "name": name,
+                "mtime": mtime / 1e9,
+                "count": counts[name],
+                "analysis": analysis,
+                "analysis_mtime": analysis_mtime / 1e9 if analysis_mtime else None,
+            })
+        conn.execute("DELETE FROM backtests WHERE name NOT IN (SELECT name FROM results)")
+        return results
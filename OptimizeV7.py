@@ -19,6 +19,8 @@ import shutil
 import datetime
 import BacktestV7
 from Config import ConfigV7, Bounds
+from OptimizeCatalog import OptimizeV7Catalog, result_name
+from OptimizeAnalyzer import analyzers
 import logging
 import os
 import fnmatch
@@ -362,7 +364,9 @@ class OptimizeV7Results:
     def __init__(self):
         self.results_path = Path(f'{pb7dir()}/optimize_results')
         self.analysis_path = Path(f'{pb7dir()}/optimize_results_analysis')
+        self.catalog = OptimizeV7Catalog(self.results_path, self.analysis_path, Path(f'{pb7dir()}/backtests/pbgui'))
         self.results = []
+        self.entries = []
         self.filter = ""
         self.initialize()
     
@@ -370,6 +374,7 @@ class OptimizeV7Results:
         self.find_results()
     
     def remove(self, file_name):
+        analyzers.forget(file_name)
         Path(file_name).unlink(missing_ok=True)
         Path(f'{file_name}.bak').unlink(missing_ok=True)
         analysis = PurePath(file_name).stem[0:19]
@@ -380,29 +385,13 @@ class OptimizeV7Results:
                 Path(a).unlink(missing_ok=True)
 
     def find_results(self):
-        self.results = []
-        if self.results_path.exists():
-            p = str(self.results_path) + "/*.txt"
-            self.results = glob.glob(p, recursive=False)
+        self.entries = self.catalog.refresh()
+        if self.filter:
+            self.entries = [entry for entry in self.entries if fnmatch.fnmatch(entry["name"].lower(), self.filter.lower())]
+        self.results = [entry["file"] for entry in self.entries]
     
     def find_result_name(self, result_file):
-        with open(result_file, "r", encoding='utf-8') as f:
-            first_line = f.readline()
-            if not first_line:
-                return "Empty Result"
-            try:
-                config = json.loads(first_line)
-            except Exception as e:
-                return "Corrupt Result"
-            if "config" not in config:
-                if "backtest" not in config:
-                    return "Corrupt Result"
-                else:
-                    backtest_name = config["backtest"]["base_dir"].split("/")[-1]
-                    return backtest_name
-            else:
-                backtest_name = config["config"]["backtest"]["base_dir"].split("/")[-1]
-                return backtest_name
+        return result_name(result_file)
 
     def view_analysis(self, analysis):
         file = Path(f'{self.analysis_path}/{analysis}.json')
@@ -419,13 +408,9 @@ class OptimizeV7Results:
             if st.session_state.select_opt_v7_result_filter != self.filter:
                 self.filter = st.session_state.select_opt_v7_result_filter
                 self.results = []
-                del st.session_state.opt_v7_results_d
+                if "opt_v7_results_d" in st.session_state:
+                    del st.session_state.opt_v7_results_d
                 self.find_results()
-                if not self.filter == "":
-                    for result in self.results.copy():
-                        name = self.find_result_name(result)
-                        if not fnmatch.fnmatch(name.lower(), self.filter.lower()):
-                            self.results.remove(result)
         else:
             st.session_state.select_opt_v7_result_filter = self.filter
 
@@ -434,37 +419,19 @@ class OptimizeV7Results:
         ed_key = st.session_state.ed_key
         if not "opt_v7_results_d" in st.session_state:
             d = []
-            for id, opt in enumerate(self.results):
-                name = self.find_result_name(opt)
-                opt_item = OptimizeV7Item(name)
-                name = self.find_result_name(opt)
-                analysis = PurePath(opt).stem[0:19]
-                analysis = str(self.analysis_path) + f'/{analysis}*.json'
-                analysis = glob.glob(analysis, recursive=False)
-                if analysis:
-                    # find newest analysis file
-                    analysis_time = 0
-                    for a in analysis.copy():
-                        mtime = Path(a).stat().st_mtime
-                        if mtime > analysis_time:
-                            analysis_time = mtime
-                            analysis = PurePath(a).stem
-                else:
-                    analysis = None
-                result = PurePath(opt).stem
-                result_time = Path(opt).stat().st_mtime
+            for id, entry in enumerate(self.entries):
                 d.append({
                     'id': id,
-                    'Name': name,
-                    'Result Time': datetime.datetime.fromtimestamp(result_time),
-                    'BT Count': opt_item.backtest_count,
+                    'Name': entry["name"],
+                    'Result Time': datetime.datetime.fromtimestamp(entry["mtime"]),
+                    'BT Count': entry["count"],
                     'view': False,
                     "generate": False,
                     'backtest': False,
                     'delete' : False,
-                    'Result': result,
-                    'Analysis': analysis,
-                    'Analysis Time': datetime.datetime.fromtimestamp(analysis_time) if analysis else None,
+                    'Result': PurePath(entry["file"]).stem,
+                    'Analysis': entry["analysis"],
+                    'Analysis Time': datetime.datetime.fromtimestamp(entry["analysis_mtime"]) if entry["analysis"] else None,
                 })
             st.session_state.opt_v7_results_d = d
         d = st.session_state.opt_v7_results_d
@@ -479,6 +446,7 @@ class OptimizeV7Results:
             "Analysis": st.column_config.TextColumn(label="Analysis File", width="50px"),
             "Result": st.column_config.TextColumn(label="Result File", width="50px"),
             }
+        self.view_analyzers()
         #Display optimizes
         st.data_editor(data=d, height=36+(len(d))*35, use_container_width=True, key=f'select_optresults_{ed_key}', hide_index=None, column_order=None, column_config=column_config, disabled=['id','name'])
         if f'select_optresults_{ed_key}' in st.session_state:
@@ -493,9 +461,7 @@ class OptimizeV7Results:
                         result_name = PurePath(f'{self.results_path}/{d[row]["Result"]}.txt')
                         self.generate_analysis(result_name)
                         st.session_state.ed_key += 1
-                        if "opt_v7_results_d" in st.session_state:
-                            del st.session_state.opt_v7_results_d
-                        # st.rerun()
+                        st.rerun()
                 if "backtest" in ed["edited_rows"][row]:
                     if ed["edited_rows"][row]["backtest"]:
                         backtest_name = PurePath(f'{self.analysis_path}/{d[row]["Analysis"]}.json')
@@ -509,22 +475,38 @@ class OptimizeV7Results:
                         st.switch_page(get_navi_paths()["V7_BACKTEST"])
 
     def generate_analysis(self, result_file):
-        # create a copy of result_file
-        result_file = Path(result_file)
-        result_file_copy = Path(f'{result_file}.bak')
-        shutil.copy(result_file, result_file_copy)
-        # run extract_best_config.py on result_file_copy
-        cmd = [pb7venv(), '-u', PurePath(f'{pb7dir()}/src/tools/extract_best_config.py'), str(result_file_copy)]
-        with st.spinner('Generating Result...'):
-            if platform.system() == "Windows":
-                creationflags = subprocess.CREATE_NO_WINDOW
-                result = subprocess.run(cmd, capture_output=True, cwd=pb7dir(), text=True, creationflags=creationflags)
+        analyzers.start(result_file, self.analysis_path)
+
+    @st.fragment(run_every=1)
+    def view_analyzers(self):
+        active = [analyzer for analyzer in analyzers.active() if str(analyzer.result_file) in self.results]
+        if not active:
+            return
+        if not "opt_v7_analyzers_done" in st.session_state:
+            st.session_state.opt_v7_analyzers_done = set()
+        done = st.session_state.opt_v7_analyzers_done
+        finished = False
+        for analyzer in active:
+            name = analyzer.result_file.stem
+            if analyzer.running():
+                st.progress(analyzer.progress, text=f'Analyzing {name}: {analyzer.records} results, {analyzer.offset / 1024 / 1024:.1f} of {analyzer.size / 1024 / 1024:.1f} MB')
+                done.discard(name)
+            elif analyzer.state == "error":
+                st.error(f'Analysis of {name} failed: {analyzer.error}')
             else:
-                result = subprocess.run(cmd, capture_output=True, cwd=pb7dir(), text=True, start_new_session=True)
-        if "error" in result.stdout:
-            error_popup(result.stdout)
-        else:
-            info_popup(f"Analysis Generated {result.stdout}")
+                if name not in done:
+                    done.add(name)
+                    finished = True
+                with st.expander(f'Best configs of {name} ({analyzer.records} results)'):
+                    for key, table in analyzer.tables.items():
+                        st.write(key)
+                        st.dataframe(table, use_container_width=True)
+        if finished:
+            if "opt_v7_results_d" in st.session_state:
+                del st.session_state.opt_v7_results_d
+            st.session_state.ed_key += 1
+            self.find_results()
+            st.rerun()
 
     def remove_selected_results(self):
         ed_key = st.session_state.ed_key
@@ -537,9 +519,12 @@ class OptimizeV7Results:
         self.find_results()
     
     def remove_all_results(self):
+        for result in self.results:
+            analyzers.forget(result)
         shutil.rmtree(self.results_path, ignore_errors=True)
         shutil.rmtree(self.analysis_path, ignore_errors=True)
         self.results = []
+        self.entries = []
 
 class OptimizeV7Item:
     def __init__(self, optimize_file: str = None):
@@ -6,11 +6,13 @@ from pathlib import Path, PurePath
 from time import sleep
 from io import TextIOWrapper
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import BoundedSemaphore, Lock
 import platform
 import traceback
 from pbgui_func import PBGDIR
 from Database import Database
-from User import Users
+from User import Users, User
 import configparser
 
 class PBData():
@@ -23,6 +25,9 @@ class PBData():
         self.db = Database()
         self.users = Users()
         self._fetch_users = self.load_fetch_users()
+        self.fetch_workers, self.exchange_workers, self.backfill_workers = self.load_fetch_workers()
+        self._exchange_limits = {}
+        self._exchange_limits_lock = Lock()
 
     # fetch_users
     @property
@@ -101,21 +106,55 @@ class PBData():
         with open('pbgui.ini', 'w') as f:
             pb_config.write(f)
 
+    def load_fetch_workers(self):
+        pb_config = configparser.ConfigParser()
+        pb_config.read('pbgui.ini')
+        fetch_workers = 8
+        exchange_workers = 2
+        backfill_workers = 4
+        if pb_config.has_option("pbdata", "fetch_workers"):
+            fetch_workers = max(1, int(pb_config.get("pbdata", "fetch_workers")))
+        if pb_config.has_option("pbdata", "exchange_workers"):
+            exchange_workers = max(1, int(pb_config.get("pbdata", "exchange_workers")))
+        if pb_config.has_option("pbdata", "backfill_workers"):
+            backfill_workers = max(1, int(pb_config.get("pbdata", "backfill_workers")))
+        return fetch_workers, exchange_workers, backfill_workers
+
+    def exchange_limit(self, exchange: str):
+        # One semaphore per exchange, so concurrent users never exceed exchange_workers requests at once
+        with self._exchange_limits_lock:
+            if exchange not in self._exchange_limits:
+                self._exchange_limits[exchange] = BoundedSemaphore(self.exchange_workers)
+            return self._exchange_limits[exchange]
+
+    def fetch_user(self, user: User, jobs: list):
+        for name, update in jobs:
+            with self.exchange_limit(user.exchange):
+                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Fetch {name} for {user.name}')
+                update(user)
+
     def update_db(self):
         self.load_fetch_users()
         self.users.load()
-        for user in self.users:
-            if user.name in self.fetch_users:
-                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Fetch history for {user.name}')
-                self.db.update_history(user)
-                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Fetch positions for {user.name}')
-                self.db.update_positions(user)
-                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Fetch orders for {user.name}')
-                self.db.update_orders(user)
-                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Fetch prices for {user.name}')
-                self.db.update_prices(user)
-                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Fetch balance for {user.name}')
-                self.db.update_balances(user)
+        users = [user for user in self.users if user.name in self.fetch_users]
+        if not users:
+            return
+        with ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="pbdata") as executor:
+            futures = {}
+            for user in users:
+                # history and balance are independent, orders and prices need the current positions
+                futures[executor.submit(self.fetch_user, user, [("history", lambda user: self.db.update_history(user, self.backfill_workers))])] = user
+                futures[executor.submit(self.fetch_user, user, [
+                    ("positions", self.db.update_positions),
+                    ("orders", self.db.update_orders),
+                    ("prices", self.db.update_prices)])] = user
+                futures[executor.submit(self.fetch_user, user, [("balance", self.db.update_balances)])] = user
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Error: Fetch for {futures[future].name} failed {e}')
+                    traceback.print_exc()
 
 def main():
     dest = Path(f'{PBGDIR}/data/logs')
@@ -10,6 +10,8 @@ import subprocess
 import configparser
 import sys
 import os
+import atexit
+import signal
 from pathlib import Path, PurePath
 from time import sleep
 import glob
@@ -23,6 +25,9 @@ import shutil
 import hashlib
 import traceback
 import gzip
+from RemoteSync import Manifest, rclone, push, pull
+from Heartbeat import HeartbeatWriter, heartbeats
+from concurrent.futures import ThreadPoolExecutor
 
 class RemoteServer():
     def __init__(self, path: str):
@@ -167,7 +172,7 @@ class RemoteServer():
 
     def is_online(self):
         """
-        Check if the remote server is online by loading the alive_*.cmd file and checking if the latest is less than 60 seconds ago.
+        Check if the remote server is online by loading the heartbeat and checking if the latest is less than 200 seconds ago.
 
         Returns:
             bool: True if the remote server is online, False otherwise.
@@ -181,74 +186,55 @@ class RemoteServer():
 
     def load(self):
         """
-        Load the server's configuration.
+        Load the server's configuration from its heartbeat, unchanged heartbeats come from the cache.
         """
-        p = str(Path(f'{self._path}/alive_*.cmd*'))
-        alive_remote = glob.glob(p)
-        alive_remote.sort()
         self._name = PurePath(self._path).name[4:]
-        if alive_remote:
-            while len(alive_remote) > 0:
-                remote = Path(alive_remote.pop())
-                try:
-                    if str(remote).endswith('.gz'):
-                        with gzip.open(remote, "rt", encoding='utf-8') as f:
-                            cfg = json.load(f)
-                    else:
-                        with open(remote, "r", encoding='utf-8') as f:
-                            cfg = json.load(f)
-                    if "name" in cfg and "timestamp" in cfg:
-                        self._ts = cfg["timestamp"]
-                    if "startts" in cfg:
-                        self._startts = cfg["startts"]
-                    if "api_md5" in cfg:
-                        self._api_md5 = cfg["api_md5"]
-                    if "mem" in cfg:
-                        self._mem = cfg["mem"]
-                    if "swap" in cfg:
-                        self._swap = cfg["swap"]
-                    if "disk" in cfg:
-                        self._disk = cfg["disk"]
-                    if "cpu" in cfg:
-                        self._cpu = cfg["cpu"]
-                    if "boot" in cfg:
-                        self._boot = cfg["boot"]
-                    if "monitor" in cfg:
-                        self._monitor = cfg["monitor"]
-                    if "upgrades" in cfg:
-                        self._upgrades = cfg["upgrades"]
-                    if "reboot" in cfg:
-                        self._reboot = cfg["reboot"]
-                    if "pbgv" in cfg:
-                        self._pbgui_version = cfg["pbgv"]
-                    if "pbgc" in cfg:
-                        self._pbgui_commit = cfg["pbgc"]
-                    if "pb6v" in cfg:
-                        self._pb6_version = cfg["pb6v"]
-                    if "pb6c" in cfg:
-                        self._pb6_commit = cfg["pb6c"]
-                    if "pb7v" in cfg:
-                        self._pb7_version = cfg["pb7v"]
-                    if "pb7c" in cfg:
-                        self._pb7_commit = cfg["pb7c"]
-                    return
-                except Exception as e:
-                    print(f'{str(remote)} is corrupted {e}')
+        cfg = heartbeats.load(self._path)
+        if cfg:
+            self.apply(cfg)
+
+    def apply(self, cfg: dict):
+        if "name" in cfg and "timestamp" in cfg:
+            self._ts = cfg["timestamp"]
+        if "startts" in cfg:
+            self._startts = cfg["startts"]
+        if "api_md5" in cfg:
+            self._api_md5 = cfg["api_md5"]
+        if "mem" in cfg:
+            self._mem = cfg["mem"]
+        if "swap" in cfg:
+            self._swap = cfg["swap"]
+        if "disk" in cfg:
+            self._disk = cfg["disk"]
+        if "cpu" in cfg:
+            self._cpu = cfg["cpu"]
+        if "boot" in cfg:
+            self._boot = cfg["boot"]
+        if "monitor" in cfg:
+            self._monitor = cfg["monitor"]
+        if "upgrades" in cfg:
+            self._upgrades = cfg["upgrades"]
+        if "reboot" in cfg:
+            self._reboot = cfg["reboot"]
+        if "pbgv" in cfg:
+            self._pbgui_version = cfg["pbgv"]
+        if "pbgc" in cfg:
+            self._pbgui_commit = cfg["pbgc"]
+        if "pb6v" in cfg:
+            self._pb6_version = cfg["pb6v"]
+        if "pb6c" in cfg:
+            self._pb6_commit = cfg["pb6c"]
+        if "pb7v" in cfg:
+            self._pb7_version = cfg["pb7v"]
+        if "pb7c" in cfg:
+            self._pb7_commit = cfg["pb7c"]
 
     def sync_v7_down(self):
         """Sync the v7 configurations from the remote storage to the local machine."""
         if self.instances_status_v7.has_new_status():
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} New status_v7.json from: {self.name}')
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Sync v7 from: {self.name}')
-            pbgdir = Path.cwd()
-            cmd = ['rclone', 'sync', '-v', '--include', f'{{*.json}}', f'{self.bucket}/run_v7_{self.name}', PurePath(f'{pbgdir}/data/remote/run_v7_{self.name}')]
-            logfile = Path(f'{pbgdir}/data/logs/sync.log')
-            log = open(logfile,"ab")
-            if platform.system() == "Windows":
-                creationflags = subprocess.CREATE_NO_WINDOW
-                subprocess.run(cmd, stdout=log, stderr=log, cwd=pbgdir, text=True, creationflags=creationflags)
-            else:
-                subprocess.run(cmd, stdout=log, stderr=log, cwd=pbgdir, text=True)
+            self.sync_down('run_v7', ['*.json'])
             PBRun().update_status(self.instances_status_v7.status_file, self.name)
             status_ts = self.instances_status_v7.status_ts
             self.instances_status_v7.update_status()
@@ -259,15 +245,7 @@ class RemoteServer():
         if self.instances_status.has_new_status():
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} New status.json from: {self.name}')
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Sync multi from: {self.name}')
-            pbgdir = Path.cwd()
-            cmd = ['rclone', 'sync', '-v', '--include', f'{{multi.hjson,*.json}}', f'{self.bucket}/multi_{self.name}', PurePath(f'{pbgdir}/data/remote/multi_{self.name}')]
-            logfile = Path(f'{pbgdir}/data/logs/sync.log')
-            log = open(logfile,"ab")
-            if platform.system() == "Windows":
-                creationflags = subprocess.CREATE_NO_WINDOW
-                subprocess.run(cmd, stdout=log, stderr=log, cwd=pbgdir, text=True, creationflags=creationflags)
-            else:
-                subprocess.run(cmd, stdout=log, stderr=log, cwd=pbgdir, text=True)
+            self.sync_down('multi', ['multi.hjson', '*.json'])
             PBRun().update_status(self.instances_status.status_file, self.name)
             status_ts = self.instances_status.status_ts
             self.instances_status.update_status()
@@ -278,20 +256,22 @@ class RemoteServer():
         if self.instances_status_single.has_new_status():
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} New status_single.json from: {self.name}')
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Sync single from: {self.name}')
-            pbgdir = Path.cwd()
-            cmd = ['rclone', 'sync', '-v', '--include', f'{{instance.cfg,config.json}}', f'{self.bucket}/instances_{self.name}', PurePath(f'{pbgdir}/data/remote/instances_{self.name}')]
-            logfile = Path(f'{pbgdir}/data/logs/sync.log')
-            log = open(logfile,"ab")
-            if platform.system() == "Windows":
-                creationflags = subprocess.CREATE_NO_WINDOW
-                subprocess.run(cmd, stdout=log, stderr=log, cwd=pbgdir, text=True, creationflags=creationflags)
-            else:
-                subprocess.run(cmd, stdout=log, stderr=log, cwd=pbgdir, text=True)
+            self.sync_down('instances', ['instance.cfg', 'config.json'])
             PBRun().update_status(self.instances_status_single.status_file, self.name)
             status_ts = self.instances_status_single.status_ts
             self.instances_status_single.update_status()
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Update status_single ts: {self.name} old: {status_ts} new: {self.instances_status_single.status_ts}')
 
+    def sync_down(self, spath: str, include: list):
+        """Sync spath_<name> from the remote storage, only changed files if the server publishes a manifest"""
+        pbgdir = Path.cwd()
+        local_dir = PurePath(f'{pbgdir}/data/remote/{spath}_{self.name}')
+        manifest = Manifest(f'{pbgdir}/data/remote/manifests/manifest_{self.name}.json')
+        if spath in manifest.synced:
+            pull(manifest, self.bucket, f'{spath}_{self.name}', local_dir, include)
+        else:
+            rclone.sync(f'{self.bucket}/{spath}_{self.name}', local_dir, include=include)
+
     def sync_api(self):
         """
         Sync the API keys from the remote storage to the local machine.
@@ -340,19 +320,14 @@ class RemoteServer():
         """
         pbgdir = Path.cwd()
         # rclone delete pbgui:pbgui --include *manibot51*/**
-        cmd = ['rclone', 'delete', '-v', f'{self.bucket}', '--include', f'*{self.name}*/**']
-        logfile = Path(f'{pbgdir}/data/logs/sync.log')
-        log = open(logfile,"ab")
-        if platform.system() == "Windows":
-            creationflags = subprocess.CREATE_NO_WINDOW
-            subprocess.run(cmd, stdout=log, stderr=log, cwd=pbgdir, text=True, creationflags=creationflags)
-        else:
-            subprocess.run(cmd, stdout=log, stderr=log, cwd=pbgdir, text=True)
+        rclone.delete(self.bucket, include=[f'*{self.name}*/**'])
+        rclone.deletefile(f'{self.bucket}/manifest_{self.name}.json')
         # delete local files
         shutil.rmtree(f'{pbgdir}/data/remote/cmd_{self.name}', ignore_errors=True)
         shutil.rmtree(f'{pbgdir}/data/remote/instances_{self.name}', ignore_errors=True)
         shutil.rmtree(f'{pbgdir}/data/remote/multi_{self.name}', ignore_errors=True)
         shutil.rmtree(f'{pbgdir}/data/remote/run_v7_{self.name}', ignore_errors=True)
+        Path(f'{pbgdir}/data/remote/manifests/manifest_{self.name}.json').unlink(missing_ok=True)
 
 class PBRemote():
     """
@@ -409,6 +384,7 @@ class PBRemote():
         self.remote_path = f'{pbgdir}/data/remote'
         if not Path(self.cmd_path).exists():
             Path(self.cmd_path).mkdir(parents=True)  
+        self.heartbeat = HeartbeatWriter(self.cmd_path)
         self.piddir = Path(f'{pbgdir}/data/pid')
         if not self.piddir.exists():
             self.piddir.mkdir(parents=True)
@@ -422,6 +398,9 @@ class PBRemote():
         self.bucket_secret_access_key = None
         self.bucket_provider = "Synology"
         self.bucket_region = None
+        self.sync_workers = 8
+        # Peers of older versions only read alive_<ts>.cmd.gz
+        self.legacy_alive = True
         self.rclone_installed = self.is_rclone_installed()
         if not self.rclone_installed:
             if __name__ == '__main__':
@@ -453,6 +432,9 @@ class PBRemote():
                 self.error = "bucket not configured. Please configure bucket in pbgui.ini\n[pbremote]\nbucket = <bucket_name>:"
                 return
         self.bucket_dir = f'{self.bucket}{self.bucket.split(":")[0]}'
+        self.manifest_path = f'{pbgdir}/data/remote/manifests'
+        self.manifest = Manifest(f'{self.manifest_path}/manifest_{self.name}.json')
+        self.manifest_stamps = {}
         self.load_remote()
 
     @property
@@ -577,35 +559,96 @@ class PBRemote():
             spath (str): The specific path to synchronize (e.g., "cmd", "instances", "status").
         """
         pbgdir = Path.cwd()
-        if direction == 'up' and spath == 'cmd':
-            cmd = ['rclone', 'sync', '-v', '--include', f'{{alive_*.cmd*,api-keys.json}}', PurePath(f'{pbgdir}/data/{spath}'), f'{self.bucket_dir}/{spath}_{self.name}']
-        elif direction == 'up' and spath == 'instances':
-            cmd = ['rclone', 'sync', '-v', '--include', f'{{instance.cfg,config.json}}', PurePath(f'{pbgdir}/data/{spath}'), f'{self.bucket_dir}/{spath}_{self.name}']
-        elif direction == 'up' and spath == 'status':
-            cmd = ['rclone', 'sync', '-v', '--include', f'{{alive_*.cmd*,status.json}}', PurePath(f'{pbgdir}/data/cmd'), f'{self.bucket_dir}/cmd_{self.name}']
-        elif direction == 'up' and spath == 'status_single':
-            cmd = ['rclone', 'sync', '-v', '--include', f'{{alive_*.cmd*,status_single.json}}', PurePath(f'{pbgdir}/data/cmd'), f'{self.bucket_dir}/cmd_{self.name}']
-        elif direction == 'up' and spath == 'status_v7':
-            cmd = ['rclone', 'sync', '-v', '--include', f'{{alive_*.cmd*,status_v7.json}}', PurePath(f'{pbgdir}/data/cmd'), f'{self.bucket_dir}/cmd_{self.name}']
-        elif direction == 'up' and spath == 'run_v7':
-            cmd = ['rclone', 'sync', '-v', '--include', f'{{*.json}}', PurePath(f'{pbgdir}/data/{spath}'), f'{self.bucket_dir}/{spath}_{self.name}']
-        elif direction == 'up' and spath == 'multi':
-            cmd = ['rclone', 'sync', '-v', '--include', f'{{multi.hjson,*.json}}', PurePath(f'{pbgdir}/data/{spath}'), f'{self.bucket_dir}/{spath}_{self.name}']
-        elif direction == 'down' and spath == 'master':
-            cmd = ['rclone', 'sync', '-v', '--exclude', f'{{cmd_{self.name}/*,instances_**,multi_**,run_v7_**}}', f'{self.bucket_dir}', PurePath(f'{pbgdir}/data/remote')]
-        elif direction == 'down' and spath == 'slave':
-            cmd = ['rclone', 'sync', '-v', '--exclude', f'{{cmd_{self.name}/*,cmd_**/alive_*.cmd*,instances_**,multi_**,run_v7_**}}', f'{self.bucket_dir}', PurePath(f'{pbgdir}/data/remote')]
         logfile = Path(f'{pbgdir}/data/logs/sync.log')
         if logfile.exists():
             if logfile.stat().st_size >= 10485760:
                 logfile.replace(f'{pbgdir}/data/logs/sync.log.old')
-                logfile = Path(f'{pbgdir}/data/logs/sync.log')
-        log = open(logfile,"ab")
-        if platform.system() == "Windows":
-            creationflags = subprocess.CREATE_NO_WINDOW
-            subprocess.run(cmd, stdout=log, stderr=log, cwd=pbgdir, text=True, creationflags=creationflags)
+                # rclone rcd keeps writing to the old file otherwise
+                rclone.restart()
+        if direction == 'up':
+            self.sync_up(spath)
         else:
-            subprocess.run(cmd, stdout=log, stderr=log, cwd=pbgdir, text=True)
+            self.sync_down(spath)
+
+    def sync_path(self, spath: str):
+        """Local directory, remote prefix and include patterns of an up sync path"""
+        pbgdir = Path.cwd()
+        if spath == 'cmd':
+            return PurePath(f'{pbgdir}/data/cmd'), f'cmd_{self.name}', ['alive_*.cmd*', 'alive*.hb', 'api-keys.json']
+        elif spath == 'status':
+            return PurePath(f'{pbgdir}/data/cmd'), f'cmd_{self.name}', ['alive_*.cmd*', 'alive*.hb', 'status.json', 'status.jsonl']
+        elif spath == 'status_single':
+            return PurePath(f'{pbgdir}/data/cmd'), f'cmd_{self.name}', ['alive_*.cmd*', 'alive*.hb', 'status_single.json', 'status_single.jsonl']
+        elif spath == 'status_v7':
+            return PurePath(f'{pbgdir}/data/cmd'), f'cmd_{self.name}', ['alive_*.cmd*', 'alive*.hb', 'status_v7.json', 'status_v7.jsonl']
+        elif spath == 'instances':
+            return PurePath(f'{pbgdir}/data/instances'), f'instances_{self.name}', ['instance.cfg', 'config.json']
+        elif spath == 'run_v7':
+            return PurePath(f'{pbgdir}/data/run_v7'), f'run_v7_{self.name}', ['*.json']
+        elif spath == 'multi':
+            return PurePath(f'{pbgdir}/data/multi'), f'multi_{self.name}', ['multi.hjson', '*.json']
+
+    def sync_up(self, spath: str, publish: bool = True):
+        """Upload the changed files of spath and publish the manifest"""
+        local_dir, prefix, include = self.sync_path(spath)
+        if push(self.manifest, self.bucket_dir, prefix, local_dir, include, spath) and publish:
+            self.publish_manifest()
+
+    def publish_manifest(self):
+        self.manifest.name = self.name
+        self.manifest.save()
+        rclone.copyto(self.manifest.file, f'{self.bucket_dir}/{self.manifest.file.name}')
+
+    def publish(self):
+        """Full upload of every path on start, the manifest is complete before peers use it"""
+        self.manifest.synced = []
+        for spath in ['cmd', 'status', 'status_single', 'status_v7', 'instances', 'multi', 'run_v7']:
+            self.sync_up(spath, publish=False)
+        self.publish_manifest()
+
+    def sync_down(self, role: str):
+        """Sync the cmd directories of all other servers
+
+        One listing of the bucket top level finds servers and their manifests.
+        Servers with a manifest are only pulled when their manifest changed,
+        servers without one get a full sync of their cmd directory.
+        """
+        pbgdir = Path.cwd()
+        listing = rclone.lsjson(self.bucket_dir)
+        if listing is None:
+            return
+        dirs = set()
+        stamps = {}
+        for item in listing:
+            if item["IsDir"]:
+                dirs.add(item["Name"])
+            elif item["Name"].startswith("manifest_") and item["Name"].endswith(".json"):
+                stamps[item["Name"][9:-5]] = (item["Size"], item["ModTime"])
+        # master servers also pull the alive files of all servers
+        exclude = [] if role == 'master' else ['alive_*.cmd*', 'alive*.hb']
+        peers = [rdir[4:] for rdir in dirs if rdir.startswith('cmd_') and rdir != f'cmd_{self.name}']
+        fetch = [name for name in peers if name in stamps and self.manifest_stamps.get(name) != stamps[name]]
+        results = rclone.run_all([(rclone.copyto, f'{self.bucket_dir}/manifest_{name}.json', Path(f'{self.manifest_path}/manifest_{name}.json')) for name in fetch])
+        legacy = []
+        for name, ok in zip(fetch, results):
+            if not ok:
+                continue
+            manifest = Manifest(f'{self.manifest_path}/manifest_{name}.json')
+            if all(spath in manifest.synced for spath in ['cmd', 'status', 'status_single', 'status_v7']):
+                # A failed copy is retried with the next sync, the manifest is fetched again until a pull succeeds
+                if pull(manifest, self.bucket_dir, f'cmd_{name}', PurePath(f'{pbgdir}/data/remote/cmd_{name}'), ['*'], exclude):
+                    self.manifest_stamps[name] = stamps[name]
+            else:
+                legacy.append(name)
+        legacy.extend(name for name in peers if name not in stamps)
+        rclone.run_all([(rclone.sync, f'{self.bucket_dir}/cmd_{name}', PurePath(f'{pbgdir}/data/remote/cmd_{name}'), [], exclude) for name in legacy])
+        # Remove servers that are gone from the bucket
+        for local_dir in glob.glob(str(Path(f'{pbgdir}/data/remote/cmd_*'))):
+            rdir = PurePath(local_dir).name
+            if rdir not in dirs:
+                shutil.rmtree(local_dir, ignore_errors=True)
+                Path(f'{self.manifest_path}/manifest_{rdir[4:]}.json').unlink(missing_ok=True)
+                self.manifest_stamps.pop(rdir[4:], None)
 
     def sync_status_down(self):
         if self.role == "master":
@@ -698,8 +741,7 @@ class PBRemote():
 
     def alive(self):
         """
-        Saves system informations like the name, memory, swaps, disk space and cpu usage to an alive file that is then synchronised with rclone from local to the remote storage.
-        If there are more than 9 alive files, it will delete the oldest one.
+        Saves system informations like the name, memory, swaps, disk space and cpu usage to the heartbeat that is then synchronised with rclone from local to the remote storage.
         """
         timestamp = round(datetime.now().timestamp())
         if timestamp - self.systemts > 3600:
@@ -718,7 +760,6 @@ class PBRemote():
         # self.boot = psutil.boot_time()
         # self.monitor = self.load_monitor()
         cfg = ({
-            "timestamp": timestamp,
             "startts": self.startts,
             "name": self.name,
             "api_md5": self.api_md5,
@@ -727,7 +768,6 @@ class PBRemote():
             "disk": self.disk,
             "cpu": self.cpu,
             "boot": self.boot,
-            "monitor": self.monitor,
             "upgrades": self.local_run.upgrades,
             "reboot": self.local_run.reboot,
             "pbgv": self.local_run.pbgui_version,
@@ -737,19 +777,22 @@ class PBRemote():
             "pb7v": self.local_run.pb7_version,
             "pb7c": self.local_run.pb7_commit,
             })
-        # Save the JSON data as a gzip file
-        cfile = Path(f'{self.cmd_path}/alive_{timestamp}.cmd.gz')
-        with gzip.open(cfile, "wt", encoding='utf-8') as f:
-            json.dump(cfg, f)
-        # with open(cfile, "w", encoding='utf-8') as f:
-        #     json.dump(cfg, f)
+        self.heartbeat.write(timestamp, cfg, self.monitor)
+        if self.legacy_alive:
+            # Older versions only see a server online with name and timestamp
+            cfg["timestamp"] = timestamp
+            cfg["monitor"] = self.monitor
+            cfile = Path(f'{self.cmd_path}/alive_{timestamp}.cmd.gz')
+            with gzip.open(cfile, "wt", encoding='utf-8') as f:
+                json.dump(cfg, f)
+        found_local = sorted(glob.glob(str(Path(f'{self.cmd_path}/alive_*.cmd*'))))
+        if self.legacy_alive:
+            # Keep the newest nine like before
+            found_local = found_local[:-9]
+        # Remove the old alive files, the sync removes them from the bucket
+        for local in found_local:
+            Path(local).unlink(missing_ok=True)
         self.sync('up', 'cmd')
-        p = str(Path(f'{self.cmd_path}/alive_*.cmd*'))
-        found_local = glob.glob(p)
-        found_local.sort()
-        while len(found_local) > 9:
-            local = Path(found_local.pop(0))
-            local.unlink(missing_ok=True)
 
     def calculate_api_md5(self):
         """Makes a md5 hash from the api-keys.json in passivbot folder."""
@@ -763,6 +806,22 @@ class PBRemote():
             return hashlib.md5(file_contents).hexdigest()
         return None
 
+    def load_server(self, path: str):
+        rserver = RemoteServer(path)
+        rserver.pbdir = self.pbdir
+        rserver.pb7dir = self.pb7dir
+        rserver.bucket = self.bucket_dir
+        rserver.pbname = self.name
+        rserver.load()
+        return rserver
+
+    def load_servers(self, paths: list):
+        """Create and load a RemoteServer for every path, spread over a thread pool"""
+        if len(paths) < 2:
+            return [self.load_server(path) for path in paths]
+        with ThreadPoolExecutor(max_workers=self.sync_workers, thread_name_prefix="load") as executor:
+            return list(executor.map(self.load_server, paths))
+
     def load_remote(self):
         """
         Loads every cmd files and create a new RemoteServer instance for each new possible instances, and tries to start instances with load_instances(). 
@@ -771,14 +830,8 @@ class PBRemote():
         pbgdir = Path.cwd()
         self.remote_servers = []
         p = str(Path(f'{pbgdir}/data/remote/cmd_*'))
-        found_remote = glob.glob(p)
-        for remote in found_remote:
-            rserver = RemoteServer(remote)
-            rserver.pbdir = self.pbdir
-            rserver.pb7dir = self.pb7dir
-            rserver.bucket = self.bucket_dir
-            rserver.pbname = self.name
-            rserver.load()
+        found_remote = sorted(glob.glob(p))
+        for rserver in self.load_servers(found_remote):
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Add Server: {rserver.name}')
             self.add(rserver)
 
@@ -789,25 +842,17 @@ class PBRemote():
         """
         pbgdir = Path.cwd()
         p = str(Path(f'{pbgdir}/data/remote/cmd_*'))
-        found_remote = glob.glob(p)
-        for remote in found_remote:
-            rserver = RemoteServer(remote)
-            rserver.pbdir = self.pbdir
-            rserver.pb7dir = self.pb7dir
-            rserver.bucket = self.bucket_dir
-            rserver.pbname = self.name
-            rserver.load()
-            add = True
-            for server in self.remote_servers:
-                if rserver.name == server.name:
-                    add = False
-            if add:
-                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Add New Server: {rserver.name}')
-                self.add(rserver)
+        found_remote = sorted(glob.glob(p))
+        names = [server.name for server in self.remote_servers]
+        new_remote = [remote for remote in found_remote if PurePath(remote).name[4:] not in names]
+        for rserver in self.load_servers(new_remote):
+            print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Add New Server: {rserver.name}')
+            self.add(rserver)
         # Remove servers that are not in the remote anymore
-        for server in self.remote_servers:
+        for server in list(self.remote_servers):
             if not Path(f'{pbgdir}/data/remote/cmd_{server.name}').exists():
                 print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Remove Server: {server.name}')
+                heartbeats.forget(server.path)
                 self.remove(server)
 
     def run(self):
@@ -834,7 +879,15 @@ class PBRemote():
     def stop(self):
         if self.is_running():
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Stop: PBRemote')
-            psutil.Process(self.my_pid).kill()
+            process = psutil.Process(self.my_pid)
+            # rclone rcd runs in its own session and would survive PBRemote
+            children = process.children()
+            process.kill()
+            for child in children:
+                try:
+                    child.terminate()
+                except psutil.NoSuchProcess:
+                    pass
 
     def is_running(self):
         self.load_pid()
@@ -870,6 +923,10 @@ class PBRemote():
                 self.bucket = pb_config.get("pbremote", "bucket")
             else:
                 self.bucket = None
+            if pb_config.has_option("pbremote", "sync_workers"):
+                self.sync_workers = max(1, int(pb_config.get("pbremote", "sync_workers")))
+            if pb_config.has_option("pbremote", "legacy_alive"):
+                self.legacy_alive = pb_config.getboolean("pbremote", "legacy_alive")
 
     def save_config(self):
         """Save the bucket name used in the remote storage in pbgui.ini."""
@@ -1012,6 +1069,12 @@ def main():
         exit(1)
     print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Start: PBRemote {remote.bucket}')
     remote.startts = round(datetime.now().timestamp())
+    rclone.workers = remote.sync_workers
+    rclone.start()
+    atexit.register(rclone.stop)
+    # Exit through atexit on SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    remote.publish()
     while True:
         try:
             if logfile.exists():
@@ -1019,6 +1082,7 @@ def main():
                     logfile.replace(f'{str(logfile)}.old')
                     sys.stdout = TextIOWrapper(open(logfile,"ab",0), write_through=True)
                     sys.stderr = TextIOWrapper(open(logfile,"ab",0), write_through=True)
+            rclone.check()
             remote.sync_v7_up()
             remote.sync_multi_up()
             remote.sync_single_up()
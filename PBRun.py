@@ -11,19 +11,25 @@ import configparser
 import shlex
 import sys
 from pathlib import Path, PurePath
-from time import sleep, mktime
+from time import sleep, monotonic
 import glob
 import json
 import hjson
 from io import TextIOWrapper
-from datetime import datetime, date, timedelta
+from datetime import datetime, timedelta
 import platform
-from shutil import copy, copytree, rmtree
+from shutil import copytree, rmtree
 import os
 import traceback
-import uuid
+from threading import Lock
 from Status import InstanceStatus, InstancesStatus
 from PBCoinData import CoinData
+from LogWatcher import LogWatcher
+from CommandQueue import CommandQueue
+from ProcessRegistry import processes
+from Supervisor import Supervisor
+from LogRotate import rotator
+import LogParser
 import re
 
 class Monitor():
@@ -54,106 +60,126 @@ class Monitor():
         self.pnl_counter_today = 0
         self.pnl_counter_yesterday = 0
         self.init_found = False
+        self.yesterday = True
+        self.tb_found = False
+        self.watched = False
+        self.lock = Lock()
+        self.day = LogParser.DayBoundary()
 
     def watch_log(self):
-        yesterday = True
-        logfile = Path(f'{self.path}/passivbot.log')
-        if logfile.exists():
-            seek = False
-            if not self.log_lp:
-                self.log_lp = 0
-                seek = True
-            current_position = logfile.stat().st_size
-            with open(logfile, "r") as f:
-                f.seek(self.log_lp)
-                new_content = f.read().splitlines()
-            self.log_lp = current_position
-            tb_found = False
-            today_ts = int(mktime(date.today().timetuple()))
-            yesterday_ts = today_ts - 86400
-            if self.log_watch_ts != 0 and self.log_watch_ts < today_ts:
-                self.log_error = None
-                self.log_info = None
-                self.log_traceback = None
-                self.errors_yesterday = self.errors_today
-                self.errors_today = 0
-                self.infos_yesterday = self.infos_today
-                self.infos_today = 0
-                self.tracebacks_yesterday = self.tracebacks_today
-                self.tracebacks_today = 0
-                self.pnl_yesterday = self.pnl_today
-                self.pnl_today = 0
-                self.pnl_counter_yesterday = self.pnl_counter_today
-                self.pnl_counter_today = 0
-            for line in new_content:
-                elements = line.split()
-                if len(elements) > 1:
-                    if elements[1] == "ERROR" or elements[1] == "INFO":
-                        # check elements[0] for correct isoformat
-                        if len(elements[0]) == 19:
-                            if elements[0][4] == "-" and elements[0][7] == "-" and elements[0][10] == "T" and elements[0][13] == ":" and elements[0][16] == ":":
-                                ts = int(datetime.fromisoformat(elements[0]).timestamp())
-                                if ts < yesterday_ts:
-                                    continue
-                                else:
-                                    seek = False
-                                if ts < today_ts:
-                                    yesterday = True
-                                else:
-                                    yesterday = False
-                if seek:
+        """Called from the PBRun loop, reads the log itself unless a LogWatcher does it"""
+        with self.lock:
+            if not self.watched:
+                self.read_log()
+            else:
+                self.rollover()
+            if Path(f'{self.path}/passivbot.log').exists():
+                self.save_monitor()
+
+    def read_log(self, logfile: Path = None):
+        """Parse the new lines of passivbot.log, or of its copy in logfile while it is rotated"""
+        if logfile is None:
+            logfile = Path(f'{self.path}/passivbot.log')
+        if not logfile.exists():
+            return
+        seek = False
+        if self.log_lp is None:
+            self.log_lp = 0
+            seek = True
+        current_position = logfile.stat().st_size
+        if current_position < self.log_lp:
+            # log was truncated, start from the beginning
+            self.log_lp = 0
+        with open(logfile, "rb") as f:
+            f.seek(self.log_lp)
+            data = f.read(current_position - self.log_lp)
+        # keep an unfinished last line for the next read
+        end = data.rfind(b'\n') + 1
+        self.log_lp += end
+        self.parse_log(data[:end].decode(errors="replace").splitlines(), seek)
+
+    def rollover(self):
+        if self.log_watch_ts != 0 and self.log_watch_ts < self.day.refresh().today_ts:
+            self.log_error = None
+            self.log_info = None
+            self.log_traceback = None
+            self.tb_found = False
+            self.yesterday = False
+            self.errors_yesterday = self.errors_today
+            self.errors_today = 0
+            self.infos_yesterday = self.infos_today
+            self.infos_today = 0
+            self.tracebacks_yesterday = self.tracebacks_today
+            self.tracebacks_today = 0
+            self.pnl_yesterday = self.pnl_today
+            self.pnl_today = 0
+            self.pnl_counter_yesterday = self.pnl_counter_today
+            self.pnl_counter_today = 0
+        self.log_watch_ts = int(datetime.now().timestamp())
+
+    def parse_log(self, new_content: list, seek: bool = False):
+        self.rollover()
+        day = self.day
+        classify = LogParser.classify
+        for line in new_content:
+            kind, line_date = classify(line)
+            if line_date:
+                if line_date < day.yesterday:
                     continue
-                if tb_found:
-                    if not "ERROR" in line and not "INFO" in line and not "Traceback" in line:
-                        self.log_traceback.append(line)
-                    else:
-                        tb_found = False
-                        self.tracebacks_today += 1
-                if "ERROR" in line:
-                    if yesterday:
-                        self.errors_yesterday += 1
-                    else:
-                        self.log_error = line
-                        self.errors_today += 1
-                elif "INFO" in line:                 
-                    if yesterday:
-                        self.infos_yesterday += 1
-                    else:
-                        self.log_info = line
-                        self.infos_today += 1
-                    # Skip PNLs after restart bot
-                    if "initiating pnl" in line:
-                        self.init_found = True
-                    if "starting execution loop" in line or "done initiating bot" in line:
-                        self.init_found = False
-                    if self.init_found:
-                        continue
-                    if "new pnl" in line:
-                        if len(elements) == 7:
-                            if yesterday:
-                                self.pnl_yesterday += float(elements[5])
-                                self.pnl_counter_yesterday += int(elements[2])
-                            else:
-                                self.pnl_today += float(elements[5])
-                                self.pnl_counter_today += int(elements[2])
-                    if "balance" in line:
-                        if len(elements) == 6:
-                            if elements[4] == "->":
-                                if yesterday:
-                                    self.pnl_yesterday += (float(elements[5]) - float(elements[3]))
-                                    self.pnl_counter_yesterday += 1
-                                else:
-                                    self.pnl_today += (float(elements[5]) - float(elements[3]))
-                                    self.pnl_counter_today += 1
-                elif "Traceback" in line:
-                    if yesterday:
-                        self.tracebacks_yesterday += 1
-                    else:
-                        self.log_traceback = []
-                        self.log_traceback.append(line)
-                        tb_found = True
-            self.log_watch_ts = int(datetime.now().timestamp())
-            self.save_monitor()
+                seek = False
+                self.yesterday = line_date < day.today
+            if seek:
+                continue
+            if self.tb_found:
+                if kind == LogParser.OTHER:
+                    self.log_traceback.append(line)
+                else:
+                    self.tb_found = False
+                    self.tracebacks_today += 1
+            if kind == LogParser.ERROR:
+                if self.yesterday:
+                    self.errors_yesterday += 1
+                else:
+                    self.log_error = line
+                    self.errors_today += 1
+            elif kind == LogParser.INFO:
+                if self.yesterday:
+                    self.infos_yesterday += 1
+                else:
+                    self.log_info = line
+                    self.infos_today += 1
+                # Skip PNLs after restart bot
+                if "initiating pnl" in line:
+                    self.init_found = True
+                if "starting execution loop" in line or "done initiating bot" in line:
+                    self.init_found = False
+                if self.init_found:
+                    continue
+                if "new pnl" in line:
+                    pnl = LogParser.new_pnl(line)
+                    if pnl:
+                        if self.yesterday:
+                            self.pnl_yesterday += pnl[0]
+                            self.pnl_counter_yesterday += pnl[1]
+                        else:
+                            self.pnl_today += pnl[0]
+                            self.pnl_counter_today += pnl[1]
+                if "balance" in line:
+                    change = LogParser.balance_change(line)
+                    if change is not None:
+                        if self.yesterday:
+                            self.pnl_yesterday += change
+                            self.pnl_counter_yesterday += 1
+                        else:
+                            self.pnl_today += change
+                            self.pnl_counter_today += 1
+            elif kind == LogParser.TRACEBACK:
+                if self.yesterday:
+                    self.tracebacks_yesterday += 1
+                else:
+                    self.log_traceback = []
+                    self.log_traceback.append(line)
+                    self.tb_found = True
 
     def save_monitor(self):
         monitor_file = Path(f'{self.path}/monitor.json')
@@ -290,24 +316,28 @@ class RunSingle():
             return True
         return False
 
+    def key(self):
+        return f'single {self.user} {self.symbol}'
+
+    def match(self, cmdline: list):
+        return self.user in cmdline and self.symbol in cmdline and any("passivbot.py" in sub for sub in cmdline)
+
     def pid(self):
-        for process in psutil.process_iter():
+        process = processes.find(self.key(), self.match)
+        if process:
             try:
-                cmdline = process.cmdline()
-            except psutil.NoSuchProcess:
-                pass
-            except psutil.AccessDenied:
-                pass
-            if self.user in cmdline and self.symbol in cmdline and any("passivbot.py" in sub for sub in cmdline):
                 self.monitor.start_time = process.create_time()
                 self.monitor.memory = process.memory_info()
                 self.monitor.cpu = process.cpu_percent()
-                return process
+            except psutil.Error:
+                return None
+        return process
 
     def stop(self):
         if self.is_running():
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Stop: {self.user} {self.symbol}')
             self.pid().kill()
+            processes.forget(self.key())
 
     def start(self):
         if not self.is_running():
@@ -322,9 +352,10 @@ class RunSingle():
             if platform.system() == "Windows":
                 creationflags = subprocess.DETACHED_PROCESS
                 creationflags |= subprocess.CREATE_NO_WINDOW
-                subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, creationflags=creationflags)
+                bot = subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, creationflags=creationflags)
             else:
-                subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, start_new_session=True)
+                bot = subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, start_new_session=True)
+            processes.register(self.key(), bot.pid)
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Start Single: {cmd_end}')
         # wait until passivbot is running
         for i in range(10):
@@ -333,13 +364,7 @@ class RunSingle():
             sleep(1)
 
     def clean_log(self):
-        logfile = Path(f'{self.path}/passivbot.log')
-        if logfile.exists():
-            if logfile.stat().st_size >= 10485760:
-                logfile_old = Path(f'{str(logfile)}.old')
-                copy(logfile,logfile_old)
-                with open(logfile,'r+') as file:
-                    file.truncate()
+        rotator.rotate(Path(f'{self.path}/passivbot.log'), self.monitor)
 
     def create_parameters(self):
         """Create the list of parameters used when running passivbot single instance.
@@ -473,24 +498,28 @@ class RunMulti():
             return True
         return False
 
+    def key(self):
+        return f'multi {self.user}'
+
+    def match(self, cmdline: list):
+        return any(self.user in sub for sub in cmdline) and any("passivbot_multi.py" in sub for sub in cmdline)
+
     def pid(self):
-        for process in psutil.process_iter():
+        process = processes.find(self.key(), self.match)
+        if process:
             try:
-                cmdline = process.cmdline()
-            except psutil.NoSuchProcess:
-                pass
-            except psutil.AccessDenied:
-                pass
-            if any(self.user in sub for sub in cmdline) and any("passivbot_multi.py" in sub for sub in cmdline):
                 self.monitor.start_time = process.create_time()
                 self.monitor.memory = process.memory_info()
                 self.monitor.cpu = process.cpu_percent()
-                return process
+            except psutil.Error:
+                return None
+        return process
 
     def stop(self):
         if self.is_running():
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Stop: passivbot_multi.py {self.path}/multi_run.hjson')
             self.pid().kill()
+            processes.forget(self.key())
 
     def start(self):
         if not self.is_running():
@@ -500,9 +529,10 @@ class RunMulti():
             if platform.system() == "Windows":
                 creationflags = subprocess.DETACHED_PROCESS
                 creationflags |= subprocess.CREATE_NO_WINDOW
-                subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, creationflags=creationflags)
+                bot = subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, creationflags=creationflags)
             else:
-                subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, start_new_session=True)
+                bot = subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, start_new_session=True)
+            processes.register(self.key(), bot.pid)
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Start: passivbot_multi.py {self.path}/multi_run.hjson')
         # wait until passivbot is running
         for i in range(10):
@@ -511,13 +541,7 @@ class RunMulti():
             sleep(1)
 
     def clean_log(self):
-        logfile = Path(f'{self.path}/passivbot.log')
-        if logfile.exists():
-            if logfile.stat().st_size >= 10485760:
-                logfile_old = Path(f'{str(logfile)}.old')
-                copy(logfile,logfile_old)
-                with open(logfile,'r+') as file:
-                    file.truncate()
+        rotator.rotate(Path(f'{self.path}/passivbot.log'), self.monitor)
 
     def create_multi_hjson(self):
         # Write running Version to file
@@ -626,25 +650,30 @@ class RunV7():
             return True
         return False
 
+    def key(self):
+        return f'v7 {self.user}'
+
+    def match(self, cmdline: list):
+        if any(self.user in sub for sub in cmdline) and any("main.py" in sub for sub in cmdline):
+            return cmdline[-1].endswith(f'/{self.user}/config_run.json') or cmdline[-1].endswith(f'\{self.user}\config_run.json')
+        return False
+
     def pid(self):
-        for process in psutil.process_iter():
+        process = processes.find(self.key(), self.match)
+        if process:
             try:
-                cmdline = process.cmdline()
-            except psutil.NoSuchProcess:
-                pass
-            except psutil.AccessDenied:
-                pass
-            if any(self.user in sub for sub in cmdline) and any("main.py" in sub for sub in cmdline):
-                if cmdline[-1].endswith(f'/{self.user}/config_run.json') or cmdline[-1].endswith(f'\{self.user}\config_run.json'):
-                    self.monitor.start_time = process.create_time()
-                    self.monitor.memory = process.memory_info()
-                    self.monitor.cpu = process.cpu_percent()
-                    return process
+                self.monitor.start_time = process.create_time()
+                self.monitor.memory = process.memory_info()
+                self.monitor.cpu = process.cpu_percent()
+            except psutil.Error:
+                return None
+        return process
 
     def stop(self):
         if self.is_running():
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Stop: passivbot v7 {self.path}/config_run.json')
             self.pid().kill()
+            processes.forget(self.key())
 
     def start(self):
         if not self.is_running():
@@ -657,9 +686,10 @@ class RunV7():
             if platform.system() == "Windows":
                 creationflags = subprocess.DETACHED_PROCESS
                 creationflags |= subprocess.CREATE_NO_WINDOW
-                subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, creationflags=creationflags)
+                bot = subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, creationflags=creationflags)
             else:
-                subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, start_new_session=True)
+                bot = subprocess.Popen(cmd, stdout=log, stderr=log, cwd=self.pbdir, text=True, start_new_session=True)
+            processes.register(self.key(), bot.pid)
             os.environ['PATH'] = old_os_path
             print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Start: passivbot_v7 {self.path}/config_run.json')
         # wait until passivbot is running
@@ -669,13 +699,7 @@ class RunV7():
             sleep(1)
 
     def clean_log(self):
-        logfile = Path(f'{self.path}/passivbot.log')
-        if logfile.exists():
-            if logfile.stat().st_size >= 10485760:
-                logfile_old = Path(f'{str(logfile)}.old')
-                copy(logfile,logfile_old)
-                with open(logfile,'r+') as file:
-                    file.truncate()
+        rotator.rotate(Path(f'{self.path}/passivbot.log'), self.monitor)
 
     def create_v7_running_version(self):
         # Write running Version to file
@@ -798,6 +822,7 @@ class PBRun():
         self.run_multi = []
         self.run_single = []
         self.run_v7 = []
+        self.log_watcher = None
         self.index = 0
         self.pbgdir = Path.cwd()
         pb_config = configparser.ConfigParser()
@@ -819,15 +844,23 @@ class PBRun():
             self.activate_v7_ts = int(pb_config.get("main", "activate_v7_ts"))
         else:
             self.activate_v7_ts = 0
+        # Status files for servers of older versions
+        if pb_config.has_option("pbremote", "legacy_status"):
+            legacy_status = pb_config.getboolean("pbremote", "legacy_status")
+        else:
+            legacy_status = False
         self.instances_status = InstancesStatus(f'{self.pbgdir}/data/cmd/status.json')
         self.instances_status.pbname = self.name
         self.instances_status.activate_ts = self.activate_ts
+        self.instances_status.legacy = legacy_status
         self.instances_status_single = InstancesStatus(f'{self.pbgdir}/data/cmd/status_single.json')
         self.instances_status_single.pbname = self.name
         self.instances_status_single.activate_ts = self.activate_single_ts
+        self.instances_status_single.legacy = legacy_status
         self.instances_status_v7 = InstancesStatus(f'{self.pbgdir}/data/cmd/status_v7.json')
         self.instances_status_v7.pbname = self.name
         self.instances_status_v7.activate_ts = self.activate_v7_ts
+        self.instances_status_v7.legacy = legacy_status
         # Init pbdirs
         self.pbdir = None
         self.pb7dir = None
@@ -877,6 +910,7 @@ class PBRun():
         self.cmd_path = f'{self.pbgdir}/data/cmd'
         if not Path(self.cmd_path).exists():
             Path(self.cmd_path).mkdir(parents=True)            
+        self.commands = CommandQueue(self.cmd_path)
         # Init pid
         self.piddir = Path(f'{self.pbgdir}/data/pid')
         if not self.piddir.exists():
@@ -1019,15 +1053,18 @@ class PBRun():
                 if v7.path == run_v7.path:
                     self.run_v7.remove(v7)
                     self.run_v7.append(run_v7)
+                    self.watch_monitor(run_v7.monitor)
                     # v7.version = run_v7.version
                     return
             self.run_v7.append(run_v7)
+            self.watch_monitor(run_v7.monitor)
     
     def remove_v7(self, run_v7: RunV7):
         if run_v7:
             for v7 in self.run_v7:
                 if v7.path == run_v7.path:
                     self.run_v7.remove(v7)
+                    self.unwatch_monitor(v7.monitor)
                     return
 
     def add_multi(self, run_multi: RunMulti):
@@ -1036,15 +1073,18 @@ class PBRun():
                 if multi.path == run_multi.path:
                     self.run_multi.remove(multi)
                     self.run_multi.append(run_multi)
+                    self.watch_monitor(run_multi.monitor)
                     # multi.version = run_multi.version
                     return
             self.run_multi.append(run_multi)
+            self.watch_monitor(run_multi.monitor)
 
     def remove_multi(self, run_multi: RunMulti):
         if run_multi:
             for multi in self.run_multi:
                 if multi.path == run_multi.path:
                     self.run_multi.remove(multi)
+                    self.unwatch_monitor(multi.monitor)
                     return
 
     def add_single(self, run_single: RunSingle):
@@ -1054,14 +1094,24 @@ class PBRun():
                     single.version = run_single.version
                     return
             self.run_single.append(run_single)
+            self.watch_monitor(run_single.monitor)
 
     def remove_single(self, run_single: RunSingle):
         if run_single:
             for single in self.run_single:
                 if single.path == run_single.path:
                     self.run_single.remove(single)
+                    self.unwatch_monitor(single.monitor)
                     return
 
+    def watch_monitor(self, monitor: Monitor):
+        if self.log_watcher:
+            self.log_watcher.add(monitor)
+
+    def unwatch_monitor(self, monitor: Monitor):
+        if self.log_watcher:
+            self.log_watcher.remove(monitor)
+
     def find_running_version(self, path: str):
         version = 0
         version_file = Path(f'{path}/running_version.txt')
@@ -1072,35 +1122,25 @@ class PBRun():
 
     def update_status(self, status_file : str, rserver : str):
         """Function only called on PBRemote"""
-        unique = str(uuid.uuid4())
-        cfile = Path(f'{self.cmd_path}/update_status_{unique}.cmd')
         cfg = ({
             "rserver": rserver,
             "status_file": str(status_file)})
-        with open(cfile, "w", encoding='utf-8') as f:
-            json.dump(cfg, f)
+        self.commands.put("update_status", cfg)
 
     def has_update_status(self):
         """Checks for new status, and update the status files accordingly.
         
         Checks for any file called update_status.cmd, and adds it to the status.json file already existant, required to run PB single and multi.
         """
-        p = str(Path(f'{self.cmd_path}/update_status_*.cmd'))
-        status_files = glob.glob(p)
-        for cfile in status_files:
-            cfile = Path(cfile)
-            if cfile.exists():
-                with open(cfile, "r", encoding='utf-8') as f:
-                    cfg = json.load(f)
-                    rserver = cfg["rserver"]
-                    status_file = cfg["status_file"]
-                    if status_file.split('/')[-1] == 'status.json':
-                        self.update_from_status(status_file, rserver)
-                    elif status_file.split('/')[-1] == 'status_single.json':
-                        self.update_from_status_single(status_file, rserver)
-                    elif status_file.split('/')[-1] == 'status_v7.json':
-                        self.update_from_status_v7(status_file, rserver)
-                cfile.unlink(missing_ok=True)
+        for cfg in self.commands.get("update_status"):
+            rserver = cfg["rserver"]
+            status_file = cfg["status_file"]
+            if status_file.split('/')[-1] == 'status.json':
+                self.update_from_status(status_file, rserver)
+            elif status_file.split('/')[-1] == 'status_single.json':
+                self.update_from_status_single(status_file, rserver)
+            elif status_file.split('/')[-1] == 'status_v7.json':
+                self.update_from_status_v7(status_file, rserver)
 
     def update_from_status_v7(self, status_file : str, rserver : str):
         """Updates the v7 status based on the provided status file.
@@ -1302,43 +1342,33 @@ class PBRun():
                 self.instances_status.save()
 
     def activate(self, instance : str, multi : bool, version : int = None):
-        unique = str(uuid.uuid4())
-        cfile = Path(f'{self.cmd_path}/activate_{unique}.cmd')
         cfg = ({
             "instance": instance,
             "multi": multi,
             "version": version})
-        with open(cfile, "w", encoding='utf-8') as f:
-            json.dump(cfg, f)
+        self.commands.put("activate", cfg)
 
     def has_activate(self):
         """Checks for activation file
 
         This method scans for activation files (activate_*.cmd) in the cmd directory. If an activation file exists, it reads the new configuration to activate and start it as a single, multi or v7 config. Depending on the configuration, it either create a single, multi or v7 config using their respective watch function.
         """
-        p = str(Path(f'{self.cmd_path}/activate_*.cmd'))
-        activates = glob.glob(p)
-        for cfile in activates:
-            cfile = Path(cfile)
-            if cfile.exists():
-                with open(cfile, "r", encoding='utf-8') as f:
-                    cfg = json.load(f)
-                    instance = cfg["instance"]
-                    multi = cfg["multi"]
-                    if "version" in cfg:
-                        version = cfg["version"]
-                    else:
-                        version = None
-                    if version == "7":
-                        self.update_activate_v7()
-                        self.watch_v7([f'{self.v7_path}/{instance}'])
-                    elif multi:
-                        self.update_activate()
-                        self.watch_multi([f'{self.multi_path}/{instance}'])
-                    else:
-                        self.update_activate_single()
-                        self.watch_single([f'{self.single_path}/{instance}'])
-                cfile.unlink(missing_ok=True)
+        for cfg in self.commands.get("activate"):
+            instance = cfg["instance"]
+            multi = cfg["multi"]
+            if "version" in cfg:
+                version = cfg["version"]
+            else:
+                version = None
+            if version == "7":
+                self.update_activate_v7()
+                self.watch_v7([f'{self.v7_path}/{instance}'])
+            elif multi:
+                self.update_activate()
+                self.watch_multi([f'{self.multi_path}/{instance}'])
+            else:
+                self.update_activate_single()
+                self.watch_single([f'{self.single_path}/{instance}'])
     
     def update_activate_v7(self):
         self.activate_v7_ts = int(datetime.now().timestamp())
@@ -1589,42 +1619,61 @@ def main():
         print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Error: PBRun already started')
         exit(1)
     run.save_pid()
+    run.log_watcher = LogWatcher()
+    run.log_watcher.start()
+    run.commands.watch()
     run.watch_v7()
     run.watch_multi()
     run.watch_single()
-    count = 0
-    while True:
-        try:
-            if logfile.exists():
-                if logfile.stat().st_size >= 1048576:
-                    logfile.replace(f'{str(logfile)}.old')
-                    sys.stdout = TextIOWrapper(open(logfile,"ab",0), write_through=True)
-                    sys.stderr = TextIOWrapper(open(logfile,"ab",0), write_through=True)
+    # Tasks that start or stop bots must not run at the same time
+    bots = Lock()
+
+    def instances():
+        # Copy of the bot lists, has_activate changes them while the log tasks run without the lock
+        return list(run.run_v7) + list(run.run_multi) + list(run.run_single)
+
+    def handle_commands():
+        # Handle commands as soon as they arrive, at least every 5s
+        run.commands.wait(5)
+        with bots:
+            processes.tick()
             run.has_activate()
             run.has_update_status()
-            for run_v7 in run.run_v7:
-                run_v7.watch()
-                run_v7.watch_dynamic()
-                run_v7.monitor.watch_log()
-            for run_multi in run.run_multi:
-                run_multi.watch()
-                run_multi.watch_dynamic()
-                run_multi.monitor.watch_log()
-            for run_single in run.run_single:
-                run_single.watch()
-                run_single.monitor.watch_log()
-            if count%2 == 0:
-                for run_v7 in run.run_v7:
-                    run_v7.clean_log()
-                for run_multi in run.run_multi:
-                    run_multi.clean_log()
-                for run_single in run.run_single:
-                    run_single.clean_log()
-            sleep(5)
-            count += 1
-        except Exception as e:
-            print(f'Something went wrong, but continue {e}')
-            traceback.print_exc()
+
+    def watch_bots():
+        with bots:
+            processes.tick()
+            for instance in instances():
+                instance.watch()
+
+    def watch_dynamic():
+        with bots:
+            for instance in list(run.run_v7) + list(run.run_multi):
+                instance.watch_dynamic()
+
+    def watch_logs():
+        for instance in instances():
+            instance.monitor.watch_log()
+
+    def clean_logs():
+        for instance in instances():
+            instance.clean_log()
+
+    def rotate_log():
+        if logfile.exists():
+            if logfile.stat().st_size >= 1048576:
+                logfile.replace(f'{str(logfile)}.old')
+                sys.stdout = TextIOWrapper(open(logfile,"ab",0), write_through=True)
+                sys.stderr = TextIOWrapper(open(logfile,"ab",0), write_through=True)
+
+    supervisor = Supervisor(f'{str(dest)}/PBRun_tasks.json')
+    supervisor.add("commands", handle_commands, interval=0, timeout=300)
+    supervisor.add("watch", watch_bots, interval=5, timeout=120)
+    supervisor.add("dynamic_ignore", watch_dynamic, interval=5, timeout=120)
+    supervisor.add("watch_log", watch_logs, interval=5, timeout=60)
+    supervisor.add("clean_log", clean_logs, interval=10, timeout=120)
+    supervisor.add("rotate_log", rotate_log, interval=60, timeout=60)
+    supervisor.run()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
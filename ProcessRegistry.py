@@ -0,0 +1,65 @@
+"""
+Registry of the passivbot processes PBRun watches.
+
+The process of a bot is remembered by key after it was spawned or found once,
+and is validated with its create time, that psutil reads from /proc/<pid>, so
+pid reuse is detected. Only bots that are not known are searched in a snapshot
+of the process table with the cmdlines, taken at most once per PBRun tick and
+shared by all bots.
+"""
+import psutil
+from threading import Lock
+
+class ProcessRegistry():
+    def __init__(self):
+        self.processes = {}
+        self.snapshot = None
+        self.lock = Lock()
+
+    def tick(self):
+        """Start of a PBRun tick, the next search takes a new snapshot"""
+        with self.lock:
+            self.snapshot = None
+
+    def alive(self, process: psutil.Process):
+        try:
+            return process.is_running() and process.status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
+
+    def register(self, key: str, pid: int):
+        """Remember a spawned bot"""
+        try:
+            process = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            return
+        with self.lock:
+            self.processes[key] = process
+
+    def forget(self, key: str):
+        with self.lock:
+            self.processes.pop(key, None)
+            self.snapshot = None
+
+    def find(self, key: str, match):
+        """The process of key or the first process whose cmdline matches, None if there is none"""
+        with self.lock:
+            process = self.processes.get(key)
+        if process and self.alive(process):
+            return process
+        with self.lock:
+            self.processes.pop(key, None)
+            if self.snapshot is None:
+                self.snapshot = []
+                for process in psutil.process_iter(['cmdline']):
+                    if process.info["cmdline"]:
+                        self.snapshot.append((process, process.info["cmdline"]))
+            snapshot = self.snapshot
+        for process, cmdline in snapshot:
+            if match(cmdline) and self.alive(process):
+                with self.lock:
+                    self.processes[key] = process
+                return process
+        return None
+
+processes = ProcessRegistry()
@@ -0,0 +1,85 @@
+"""
+Rate limiting and retries for the exchange API requests of PBGui.
+
+Every exchange has one token bucket, shared by all users and threads of the
+process, because most limits are counted per ip. Requests that fail with
+a rate limit (429) or with the exchange not being available (5xx,
+maintenance) are retried with exponential backoff, all other errors are
+raised at once. Requests, retries, failures and the time spent waiting for
+the bucket are counted per exchange.
+"""
+import ccxt
+import random
+from time import sleep, monotonic
+from datetime import datetime
+from threading import Lock
+
+# 429 and 5xx, RateLimitExceeded is not a DDoSProtection in ccxt
+RETRY_ERRORS = (ccxt.DDoSProtection, ccxt.RateLimitExceeded, ccxt.ExchangeNotAvailable)
+
+class TokenBucket():
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = monotonic()
+        self.lock = Lock()
+
+    def acquire(self):
+        """Take a token, waits until one is available, returns the seconds waited"""
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # A negative balance reserves the next tokens for the waiting callers
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+class RequestLimiter():
+    def __init__(self, name: str, rate: float, retries: int = 5, backoff: float = 1.0, max_backoff: float = 60.0):
+        self.name = name
+        self.bucket = TokenBucket(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock = Lock()
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.waited = 0.0
+
+    def count(self, **counters):
+        with self.lock:
+            for counter, value in counters.items():
+                setattr(self, counter, getattr(self, counter) + value)
+
+    def call(self, func, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            self.count(waited=self.bucket.acquire(), requests=1)
+            try:
+                return func(*args, **kwargs)
+            except RETRY_ERRORS as e:
+                if attempt == self.retries:
+                    self.count(failures=1)
+                    raise
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(1.0, 1.25)
+                self.count(retried=1)
+                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} {self.name}: {type(e).__name__}, retry {attempt + 1} in {delay:.1f}s')
+                sleep(delay)
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "retries": self.retried, "failures": self.failures, "waited": round(self.waited, 1)}
+
+limiters = {}
+limiters_lock = Lock()
+
+def limiter(name: str, rate: float):
+    """The shared RequestLimiter of an exchange, rate is only used when it is created"""
+    with limiters_lock:
+        if name not in limiters:
+            limiters[name] = RequestLimiter(name, rate)
+        return limiters[name]
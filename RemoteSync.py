@@ -0,0 +1,344 @@
+"""
+Manifest based sync between PBRemote servers.
+
+Every server publishes manifest_<name>.json at the top of the bucket with the
+md5 of every file it uploaded. Uploads only copy the files whose hash changed,
+peers only download a manifest when its size or modtime changed and then only
+the files whose hash differs from their local copy. Servers without a manifest
+are synced with a full rclone sync like before.
+"""
+import os
+import json
+import base64
+import socket
+import secrets
+import hashlib
+import fnmatch
+import platform
+import subprocess
+import urllib.request
+import urllib.error
+from pathlib import Path, PurePath
+from time import sleep
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+class Rclone():
+    """rclone operations used by PBRemote
+
+    After start() the operations go to one long running 'rclone rcd' through
+    its remote control API, so config, auth and connections to the bucket are
+    set up once. Without a running daemon every operation starts its own
+    rclone process. run_all() executes several operations concurrently.
+
+    The daemon is only started and restarted by the main thread with start()
+    and check(), while it is down the operations use rclone commands.
+    """
+    def __init__(self, workers: int = 8):
+        self.workers = workers
+        self.executor = None
+        self.rcd = None
+        self.url = None
+        self.auth = None
+
+    def log(self, message: str):
+        pbgdir = Path.cwd()
+        with open(Path(f'{pbgdir}/data/logs/sync.log'), "a", encoding='utf-8') as f:
+            f.write(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} {message}\n')
+
+    def start(self):
+        pbgdir = Path.cwd()
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        password = secrets.token_hex(16)
+        self.url = f'http://127.0.0.1:{port}'
+        self.auth = 'Basic ' + base64.b64encode(f'pbgui:{password}'.encode()).decode()
+        env = dict(os.environ, RCLONE_RC_USER='pbgui', RCLONE_RC_PASS=password)
+        cmd = ['rclone', 'rcd', '-v', f'--rc-addr=127.0.0.1:{port}']
+        with open(Path(f'{pbgdir}/data/logs/sync.log'), "ab") as log:
+            if platform.system() == "Windows":
+                creationflags = subprocess.CREATE_NO_WINDOW
+                self.rcd = subprocess.Popen(cmd, stdout=log, stderr=log, cwd=pbgdir, env=env, creationflags=creationflags)
+            else:
+                # Own session, a Ctrl-C of PBRemote must not stop a sync in the middle, stop() ends it
+                self.rcd = subprocess.Popen(cmd, stdout=log, stderr=log, cwd=pbgdir, env=env, start_new_session=True)
+        for i in range(50):
+            if self.rcd.poll() is not None:
+                break
+            try:
+                self.request('rc/noop', {})
+                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Start: rclone rcd on port {port}')
+                return True
+            except OSError:
+                sleep(0.2)
+        print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Warning: Can not start rclone rcd, use rclone commands')
+        self.stop()
+        return False
+
+    def stop(self):
+        if self.rcd:
+            if self.rcd.poll() is None:
+                self.rcd.terminate()
+                self.rcd.wait()
+            self.rcd = None
+
+    def restart(self):
+        if self.rcd:
+            self.stop()
+            self.start()
+
+    def running(self):
+        return self.rcd is not None and self.rcd.poll() is None
+
+    def check(self):
+        """Restart a rcd that stopped, called by the main thread"""
+        rcd = self.rcd
+        if rcd and rcd.poll() is not None:
+            self.log(f'rclone rcd stopped with {rcd.returncode}, restart')
+            self.stop()
+            self.start()
+
+    def request(self, method: str, params: dict):
+        request = urllib.request.Request(f'{self.url}/{method}', data=json.dumps(params).encode(), headers={'Content-Type': 'application/json', 'Authorization': self.auth})
+        with urllib.request.urlopen(request, timeout=3600) as response:
+            return json.load(response)
+
+    def call(self, method: str, params: dict):
+        """Call the rc API, returns the result or None on error"""
+        try:
+            return self.request(method, params)
+        except urllib.error.HTTPError as e:
+            try:
+                error = json.load(e).get("error")
+            except ValueError:
+                error = e.reason
+            self.log(f'rc {method} {params} failed: {error}')
+        except OSError as e:
+            # A dead rcd is restarted by check() of the main thread
+            self.log(f'rc {method} {params} failed: {e}')
+        return None
+
+    def run(self, args: list, capture: bool = False):
+        """Run an rclone command, output goes to data/logs/sync.log, stdout is returned if capture"""
+        pbgdir = Path.cwd()
+        cmd = ['rclone'] + [str(arg) for arg in args]
+        logfile = Path(f'{pbgdir}/data/logs/sync.log')
+        with open(logfile, "ab") as log:
+            stdout = subprocess.PIPE if capture else log
+            if platform.system() == "Windows":
+                creationflags = subprocess.CREATE_NO_WINDOW
+                return subprocess.run(cmd, stdout=stdout, stderr=log, cwd=pbgdir, text=True, creationflags=creationflags)
+            else:
+                return subprocess.run(cmd, stdout=stdout, stderr=log, cwd=pbgdir, text=True)
+
+    def copyto(self, src, dst):
+        if self.running():
+            src_fs, src_remote = split(src)
+            dst_fs, dst_remote = split(dst)
+            return self.call('operations/copyfile', {"srcFs": src_fs, "srcRemote": src_remote, "dstFs": dst_fs, "dstRemote": dst_remote}) is not None
+        return self.run(['copyto', '-v', src, dst]).returncode == 0
+
+    def deletefile(self, path):
+        if self.running():
+            fs, remote = split(path)
+            return self.call('operations/deletefile', {"fs": fs, "remote": remote}) is not None
+        return self.run(['deletefile', '-v', path]).returncode == 0
+
+    def lsjson(self, path):
+        """Top level listing of path or None on error"""
+        if self.running():
+            result = self.call('operations/list', {"fs": str(path), "remote": ""})
+            return result["list"] if result else None
+        result = self.run(['lsjson', '--max-depth', '1', path], capture=True)
+        if result.returncode != 0:
+            return None
+        try:
+            return json.loads(result.stdout)
+        except ValueError as e:
+            self.log(f'lsjson {path} failed: {e}')
+            return None
+
+    def sync(self, src, dst, include: list = [], exclude: list = []):
+        if self.running():
+            return self.call('sync/sync', {"srcFs": str(src), "dstFs": str(dst), "_filter": filter_rules(include, exclude)}) is not None
+        return self.run(['sync', '-v', src, dst] + filter_args(include, exclude)).returncode == 0
+
+    def delete(self, path, include: list = [], exclude: list = []):
+        if self.running():
+            return self.call('operations/delete', {"fs": str(path), "_filter": filter_rules(include, exclude)}) is not None
+        return self.run(['delete', '-v', path] + filter_args(include, exclude)).returncode == 0
+
+    def run_all(self, jobs: list):
+        """Run jobs of (operation, *args) concurrently, returns their results in order"""
+        if len(jobs) < 2:
+            return [job[0](*job[1:]) for job in jobs]
+        if not self.executor:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="rclone")
+        futures = [self.executor.submit(job[0], *job[1:]) for job in jobs]
+        return [future.result() for future in futures]
+
+def split(path):
+    """Split a local path or remote:path into the fs and remote rc parameters"""
+    if isinstance(path, PurePath):
+        return str(path.parent), path.name
+    fs, sep, remote = str(path).rpartition('/')
+    if not sep:
+        fs, sep, remote = str(path).rpartition(':')
+        fs += sep
+    return fs, remote
+
+def filter_rules(include: list, exclude: list):
+    rules = {}
+    if include:
+        rules["IncludeRule"] = include
+    if exclude:
+        rules["ExcludeRule"] = exclude
+    return rules
+
+def filter_args(include: list, exclude: list):
+    args = []
+    if include:
+        args.extend(['--include', f'{{{",".join(include)}}}'])
+    if exclude:
+        args.extend(['--exclude', f'{{{",".join(exclude)}}}'])
+    return args
+
+rclone = Rclone()
+
+def md5(file: Path):
+    with open(file, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+def matches(path: str, include: list, exclude: list = []):
+    """rclone like filter on the file name"""
+    name = path.rsplit('/', 1)[-1]
+    if not any(fnmatch.fnmatchcase(name, pattern) for pattern in include):
+        return False
+    return not any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude)
+
+class Manifest():
+    VERSION = 1
+
+    def __init__(self, file: str):
+        self.file = Path(file)
+        self.name = None
+        self.timestamp = 0
+        # sync paths that are completely described by files
+        self.synced = []
+        # remote path: [md5, size, mtime_ns]
+        self.files = {}
+        self.load()
+
+    def load(self):
+        if not self.file.exists():
+            return
+        try:
+            with open(self.file, "r", encoding='utf-8') as f:
+                cfg = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f'{str(self.file)} is corrupted {e}')
+            return
+        if cfg.get("version") != self.VERSION:
+            return
+        self.name = cfg.get("name")
+        self.timestamp = cfg.get("timestamp", 0)
+        self.synced = cfg.get("synced", [])
+        self.files = cfg.get("files", {})
+
+    def save(self):
+        self.timestamp = round(datetime.now().timestamp())
+        cfg = ({
+            "version": self.VERSION,
+            "name": self.name,
+            "timestamp": self.timestamp,
+            "synced": self.synced,
+            "files": self.files})
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.file.with_suffix('.tmp')
+        with open(tmp, "w", encoding='utf-8') as f:
+            json.dump(cfg, f)
+        os.replace(tmp, self.file)
+
+    def entries(self, prefix: str, include: list, exclude: list = []):
+        return {path: entry for path, entry in self.files.items() if path.startswith(f'{prefix}/') and matches(path, include, exclude)}
+
+    def scan(self, local_dir: Path, prefix: str, include: list):
+        """Entries for the local files, files with unchanged size and mtime keep their hash"""
+        files = {}
+        for root, dirs, names in os.walk(local_dir):
+            for name in names:
+                if not matches(name, include):
+                    continue
+                file = Path(root, name)
+                try:
+                    st = file.stat()
+                    path = f'{prefix}/{file.relative_to(local_dir).as_posix()}'
+                    entry = self.files.get(path)
+                    if entry and entry[1] == st.st_size and entry[2] == st.st_mtime_ns:
+                        files[path] = entry
+                    else:
+                        files[path] = [md5(file), st.st_size, st.st_mtime_ns]
+                except FileNotFoundError:
+                    pass
+        return files
+
+    def update(self, prefix: str, include: list, files: dict):
+        for path in self.entries(prefix, include):
+            del self.files[path]
+        self.files.update(files)
+
+def push(manifest: Manifest, bucket: str, prefix: str, local_dir: Path, include: list, spath: str = None):
+    """Upload the files of local_dir that changed since the manifest and remove the ones that are gone
+
+    The first push of spath (default prefix) is a full sync, that removes
+    anything an older version left in the bucket. Files that fail keep their
+    old entry and are retried with the next push. Returns True if the bucket
+    changed, the caller then publishes the manifest.
+    """
+    spath = spath or prefix
+    changed = False
+    if spath not in manifest.synced:
+        if not rclone.sync(local_dir, f'{bucket}/{prefix}', include=include):
+            return False
+        files = manifest.scan(local_dir, prefix, include)
+        manifest.synced.append(spath)
+        changed = True
+    else:
+        remote = manifest.entries(prefix, include)
+        files = manifest.scan(local_dir, prefix, include)
+        copies = [path for path, entry in files.items() if path not in remote or remote[path][0] != entry[0]]
+        deletes = [path for path in remote if path not in files]
+        jobs = [(rclone.copyto, PurePath(local_dir, path[len(prefix) + 1:]), f'{bucket}/{path}') for path in copies]
+        jobs.extend((rclone.deletefile, f'{bucket}/{path}') for path in deletes)
+        results = rclone.run_all(jobs)
+        for path, ok in zip(copies + deletes, results):
+            if ok:
+                changed = True
+            elif path in remote:
+                files[path] = remote[path]
+            else:
+                del files[path]
+    manifest.update(prefix, include, files)
+    return changed
+
+def pull(manifest: Manifest, bucket: str, prefix: str, local_dir: Path, include: list, exclude: list = []):
+    """Copy the files of prefix that differ from the local copy and remove the ones the peer removed
+
+    Returns True if every copy succeeded.
+    """
+    entries = manifest.entries(prefix, include, exclude)
+    local_dir = Path(local_dir)
+    jobs = []
+    for path, entry in entries.items():
+        file = Path(local_dir, path[len(prefix) + 1:])
+        if not file.exists() or md5(file) != entry[0]:
+            jobs.append((rclone.copyto, f'{bucket}/{path}', file))
+    results = rclone.run_all(jobs)
+    for root, dirs, names in os.walk(local_dir):
+        for name in names:
+            file = Path(root, name)
+            path = f'{prefix}/{file.relative_to(local_dir).as_posix()}'
+            if path not in entries and matches(path, include, exclude):
+                file.unlink(missing_ok=True)
+    return all(results)
@@ -6,9 +6,19 @@ The collected data are stored in a list of statuses (InsancesStatusList()), wher
 Each status includes informations such as the name, the version, where it is supposed to run, whether it is a multi configuration, and whether it is running on the local server. 
 
 This status list is then sent through PBRemote to the remote storage, enabling us to manage bots from the master server.
+
+The status is kept in a journal of json lines next to the status file (status.json -> status.jsonl), written by PBRun only. The
+first line is a header with the id of the journal, followed by a snapshot of all instances and then small records with the changes
+of every save(). Records are appended in one write and readers only apply complete lines, when the journal grows too long it is
+compacted into a new snapshot that replaces the file with a rename. Readers remember their offset and only apply the records that
+were appended since their last load. Servers of older versions only read the status file, with legacy_status = True in the
+[pbremote] section of pbgui.ini it is still written as one json document after every save() that changed something. Without a
+journal the status file is read.
 """
 from pathlib import Path
+import os
 import json
+import uuid
 
 class InstanceStatus():
     """Stores information about one passivbot configuration."""
@@ -21,16 +31,30 @@ class InstanceStatus():
 
 class InstancesStatus():
     """Stores every InstanceStatus into status.json, manages and loads them."""
+    JOURNAL_VERSION = 1
+    # Records appended before the journal is compacted
+    COMPACT_RECORDS = 100
+
     def __init__(self, status_file: str): 
         """status_file (str): Path to the status file."""
         self.instances = []
         self.index = 0
         self.pbname = None
         self.activate_ts = 0
+        self.activate_pbname = None
+        # Write the status file for servers of older versions
+        self.legacy = False
 #        pbgdir = Path.cwd()
 #        self.status_file = f'{pbgdir}/data/cmd/status.json'
         self.status_file = status_file
+        self.journal_file = str(Path(status_file).with_suffix(".jsonl"))
         self.status_ts = 0
+        # Journal state, what is on disk up to offset
+        self.journal_id = None
+        self.offset = 0
+        self.records = 0
+        self.saved = {}
+        self.saved_activate = None
         self.load()
 
     def __iter__(self):
@@ -105,40 +129,93 @@ class InstancesStatus():
                 return instance.version
         return 0
 
+    def source(self):
+        """The journal if there is one, the status file otherwise"""
+        journal = Path(self.journal_file)
+        return journal if journal.exists() else Path(self.status_file)
+
     def has_new_status(self):
-        if Path(self.status_file).exists():
-            status_ts = Path(self.status_file).stat().st_mtime
-            if self.status_ts < status_ts:
+        file = self.source()
+        if file.exists():
+            st = file.stat()
+            if self.status_ts < st.st_mtime or self.offset != st.st_size:
                 self.load()
                 return True
         return False
 
     def update_status(self):
         """Updates the status timestamp from the status list."""
-        if Path(self.status_file).exists():
-            self.status_ts = Path(self.status_file).stat().st_mtime
-
-    def load(self):
-        """Loads the status information from the status list."""
-        file = Path(self.status_file)
+        file = self.source()
         if file.exists():
             self.status_ts = file.stat().st_mtime
-            with open(file, "r", encoding='utf-8') as f:
-                instances = json.load(f)
-                if "activate_ts" in instances:
-                    self.activate_ts = instances["activate_ts"]
-                    self.activate_pbname = instances["activate_pbname"]
-                    for instance in instances["instances"]:
-                        status = InstanceStatus()
-                        status.name = instance
-                        status.version = instances["instances"][instance]["version"]
-                        status.multi = instances["instances"][instance]["multi"]
-                        status.enabled_on = instances["instances"][instance]["enabled_on"]
-                        status.running = instances["instances"][instance]["running"]
-                        self.add(status)
+
+    def load(self):
+        """Loads the status information from the status list, only the new records if the journal was loaded before."""
+        file = self.source()
+        if not file.exists():
+            return
+        with open(file, "rb") as f:
+            self.status_ts = os.fstat(f.fileno()).st_mtime
+            first = f.readline()
+            try:
+                header = json.loads(first)
+            except ValueError:
+                header = None
+            if not isinstance(header, dict) or header.get("journal") != self.JOURNAL_VERSION:
+                # status file of an older version, one json document
+                f.seek(0)
+                data = f.read()
+                self.reset()
+                status = json.loads(data)
+                if "activate_ts" in status:
+                    self.apply(status)
+                self.journal_id = None
+                self.offset = len(data)
+                return
+            size = os.fstat(f.fileno()).st_size
+            if header.get("id") != self.journal_id or size < self.offset:
+                # new or compacted journal
+                self.reset()
+                self.journal_id = header.get("id")
+                self.offset = len(first)
+                self.records = 0
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # incomplete record, read again with the next load
+                    break
+                self.apply(json.loads(line))
+                self.offset += len(line)
+                self.records += 1
+
+    def reset(self):
+        self.instances = []
+        self.saved = {}
+        self.saved_activate = None
+
+    def apply(self, record: dict):
+        """Applies a snapshot or a change record"""
+        if "activate_ts" in record:
+            self.activate_ts = record["activate_ts"]
+            self.activate_pbname = record["activate_pbname"]
+            self.saved_activate = (self.activate_ts, self.activate_pbname)
+        for instance, values in record.get("instances", {}).items():
+            status = InstanceStatus()
+            status.name = instance
+            status.version = values["version"]
+            status.multi = values["multi"]
+            status.enabled_on = values["enabled_on"]
+            status.running = values["running"]
+            self.add(status)
+            self.saved[instance] = values
+        for instance in record.get("del", []):
+            status = self.find_name(instance)
+            if status:
+                self.remove(status)
+            self.saved.pop(instance, None)
 
     def save(self):
-        """Saves the current status information to the status file."""
+        """Saves the changes since the last save to the status file."""
         instances = {}
         for instance in self.instances:
             instances[instance.name] = ({
@@ -147,15 +224,71 @@ class InstancesStatus():
                 "multi": instance.multi,
                 "running": instance.running
             })
+        file = Path(self.journal_file)
+        try:
+            size = file.stat().st_size
+        except FileNotFoundError:
+            size = None
+        # Compact if the file is not the journal this instance knows
+        if self.journal_id is None or size != self.offset or self.records >= self.COMPACT_RECORDS:
+            self.compact(instances)
+            self.save_legacy(instances)
+            return
+        record = {}
+        if (self.activate_ts, self.pbname) != self.saved_activate:
+            record["activate_ts"] = self.activate_ts
+            record["activate_pbname"] = self.pbname
+        changed = {name: values for name, values in instances.items() if self.saved.get(name) != values}
+        if changed:
+            record["instances"] = changed
+        removed = [name for name in self.saved if name not in instances]
+        if removed:
+            record["del"] = removed
+        if not record:
+            return
+        line = (json.dumps(record) + "\n").encode()
+        with open(file, "ab") as f:
+            f.write(line)
+        self.offset += len(line)
+        self.records += 1
+        self.saved = instances
+        self.saved_activate = (self.activate_ts, self.pbname)
+        self.save_legacy(instances)
+
+    def save_legacy(self, instances: dict):
+        """Writes the status file as one json document like older versions did"""
+        if not self.legacy:
+            return
         status = {
             "activate_ts": self.activate_ts,
             "activate_pbname": self.pbname,
             "instances": instances
         }
         file = Path(self.status_file)
-        with open(file, "w", encoding='utf-8') as f:
-            json.dump(status, f, indent=4)
+        tmp = Path(f'{file.parent}/.{file.name}.tmp')
+        with open(tmp, "w", encoding='utf-8') as f:
+            json.dump(status, f)
+        os.replace(tmp, file)
 
+    def compact(self, instances: dict):
+        """Writes a new journal with a snapshot of all instances and replaces the status file."""
+        self.journal_id = uuid.uuid4().hex
+        header = json.dumps({"journal": self.JOURNAL_VERSION, "id": self.journal_id})
+        status = json.dumps({
+            "activate_ts": self.activate_ts,
+            "activate_pbname": self.pbname,
+            "instances": instances
+        })
+        data = f'{header}\n{status}\n'.encode()
+        file = Path(self.journal_file)
+        tmp = Path(f'{file.parent}/.{file.name}.tmp')
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, file)
+        self.offset = len(data)
+        self.records = 0
+        self.saved = instances
+        self.saved_activate = (self.activate_ts, self.pbname)
 
 def main():
     print("Don't Run this Class from CLI")
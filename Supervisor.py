@@ -0,0 +1,117 @@
+"""
+Asyncio scheduler for the periodic work of PBRun.
+
+Every task has its own interval and timeout and runs its blocking function in
+a thread of the supervisor's own pool, one thread per task, so a slow or hung
+task does not delay the others. A task that runs longer than its timeout is
+reported and not started again before it finished.
+Per task the scheduling lag (how late a run started), the duration and the
+number of timeouts and errors are collected and written to a json file.
+"""
+import os
+import json
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from datetime import datetime
+
+class SupervisorTask():
+    def __init__(self, name: str, func, interval: float, timeout: float = None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout
+        self.runs = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self.lag_total = 0.0
+        self.duration_last = 0.0
+        self.duration_max = 0.0
+        self.duration_total = 0.0
+
+    def stats(self):
+        runs = max(self.runs, 1)
+        return {
+            "interval": self.interval,
+            "timeout": self.timeout,
+            "runs": self.runs,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "lag_last": round(self.lag_last, 3),
+            "lag_max": round(self.lag_max, 3),
+            "lag_mean": round(self.lag_total / runs, 3),
+            "duration_last": round(self.duration_last, 3),
+            "duration_max": round(self.duration_max, 3),
+            "duration_mean": round(self.duration_total / runs, 3),
+        }
+
+class Supervisor():
+    def __init__(self, stats_file: str = None, stats_interval: float = 60):
+        self.tasks = []
+        self.stats_file = Path(stats_file) if stats_file else None
+        self.stats_interval = stats_interval
+        self.executor = None
+
+    def add(self, name: str, func, interval: float, timeout: float = None):
+        self.tasks.append(SupervisorTask(name, func, interval, timeout))
+
+    def stats(self):
+        return {task.name: task.stats() for task in self.tasks}
+
+    def save_stats(self):
+        tmp = Path(f'{self.stats_file.parent}/.{self.stats_file.name}.tmp')
+        with open(tmp, "w", encoding='utf-8') as f:
+            json.dump({"timestamp": round(datetime.now().timestamp()), "tasks": self.stats()}, f, indent=4)
+        os.replace(tmp, self.stats_file)
+
+    async def schedule(self, task: SupervisorTask):
+        loop = asyncio.get_running_loop()
+        next_run = loop.time()
+        running = None
+        while True:
+            delay = next_run - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started = loop.time()
+            task.lag_last = started - next_run
+            task.lag_max = max(task.lag_max, task.lag_last)
+            task.lag_total += task.lag_last
+            if running is None or running.done():
+                running = loop.run_in_executor(self.executor, task.func)
+            try:
+                await asyncio.wait_for(asyncio.shield(running), task.timeout)
+            except asyncio.TimeoutError:
+                task.timeouts += 1
+                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Warning: {task.name} still running after {task.timeout}s')
+            except Exception as e:
+                task.errors += 1
+                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Error: {task.name} failed {e}')
+                traceback.print_exc()
+            task.runs += 1
+            task.duration_last = loop.time() - started
+            task.duration_max = max(task.duration_max, task.duration_last)
+            task.duration_total += task.duration_last
+            # Missed runs are skipped, they would only add load
+            next_run = max(next_run + task.interval, loop.time())
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            try:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.save_stats)
+            except OSError as e:
+                print(f'{datetime.now().isoformat(sep=" ", timespec="seconds")} Error: Can not write {self.stats_file} {e}')
+
+    async def main(self):
+        # Every task holds at most one thread, even after a timeout, plus one for the stats
+        self.executor = ThreadPoolExecutor(max_workers=len(self.tasks) + 2, thread_name_prefix="Supervisor")
+        jobs = [self.schedule(task) for task in self.tasks]
+        if self.stats_file:
+            jobs.append(self.report())
+        await asyncio.gather(*jobs)
+
+    def run(self):
+        asyncio.run(self.main())
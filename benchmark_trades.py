@@ -0,0 +1,124 @@
+"""
+Benchmark of the trade fetching of Exchange.fetch_trades and Instance.fetch_trades.
+
+A synthetic exchange serves n trades in pages of 1000 like binance
+fetch_my_trades. Compared are the old accumulation (all_trades = all_trades +
+page) with the page iterator, and the old substring dedup and full rewrite of
+trades.json with the id set and the chunked append of Instance.write_trades.
+The time of every step is printed, with --memory also its peak python
+memory, the tracing of tracemalloc makes every step a few times slower.
+    python benchmark_trades.py [trades] [stored] [--memory]
+"""
+import io
+import sys
+import json
+import tempfile
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+from contextlib import redirect_stdout
+from Exchange import Exchange
+from Instance import Instance
+
+START = 1600000000000
+PAGE = 1000
+MEMORY = "--memory" in sys.argv
+
+class SyntheticExchange():
+    """One trade per second since START, fetch_my_trades returns at most PAGE trades"""
+    has = {'fetchMyTrades': True, 'fetchTrades': True}
+
+    def __init__(self, count: int):
+        self.count = count
+        self.calls = 0
+
+    def milliseconds(self):
+        return START + self.count * 1000
+
+    def iso8601(self, timestamp):
+        return str(timestamp)
+
+    def trade(self, index: int):
+        return {"id": str(index), "order": str(index // 3), "timestamp": START + index * 1000, "symbol": "BTC/USDT:USDT", "side": "buy", "price": 50000.0, "amount": 0.001, "cost": 50.0, "fee": {"cost": 0.02, "currency": "USDT"}}
+
+    def fetch_my_trades(self, symbol, since, limit, params):
+        self.calls += 1
+        first = max(0, -(-(since - START) // 1000))
+        last = min(self.count, first + PAGE, -(-(params['endTime'] - START) // 1000))
+        return [self.trade(index) for index in range(first, last)]
+
+class BenchmarkUser():
+    name = "benchmark"
+    key = "benchmark"
+
+def measure(name: str, func):
+    if MEMORY:
+        tracemalloc.start()
+    start = perf_counter()
+    with redirect_stdout(io.StringIO()):
+        result = func()
+    elapsed = perf_counter() - start
+    if MEMORY:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f'{name:<44} {elapsed:8.2f}s {peak / 1048576:8.1f} MiB')
+    else:
+        print(f'{name:<44} {elapsed:8.2f}s')
+    return result
+
+def exchange(count: int):
+    result = Exchange("binance", BenchmarkUser())
+    result.instance = SyntheticExchange(count)
+    return result
+
+def concat_pages(count: int):
+    """fetch_trades before the page iterator"""
+    all_trades = []
+    for trades in exchange(count).iter_trades("BTC/USDT:USDT", "futures", START):
+        all_trades = all_trades + trades
+    return sorted(all_trades, key=lambda d: d['timestamp'])
+
+def substring_dedup(trades: list, new_trades: list):
+    """Instance.fetch_trades before the id set"""
+    for trade in new_trades:
+        if not any(trade["id"] in sub["id"] for sub in trades):
+            trades.append(trade)
+    return trades
+
+def id_dedup(trades: list, new_trades: list):
+    ids = {trade["id"] for trade in trades}
+    return [trade for trade in new_trades if trade["id"] not in ids]
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg != "--memory"]
+    count = int(args[0]) if len(args) > 0 else 500000
+    stored = int(args[1]) if len(args) > 1 else count * 4 // 5
+    print(f'{count} trades, {stored} already in trades.json, pages of {PAGE}')
+    old = measure("fetch_trades, concatenated pages", lambda: concat_pages(count))
+    new = measure("fetch_trades, page iterator", lambda: exchange(count).fetch_trades("BTC/USDT:USDT", "futures", START))
+    assert old == new
+    del old
+    trades = new[:stored]
+    # A fetch resumes at the last stored trade, the page overlaps the stored trades
+    fetched = new[max(stored - PAGE, 0):]
+    sample = fetched[:200]
+    # Grows with fetched * stored, only a sample is measured
+    measure(f'substring dedup of {len(sample)} fetched trades', lambda: substring_dedup(list(trades), sample))
+    unique = measure(f'id dedup of {len(fetched)} fetched trades', lambda: id_dedup(trades, fetched))
+    with tempfile.TemporaryDirectory() as tmp:
+        file = Path(tmp, "trades.json")
+        with open(file, "w", encoding='utf-8') as f:
+            json.dump(trades, f, indent=4)
+        def rewrite():
+            with open(file, "w", encoding='utf-8') as f:
+                json.dump(trades + unique, f, indent=4)
+        measure(f'json.dump of all {len(trades) + len(unique)} trades', rewrite)
+        expected = file.read_bytes()
+        with open(file, "w", encoding='utf-8') as f:
+            json.dump(trades, f, indent=4)
+        measure(f'write_trades append of {len(unique)} trades', lambda: Instance.write_trades(file, trades, unique))
+        assert file.read_bytes() == expected
+    print('results equal')
+
+if __name__ == '__main__':
+    main()
@@ -11,10 +11,7 @@ import json
 from dataclasses import dataclass, field, asdict
 from typing import List
 from GridVisualizerV7 import (
-    calc_entries_long,
-    calc_closes_long,
-    calc_entries_short,
-    calc_closes_short,
+    ladder_cache,
     ExchangeParams,
     StateParams,
     BotParams,
@@ -25,7 +22,10 @@ from GridVisualizerV7 import (
     Order,
     OrderType,
     Side,
-    GridTrailingMode
+    GridTrailingMode,
+    SWEEP_FIELDS,
+    SWEEP_METRICS,
+    grid_sweep,
 )
 
 from dataclasses import dataclass, asdict
@@ -813,31 +813,24 @@ def show_visualizer():
             st.rerun()
 
     
-    # NORMAL LONG ENTRIES
-    normal_entries_long = calc_entries_long(data.exchange_params, data.state_params, data.normal_bot_params_long, data.position_long_enty, data.trailing_price_bundle)
-    data.normal_entries_long = adjust_order_quantities(normal_entries_long) 
-    # GRIDONLY LONG ENTRIES
-    gridonly_entries_long = calc_entries_long(data.exchange_params, data.state_params, data.gridonly_bot_params_long, data.position_long_enty, data.trailing_price_bundle)
-    data.gridonly_entries_long = adjust_order_quantities(gridonly_entries_long) 
+    # NORMAL and GRIDONLY ladders come from the shared ladder cache, the first list is normal, the second gridonly
+    # LONG ENTRIES
+    (normal_entries_long, gridonly_entries_long) = ladder_cache.get("entries_long", data.exchange_params, data.state_params, [data.normal_bot_params_long, data.gridonly_bot_params_long], data.position_long_enty, data.trailing_price_bundle)
+    data.normal_entries_long = adjust_order_quantities(normal_entries_long)
+    data.gridonly_entries_long = adjust_order_quantities(gridonly_entries_long)
     
-    # NORMAL LONG CLOSES
-    normal_closes_long = calc_closes_long(data.exchange_params, data.state_params, data.normal_bot_params_long, data.position_long_close, data.trailing_price_bundle)
-    data.normal_closes_long = adjust_order_quantities(normal_closes_long) 
-    # GRIDONLY LONG CLOSES
-    gridonly_closes_long = calc_closes_long(data.exchange_params, data.state_params, data.gridonly_bot_params_long, data.position_long_close, data.trailing_price_bundle)
-    data.gridonly_closes_long = adjust_order_quantities(gridonly_closes_long) 
+    # LONG CLOSES
+    (normal_closes_long, gridonly_closes_long) = ladder_cache.get("closes_long", data.exchange_params, data.state_params, [data.normal_bot_params_long, data.gridonly_bot_params_long], data.position_long_close, data.trailing_price_bundle)
+    data.normal_closes_long = adjust_order_quantities(normal_closes_long)
+    data.gridonly_closes_long = adjust_order_quantities(gridonly_closes_long)
     
-    # NORMAL SHORT ENTRIES
-    normal_entries_short = calc_entries_short(data.exchange_params, data.state_params, data.normal_bot_params_short, data.position_short_entry, data.trailing_price_bundle)
+    # SHORT ENTRIES
+    (normal_entries_short, gridonly_entries_short) = ladder_cache.get("entries_short", data.exchange_params, data.state_params, [data.normal_bot_params_short, data.gridonly_bot_params_short], data.position_short_entry, data.trailing_price_bundle)
     data.normal_entries_short = adjust_order_quantities(normal_entries_short)
-    # GRIDONLY SHORT ENTRIES
-    gridonly_entries_short = calc_entries_short(data.exchange_params, data.state_params, data.gridonly_bot_params_short, data.position_short_entry, data.trailing_price_bundle)
     data.gridonly_entries_short = adjust_order_quantities(gridonly_entries_short)
-    # NORMAL SHORT CLOSES
-    normal_closes_short = calc_closes_short(data.exchange_params, data.state_params, data.normal_bot_params_short, data.position_short_close, data.trailing_price_bundle)
+    # SHORT CLOSES
+    (normal_closes_short, gridonly_closes_short) = ladder_cache.get("closes_short", data.exchange_params, data.state_params, [data.normal_bot_params_short, data.gridonly_bot_params_short], data.position_short_close, data.trailing_price_bundle)
     data.normal_closes_short = adjust_order_quantities(normal_closes_short)
-    # GRIDONLY SHORT CLOSES
-    gridonly_closes_short = calc_closes_short(data.exchange_params, data.state_params, data.gridonly_bot_params_short, data.position_short_close, data.trailing_price_bundle)
     data.gridonly_closes_short = adjust_order_quantities(gridonly_closes_short)
 
     st.session_state.v7_grid_visualizer_data = data
@@ -857,6 +850,63 @@ def show_visualizer():
             st.write("SHORT is inactive")
 
 
+def show_sweep(data: GVData):
+    # Sweep two BotParams fields of the entry grid and show heatmaps of the resulting ladders
+    with st.expander("Parameter Sweep", expanded="v7_grid_visualizer_sweep_job" in st.session_state):
+        sides = [side for side in (Side.Long, Side.Short) if data.isActive(side)]
+        if not sides:
+            st.write("LONG and SHORT are inactive")
+            return
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            side = st.radio("Side", sides, format_func=lambda side: side.name, horizontal=True, key="v7_grid_visualizer_sweep_side")
+        bot_params = data.normal_bot_params_long if side == Side.Long else data.normal_bot_params_short
+        axes = []
+        for col, axis, default in ((col2, "x", "entry_grid_spacing_pct"), (col3, "y", "entry_grid_double_down_factor")):
+            with col:
+                field_name = st.selectbox(f"{axis} parameter", SWEEP_FIELDS, index=SWEEP_FIELDS.index(default), key=f"v7_grid_visualizer_sweep_{axis}")
+                value = getattr(bot_params, field_name)
+                col_min, col_max, col_steps = st.columns(3)
+                with col_min:
+                    start = st.number_input("from", value=float(value) * 0.5, format="%.4f", key=f"v7_grid_visualizer_sweep_{axis}_{field_name}_from")
+                with col_max:
+                    end = st.number_input("to", value=float(value) * 1.5, format="%.4f", key=f"v7_grid_visualizer_sweep_{axis}_{field_name}_to")
+                with col_steps:
+                    steps = st.number_input("steps", min_value=2, max_value=100, value=30, key=f"v7_grid_visualizer_sweep_{axis}_steps")
+                axes.append((field_name, [float(v) for v in np.linspace(start, end, steps)]))
+        ((x_field, x_values), (y_field, y_values)) = axes
+        if st.button("Run Sweep"):
+            if x_field == y_field:
+                error_popup("Select two different parameters")
+            else:
+                position = data.position_long_enty if side == Side.Long else data.position_short_entry
+                st.session_state.v7_grid_visualizer_sweep_job = grid_sweep.submit(
+                    data.exchange_params, data.state_params, bot_params, position, data.trailing_price_bundle, side,
+                    x_field, x_values, y_field, y_values)
+        if "v7_grid_visualizer_sweep_job" not in st.session_state:
+            return
+        job = st.session_state.v7_grid_visualizer_sweep_job
+        try:
+            with st.spinner(f"Calculating {len(job.missing)} of {len(job.keys)} ladders..."):
+                metrics = grid_sweep.result(job)
+        except Exception as e:
+            del st.session_state.v7_grid_visualizer_sweep_job
+            st.error(f"Sweep failed: {e}")
+            return
+        cols = st.columns(len(SWEEP_METRICS))
+        for index, (col, title) in enumerate(zip(cols, SWEEP_METRICS)):
+            with col:
+                fig = go.Figure(go.Heatmap(z=metrics[:, :, index], x=job.x_values, y=job.y_values, colorscale="Viridis"))
+                fig.update_layout(
+                    template='plotly_dark',
+                    title=title,
+                    xaxis=dict(title=job.x_field),
+                    yaxis=dict(title=job.y_field),
+                    margin=dict(l=40, r=40, t=40, b=40),
+                    height=450,
+                )
+                st.plotly_chart(fig, use_container_width=True)
+
 def build_sidebar():
     # Navigation
     with st.sidebar:
@@ -866,6 +916,7 @@ def build_sidebar():
             if "v7_grid_visualizer_config" in st.session_state:
                 del st.session_state.v7_grid_visualizer_config
             st.rerun()
+        st.caption(f'Ladder cache: {ladder_cache.hits} hits, {ladder_cache.misses} misses, {len(ladder_cache.ladders)} ladders')
 
 # Redirect to Login if not authenticated or session state not initialized
 if not is_authenticted() or is_session_state_not_initialized():
@@ -879,3 +930,4 @@ st.info("Visualization of trailing parameters is currently very limited. Range o
 
 build_sidebar()
 show_visualizer()
+show_sweep(st.session_state.v7_grid_visualizer_data)
@@ -0,0 +1,12 @@
+import sys
+import types
+from pathlib import Path
+
+# The modules of pbgui are top level modules in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# GridVisualizerV7 imports streamlit at top level, the calculations do not use it
+try:
+    import streamlit
+except ImportError:
+    sys.modules["streamlit"] = types.ModuleType("streamlit")
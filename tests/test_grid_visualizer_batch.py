@@ -0,0 +1,71 @@
+"""
+The NumPy batch ladders of GridVisualizerV7 against the scalar calc_entries_*
+and calc_closes_* functions, for random BotParams in every grid/trailing mode.
+"""
+import random
+
+import pytest
+
+from GridVisualizerV7 import (
+    BotParams, ExchangeParams, StateParams, OrderBook, EmaBands, Position, TrailingPriceBundle,
+    calc_entries_long, calc_entries_short, calc_closes_long, calc_closes_short,
+    calc_entries_long_batch, calc_entries_short_batch, calc_closes_long_batch, calc_closes_short_batch,
+)
+
+EXCHANGE = ExchangeParams(min_qty=0.001, min_cost=1.0, qty_step=0.001, price_step=0.01, c_mult=1.0)
+STATE = StateParams(balance=1000.0, order_book=OrderBook(bid=100.0, ask=100.0), ema_bands=EmaBands(lower=100.0, upper=100.0))
+TRAILING = TrailingPriceBundle(max_since_open=105.0, min_since_open=95.0, max_since_min=97.0, min_since_max=103.0)
+
+# trailing_grid_ratio of the modes, 0 grid only, +-1 trailing only, > 0 trailing first, < 0 grid first
+MODES = {
+    "grid_only": lambda rng: 0.0,
+    "trailing_only": lambda rng: rng.choice([1.0, -1.0]),
+    "trailing_first": lambda rng: rng.uniform(0.01, 0.99),
+    "grid_first": lambda rng: rng.uniform(-0.99, -0.01),
+}
+
+CASES = {
+    "entries_long": (calc_entries_long, calc_entries_long_batch, [Position(0.0, 0.0), Position(1.0, 102.0)]),
+    "entries_short": (calc_entries_short, calc_entries_short_batch, [Position(0.0, 0.0), Position(-1.0, 98.0)]),
+    "closes_long": (calc_closes_long, calc_closes_long_batch, [Position(10.0, 99.0), Position(3.0, 101.0)]),
+    "closes_short": (calc_closes_short, calc_closes_short_batch, [Position(-10.0, 101.0), Position(-3.0, 99.0)]),
+}
+
+def random_bot_params(rng: random.Random, ratio: float) -> BotParams:
+    return BotParams(
+        wallet_exposure_limit=rng.choice([0.5, 1.0, 1.5, 3.0]),
+        n_positions=1,
+        entry_initial_qty_pct=rng.uniform(0.005, 0.1),
+        entry_initial_ema_dist=rng.uniform(-0.02, 0.05),
+        entry_grid_spacing_pct=rng.uniform(0.005, 0.08),
+        entry_grid_spacing_weight=rng.uniform(0.0, 3.0),
+        entry_grid_double_down_factor=rng.uniform(0.3, 2.5),
+        entry_trailing_threshold_pct=rng.choice([0.0, -0.01, rng.uniform(0.0, 0.1)]),
+        entry_trailing_retracement_pct=rng.choice([0.0, rng.uniform(0.0, 0.05)]),
+        entry_trailing_grid_ratio=ratio,
+        close_grid_min_markup=rng.uniform(0.001, 0.03),
+        close_grid_markup_range=rng.choice([0.0, rng.uniform(0.0, 0.05)]),
+        close_grid_qty_pct=rng.choice([0.1, rng.uniform(0.0, 1.0), 1.0]),
+        close_trailing_threshold_pct=rng.choice([0.0, rng.uniform(0.0, 0.05)]),
+        close_trailing_retracement_pct=rng.choice([0.0, rng.uniform(0.0, 0.03)]),
+        close_trailing_qty_pct=rng.uniform(0.05, 1.0),
+        close_trailing_grid_ratio=ratio,
+    )
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("case", CASES)
+def test_batch_matches_scalar(case, mode):
+    scalar, batch, positions = CASES[case]
+    rng = random.Random(f'{case}-{mode}')
+    bot_params_list = [random_bot_params(rng, MODES[mode](rng)) for _ in range(60)]
+    for position in positions:
+        ladder = batch(EXCHANGE, STATE, bot_params_list, position, TRAILING)
+        compared = 0
+        for index, bot_params in enumerate(bot_params_list):
+            try:
+                expected = scalar(EXCHANGE, STATE, bot_params, position, TRAILING)
+            except (ZeroDivisionError, ValueError):
+                continue
+            assert ladder.orders(index) == expected, f'{case} {mode} {position} {bot_params}'
+            compared += 1
+        assert compared > len(bot_params_list) // 2
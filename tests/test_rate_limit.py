@@ -0,0 +1,122 @@
+"""
+RateLimit and the paging of Exchange against a fake ccxt exchange that counts its calls.
+"""
+import time
+
+import pytest
+
+ccxt = pytest.importorskip("ccxt")
+
+import RateLimit
+from RateLimit import RequestLimiter, TokenBucket, limiter
+from Exchange import Exchange
+
+class FakeBybit():
+    """Transaction log of pages pages, calls listed in fail raise their error"""
+    rateLimit = 20
+
+    def __init__(self, pages: int = 3, fail: dict = None):
+        self.pages = pages
+        self.fail = fail or {}
+        self.calls = 0
+
+    def iso8601(self, timestamp):
+        return str(timestamp)
+
+    def privateGetV5AccountTransactionLog(self, params):
+        self.calls += 1
+        error = self.fail.get(self.calls)
+        if error:
+            raise error("fake error")
+        page = params["cursor"] or 0
+        return {"result": {
+            "nextPageCursor": page + 1 if page + 1 < self.pages else None,
+            "list": [{"type": "TRADE", "symbol": "BTCUSDT", "transactionTime": "1700000000000", "change": "1.0", "tradeId": str(page)}]}}
+
+class User():
+    name = "test"
+    key = "key_test"
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    """Fresh limiters without pacing, backoff delays are recorded instead of slept"""
+    delays = []
+    monkeypatch.setattr(RateLimit, "limiters", {})
+    monkeypatch.setattr(RateLimit, "sleep", delays.append)
+    monkeypatch.setattr(TokenBucket, "acquire", lambda self: 0.0)
+    return delays
+
+def bybit(fake: FakeBybit):
+    exchange = Exchange("bybit", User())
+    exchange.instance = fake
+    exchange._uta = True
+    return exchange
+
+def test_one_call_per_page():
+    exchange = bybit(FakeBybit(pages=3))
+    pages = list(exchange._fetch_history_bybit(0, 10))
+    assert [page[0]["uniqueid"] for page in pages] == ["0", "1", "2"]
+    assert exchange.instance.calls == 3
+    assert exchange._limiter.stats()["requests"] == 3
+    assert exchange._limiter.stats()["retries"] == 0
+
+@pytest.mark.parametrize("error", [ccxt.DDoSProtection, ccxt.RateLimitExceeded, ccxt.ExchangeNotAvailable, ccxt.OnMaintenance])
+def test_retry_rate_limit_and_unavailable(error, no_backoff):
+    exchange = bybit(FakeBybit(pages=2, fail={1: error, 2: error}))
+    pages = list(exchange._fetch_history_bybit(0, 10))
+    assert len(pages) == 2
+    assert exchange.instance.calls == 4
+    assert exchange._limiter.stats()["retries"] == 2
+    # Exponential backoff with up to 25% jitter
+    assert len(no_backoff) == 2
+    assert 1.0 <= no_backoff[0] <= 1.25
+    assert 2.0 <= no_backoff[1] <= 2.5
+
+@pytest.mark.parametrize("error", [ccxt.AuthenticationError, ccxt.BadRequest, ccxt.InsufficientFunds, ccxt.RequestTimeout, ValueError])
+def test_no_retry_of_other_errors(error, no_backoff):
+    exchange = bybit(FakeBybit(fail={1: error}))
+    with pytest.raises(error):
+        list(exchange._fetch_history_bybit(0, 10))
+    assert exchange.instance.calls == 1
+    assert exchange._limiter.stats() == {"requests": 1, "retries": 0, "failures": 0, "waited": 0.0}
+    assert no_backoff == []
+
+def test_give_up_after_retries(no_backoff):
+    fake = FakeBybit(fail={call: ccxt.DDoSProtection for call in range(1, 20)})
+    exchange = bybit(fake)
+    with pytest.raises(ccxt.DDoSProtection):
+        list(exchange._fetch_history_bybit(0, 10))
+    assert fake.calls == 6
+    assert exchange._limiter.stats()["retries"] == 5
+    assert exchange._limiter.stats()["failures"] == 1
+    assert max(no_backoff) <= 60.0 * 1.25
+
+def test_max_backoff(no_backoff):
+    calls = []
+    def fail():
+        calls.append(1)
+        raise ccxt.ExchangeNotAvailable("down")
+    with pytest.raises(ccxt.ExchangeNotAvailable):
+        RequestLimiter("fake", 1000, retries=8, backoff=1.0, max_backoff=10.0).call(fail)
+    assert len(calls) == 9
+    assert all(delay <= 12.5 for delay in no_backoff)
+
+def test_limiter_shared_per_exchange():
+    assert limiter("bybit", 50) is limiter("bybit", 1)
+    assert limiter("bybit", 50) is not limiter("okx", 50)
+    first = bybit(FakeBybit())
+    second = bybit(FakeBybit())
+    list(first._fetch_history_bybit(0, 10))
+    list(second._fetch_history_bybit(0, 10))
+    assert first._limiter is second._limiter
+    assert first._limiter.stats()["requests"] == 6
+
+def test_token_bucket_pacing(monkeypatch):
+    monkeypatch.undo()
+    bucket = TokenBucket(50)
+    start = time.monotonic()
+    waited = sum(bucket.acquire() for _ in range(26))
+    elapsed = time.monotonic() - start
+    # The first token is available at once, the other 25 come at 50/s
+    assert 0.45 <= elapsed < 1.0
+    assert waited == pytest.approx(elapsed, abs=0.1)
@@ -0,0 +1,105 @@
+"""
+RemoteSync against a local filesystem remote as the bucket.
+
+Needs the rclone binary, the remote is configured through the environment,
+so no rclone.conf is touched. Every test runs with and without rclone rcd.
+"""
+import os
+import json
+import shutil
+from pathlib import Path, PurePath
+
+import pytest
+
+from RemoteSync import Manifest, rclone, push, pull
+
+pytestmark = pytest.mark.skipif(shutil.which("rclone") is None, reason="rclone not installed")
+
+INCLUDE = ['alive_*.cmd*', 'alive*.hb', 'status*.json']
+
+@pytest.fixture(params=["rcd", "commands"])
+def bucket(request, tmp_path, monkeypatch):
+    monkeypatch.setenv("RCLONE_CONFIG_PBTEST_TYPE", "local")
+    monkeypatch.chdir(tmp_path)
+    Path(tmp_path, "data/logs").mkdir(parents=True)
+    Path(tmp_path, "bucket").mkdir()
+    if request.param == "rcd":
+        assert rclone.start()
+        assert rclone.running()
+    yield f'pbtest:{tmp_path}/bucket'
+    rclone.stop()
+
+def write(file: Path, text: str):
+    file.parent.mkdir(parents=True, exist_ok=True)
+    file.write_text(text)
+
+def upload(manifest: Manifest, bucket: str, local_dir: Path, prefix: str):
+    """sync_up of PBRemote: push the changes, then publish the manifest"""
+    assert push(manifest, bucket, prefix, local_dir, INCLUDE)
+    manifest.name = "A"
+    manifest.save()
+    assert rclone.copyto(manifest.file, f'{bucket}/{manifest.file.name}')
+
+def test_upload_and_pull(bucket, tmp_path):
+    src = Path(tmp_path, "A/data/cmd")
+    dst = Path(tmp_path, "B/data/remote/cmd_A")
+    remote = Path(tmp_path, "bucket/cmd_A")
+    write(Path(src, "alive_1.cmd.gz"), "1")
+    write(Path(src, "status_v7.json"), '{"a": 1}')
+    write(Path(src, "other.txt"), "not synced")
+    Path(remote).mkdir()
+    write(Path(remote, "alive_9.cmd.gz"), "left by an older version")
+    manifest = Manifest(Path(tmp_path, "A/manifest_A.json"))
+    upload(manifest, bucket, src, "cmd_A")
+    assert sorted(os.listdir(remote)) == ["alive_1.cmd.gz", "status_v7.json"]
+
+    write(Path(src, "alive_2.cmd.gz"), "2")
+    write(Path(src, "status_v7.json"), '{"a": 2}')
+    Path(src, "alive_1.cmd.gz").unlink()
+    upload(manifest, bucket, src, "cmd_A")
+    assert sorted(os.listdir(remote)) == ["alive_2.cmd.gz", "status_v7.json"]
+    assert Path(remote, "status_v7.json").read_text() == '{"a": 2}'
+    assert not push(manifest, bucket, "cmd_A", src, INCLUDE)
+
+    listing = rclone.lsjson(bucket)
+    assert {item["Name"] for item in listing} == {"cmd_A", "manifest_A.json"}
+    peer = Path(tmp_path, "B/manifest_A.json")
+    assert rclone.copyto(f'{bucket}/manifest_A.json', peer)
+    write(Path(dst, "alive_1.cmd.gz"), "removed by A")
+    assert pull(Manifest(peer), bucket, "cmd_A", PurePath(dst), ['*'])
+    assert sorted(os.listdir(dst)) == ["alive_2.cmd.gz", "status_v7.json"]
+    assert json.loads(Path(dst, "status_v7.json").read_text()) == {"a": 2}
+
+    # A file of the manifest that is missing in the bucket fails the pull
+    Path(remote, "status_v7.json").unlink()
+    Path(dst, "status_v7.json").unlink()
+    assert not pull(Manifest(peer), bucket, "cmd_A", PurePath(dst), ['*'])
+    assert sorted(os.listdir(dst)) == ["alive_2.cmd.gz"]
+
+def test_delete_with_filter(bucket, tmp_path):
+    for name in ["A_1/x.json", "A_1/sub/y.json", "B_1/z.json"]:
+        write(Path(tmp_path, "bucket", name), name)
+    assert rclone.delete(bucket, include=['*A_1*/**'])
+    assert not list(Path(tmp_path, "bucket/A_1").rglob("*.json"))
+    assert Path(tmp_path, "bucket/B_1/z.json").exists()
+    assert rclone.deletefile(f'{bucket}/B_1/z.json')
+    assert not Path(tmp_path, "bucket/B_1/z.json").exists()
+
+def test_rcd_restart(tmp_path, monkeypatch):
+    monkeypatch.setenv("RCLONE_CONFIG_PBTEST_TYPE", "local")
+    monkeypatch.chdir(tmp_path)
+    Path(tmp_path, "data/logs").mkdir(parents=True)
+    write(Path(tmp_path, "bucket/a.json"), "a")
+    bucket = f'pbtest:{tmp_path}/bucket'
+    try:
+        assert rclone.start()
+        rclone.rcd.kill()
+        rclone.rcd.wait()
+        # Operations fall back to rclone commands until the main thread restarts rcd
+        assert not rclone.running()
+        assert [item["Name"] for item in rclone.lsjson(bucket)] == ["a.json"]
+        rclone.check()
+        assert rclone.running()
+        assert [item["Name"] for item in rclone.lsjson(bucket)] == ["a.json"]
+    finally:
+        rclone.stop()